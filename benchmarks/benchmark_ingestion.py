@@ -0,0 +1,109 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+from firstserve.firstserve import PlayersDB
+from firstserve.synthetic import write_synthetic_csv
+from firstserve.utils_extract_data import import_csv, parse_scoreline, parse_scorelines
+
+"""
+Benchmark of the ingestion hot path on synthetic data in the format of atp.csv (see firstserve.synthetic).
+For every size a csv is generated with a fixed seed, then every stage is timed on its own:
+import_csv, the scoreline helpers, add_stats_from_rel_outcomes and the chunked add_stats_from_csv.
+Reported per stage: wall time, rows/sec and the peak memory allocated by python during the stage (tracemalloc,
+measured in a second run so the timings are not slowed down).
+
+Run from the repository root:
+    $ python -m benchmarks.benchmark_ingestion --sizes 10000 100000 1000000 --json results.json
+"""
+
+cfg_path = os.path.join(os.path.dirname(__file__), '..', 'configs', 'config_simpledb.yml')
+
+
+def run_stage(function, trace_memory):
+    """
+    :return: wall time in seconds, peak traced memory in MB (None without trace_memory) and the result of function
+    """
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = function()
+    elapsed = time.perf_counter() - start
+    peak = None
+    if trace_memory:
+        peak = tracemalloc.get_traced_memory()[1] / 1e6
+        tracemalloc.stop()
+    return elapsed, peak, result
+
+
+def benchmark_size(n_rows, seed, workdir, chunksize, trace_memory):
+    """
+    :return: list of {'rows', 'stage', 'seconds', 'rows_per_sec', 'peak_mb'} for one size
+    """
+    csv_path = os.path.join(workdir, f'synthetic_{n_rows}.csv')
+    write_synthetic_csv(csv_path, n_rows, seed=seed)
+
+    db = PlayersDB(cfg_path)
+    db.import_years = None  # the synthetic dates run past the 'Years' of the config
+    matches_dict = import_csv(csv_path, **db.csv_options())
+    results_1 = [matches_dict['Result_CUR_1'][rowidx] for rowidx in matches_dict['ID']]
+    results_2 = [matches_dict['Result_CUR_2'][rowidx] for rowidx in matches_dict['ID']]
+
+    def parse_rows():
+        parse_scoreline.cache_clear()
+        return [parse_scoreline(result_1, result_2) for result_1, result_2 in zip(results_1, results_2)]
+
+    def parse_batch():
+        parse_scoreline.cache_clear()
+        return parse_scorelines(results_1, results_2, db.match_formats, db.match_outcomes)
+
+    stages = {
+        'import_csv': lambda: import_csv(csv_path, **db.csv_options()),
+        'parse_scoreline (per row, cold cache)': parse_rows,
+        'parse_scorelines (batch, cold cache)': parse_batch,
+        'parse_scorelines (batch, warm cache)': lambda: parse_scorelines(results_1, results_2, db.match_formats,
+                                                                         db.match_outcomes),
+        'add_stats_from_rel_outcomes': lambda: db.add_stats_from_rel_outcomes(db.generate_players_template(), matches_dict),
+        'add_stats_from_csv (chunked)': lambda: db.add_stats_from_csv(db.generate_players_template(), csv_path,
+                                                                      chunksize=chunksize),
+    }
+
+    report = []
+    for stage, function in stages.items():
+        seconds, _, _ = run_stage(function, trace_memory=False)
+        peak_mb = run_stage(function, trace_memory=True)[1] if trace_memory else None
+        report.append({'rows': n_rows, 'stage': stage, 'seconds': seconds, 'rows_per_sec': n_rows / seconds,
+                       'peak_mb': peak_mb})
+        print(f"{n_rows:>9} | {stage:<40} | {seconds:9.3f} s | {n_rows / seconds:>12,.0f} rows/s | "
+              + (f"{peak_mb:9.1f} MB" if peak_mb is not None else '        - MB'), flush=True)
+
+    os.remove(csv_path)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark of the firstserve ingestion on synthetic data')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000], help='numbers of rows')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the synthetic data')
+    parser.add_argument('--chunksize', type=int, default=50000, help='chunksize of add_stats_from_csv')
+    parser.add_argument('--no-memory', action='store_true', help='skip the tracemalloc runs')
+    parser.add_argument('--json', help='write the results to this json file')
+    args = parser.parse_args()
+
+    report = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for n_rows in args.sizes:
+            report.extend(benchmark_size(n_rows, args.seed, workdir, args.chunksize, not args.no_memory))
+
+    if args.json:
+        with open(args.json, 'w') as json_file:
+            json.dump(report, json_file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,9 @@
 from firstserve.firstserve import PlayersDB
-from firstserve.utils_extract_data import import_csv, open_cfg_asdict
+from firstserve.instrumentation import print_progress
+from firstserve.utils_extract_data import open_cfg_asdict
 import matplotlib.pyplot as plt
 
 file_location = f'./tennisdata/wta.csv'  # you can also use wta.csv, both taken from https://www.kaggle.com/datasets/hwaitt/tennis-20112019
-tennisdata = import_csv(file_location)
 
 """
 read/open config file where we find information on how to initialize 'Players'
@@ -12,14 +12,23 @@ read/open config file where we find information on how to initialize 'Players'
 cfg_path = f"./configs/config_simpledb.yml"
 config_test = open_cfg_asdict(cfg_path)
 
-print('### Finished loading data set ###')
-
 NewPlayersClass = PlayersDB(cfg_path)
+NewPlayersClass.instrument(progress=print_progress)
 players_new_dict = NewPlayersClass.generate_players_template()
 
-print('### Starting to extract player / match statistics from loaded data set ###')
+print('### Starting to extract player / match statistics from the data set ###')
+
+"""
+The csv is read in chunks, so only a part of the data set is held in memory at once.
+With use_cache=True the database is stored in the 'save' directory of the config and loaded from there on the next run.
+"""
+players_dict, matches_dict = NewPlayersClass.add_stats_from_csv(players_new_dict, file_location, chunksize=50000,
+                                                                   use_cache=True)
 
-players_dict, matches_dict = NewPlayersClass.add_stats_from_rel_outcomes(players_new_dict, tennisdata)
+report = NewPlayersClass.build_report()
+print(f"Built in {report['seconds']:.1f} s: {report['counters']}")
+for stage, stage_report in report['stages'].items():
+    print(f"  {stage}: {stage_report['seconds']:.2f} s ({stage_report['calls']} calls)")
 
 print('### Demonstrating extracted data: ###')
 
@@ -30,27 +39,14 @@ Only consider data which is made up from more than match_number_filter matches
 
 match_number_filter = 500
 perf_metric = 'WinrateTotal'
-players_performance = []
-players_names = []
-xr = []
 
-for key in players_dict['Players'].keys():
-    # perf, perf_metric_matches = players_dict['Players'][key][perf_metric]
-    perf, perf_metric_matches = players_dict['Players'][key][perf_metric], players_dict['Players'][key]['Number of Matches']
-
-    if perf == 0.:
-        """
-        No data available
-        """
-        continue
-    elif perf_metric_matches < match_number_filter:
-        """
-        Too few matches played to trust performance metric
-        """
-        continue
-
-    players_performance.append(perf)
-    players_names.append(key)
+"""
+The 100 best players by perf_metric are read from the leaderboard index ('leaderboards' in the config),
+instead of scanning all players
+"""
+leaders = NewPlayersClass.leaderboard(perf_metric, k=100, min_matches=match_number_filter)
+players_names = [player for player, _ in leaders]
+players_performance = [perf for _, perf in leaders]
 
 xr = range(len(players_performance))
 """
@@ -0,0 +1,133 @@
+from .utils_extract_data import NO_DATE
+
+
+"""
+Player stat aggregators besides the all-time [mean, count] of calc_stat_update, declared in players_settings:
+
+'aggregators': {'FirstServePCT_Last10': {'type': 'window', 'stat': 'FirstServePCT', 'window': 10},
+                'FirstServePCT_EWMA': {'type': 'ewma', 'stat': 'FirstServePCT', 'halflife_days': 365},
+                'FirstServePCT_Var': {'type': 'variance', 'stat': 'FirstServePCT'}}
+
+'stat' is a stat of stats_dict. Every aggregator is stored as a stat of the players template (its visible values)
+and is updated in O(1) for every match value of its stat, so it is part of the player stats and the prematch snapshots.
+State that is not part of the stats (the values of a window, the day of the last EWMA update) is kept in hidden
+columns of the PlayerTable. Match values missing in the dataset (NaN) are skipped, as for the all-time mean.
+"""
+
+
+class WindowMean:
+    def __init__(self, window):
+        """
+        Mean of the last window values of a stat: [mean, count], count <= window.
+        The values are kept in a ring buffer, the value falling out of the window is subtracted from the sum.
+        """
+        assert window >= 1, "The window of a 'window' aggregator has to hold at least one value."
+        self.window = window
+
+    def template_value(self):
+        return [0., 0]
+
+    def hidden_values(self):
+        """
+        Ring buffer of the last window values, position of the next value in the buffer
+        """
+        return [0.] * self.window + [0.]
+
+    def update(self, columns, player_id, slot, hidden_slot, value, day):
+        means, counts = columns[slot], columns[slot + 1]
+        cursor_column = columns[hidden_slot + self.window]
+        count, cursor = counts[player_id], int(cursor_column[player_id])
+        buffer = columns[hidden_slot + cursor]
+
+        values_sum = means[player_id] * count + value
+        if count < self.window:
+            count += 1
+        else:
+            values_sum -= buffer[player_id]
+
+        buffer[player_id] = value
+        cursor_column[player_id] = (cursor + 1) % self.window
+        means[player_id] = values_sum / count
+        counts[player_id] = count
+        return None
+
+
+class DecayedMean:
+    def __init__(self, halflife_days=None, halflife_matches=None):
+        """
+        Exponentially weighted mean of a stat: [mean, weight].
+        The weight of the earlier values halves every halflife_days days (by the match dates), or every halflife_matches
+        values. Without dates (NO_DATE) the earlier values are not decayed by halflife_days.
+        """
+        assert (halflife_days is None) != (halflife_matches is None), \
+            "An 'ewma' aggregator needs either halflife_days or halflife_matches."
+        self.halflife_days = halflife_days
+        self.match_decay = None if halflife_matches is None else 0.5 ** (1. / halflife_matches)
+
+    def template_value(self):
+        return [0., 0.]
+
+    def hidden_values(self):
+        """
+        Day of the last update
+        """
+        return [float(NO_DATE)]
+
+    def update(self, columns, player_id, slot, hidden_slot, value, day):
+        means, weights, last_days = columns[slot], columns[slot + 1], columns[hidden_slot]
+
+        if self.match_decay is not None:
+            decay = self.match_decay
+        elif day == NO_DATE or last_days[player_id] == NO_DATE:
+            decay = 1.
+        else:
+            decay = 0.5 ** (max(day - last_days[player_id], 0.) / self.halflife_days)
+
+        weight = weights[player_id] * decay
+        means[player_id] = (means[player_id] * weight + value) / (weight + 1.)
+        weights[player_id] = weight + 1.
+        if day != NO_DATE:
+            last_days[player_id] = day
+        return None
+
+
+class Variance:
+    def __init__(self):
+        """
+        Mean and sample variance of a stat with Welford's algorithm: [mean, variance, count]
+        """
+
+    def template_value(self):
+        return [0., 0., 0]
+
+    def hidden_values(self):
+        return []
+
+    def update(self, columns, player_id, slot, hidden_slot, value, day):
+        means, variances, counts = columns[slot], columns[slot + 1], columns[slot + 2]
+        count, mean = counts[player_id], means[player_id]
+        squares_sum = variances[player_id] * (count - 1) if count > 1 else 0.
+
+        count += 1
+        delta = value - mean
+        mean += delta / count
+        squares_sum += delta * (value - mean)
+
+        means[player_id] = mean
+        variances[player_id] = squares_sum / (count - 1) if count > 1 else 0.
+        counts[player_id] = count
+        return None
+
+
+def build_aggregator(settings):
+    """
+    :param settings: settings of one aggregator, see above
+    :return: WindowMean, DecayedMean or Variance
+    """
+    if settings['type'] == 'window':
+        return WindowMean(settings['window'])
+    elif settings['type'] == 'ewma':
+        return DecayedMean(settings.get('halflife_days'), settings.get('halflife_matches'))
+    elif settings['type'] == 'variance':
+        return Variance()
+    raise ValueError(f"Unknown aggregator type {settings['type']}, use 'window', 'ewma' or 'variance'.")
@@ -0,0 +1,256 @@
+import hashlib
+import json
+import os
+import shutil
+from pathlib import Path
+import numpy as np
+from .matchstore import MatchStore, MATCH_COLUMNS
+from .groups import GroupedStats
+from .playertable import PlayerTable, PlayerRegistry
+
+
+"""
+On-disk cache of a built database (PlayerTable and MatchStore).
+Every array is stored as a .npy file and loaded as a read-only memory map, so only the parts that are read are loaded.
+The cache of a dataset lives in <save or load directory>/cache/<key>, with the key from dataset_cache_key.
+Checkpoints of an unfinished build use the same format, in <save directory>/checkpoints/<key> (see checkpoint_key),
+with the cursor of the build and its quarantined rows in meta.json.
+The grouped stats of groups.py are stored with the database if there are any, see load_groups.
+Every build of another csv or with other settings adds a cache, only the most recently used ones are kept (see prune_cache).
+"""
+
+CSV_DIGESTS = 'csv_digests.json'
+
+
+def csv_digest(file_path, digests_path=None):
+    """
+    :param file_path: csv data, e.g. atp.csv
+    :param digests_path: json file with the digests of earlier calls, None to hash the csv every time
+    :return: sha256 hex digest of the csv content.
+    The digest is stored in digests_path with the size and the modification time of the csv. As long as both are unchanged
+    the stored digest is returned, so a warm start does not read the whole csv.
+    """
+    file_path = os.path.abspath(file_path)
+    file_stat = os.stat(file_path)
+    file_version = [file_stat.st_size, file_stat.st_mtime_ns]
+
+    digests = {}
+    if digests_path is not None and Path(digests_path).is_file():
+        with open(digests_path) as digests_file:
+            digests = json.load(digests_file)
+        if file_path in digests and digests[file_path]['version'] == file_version:
+            return digests[file_path]['sha256']
+
+    content_hash = hashlib.sha256()
+    with open(file_path, 'rb') as csv_file:
+        for block in iter(lambda: csv_file.read(1 << 20), b''):
+            content_hash.update(block)
+
+    if digests_path is not None:
+        digests[file_path] = {'version': file_version, 'sha256': content_hash.hexdigest()}
+        digests_path = Path(digests_path)
+        digests_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(digests_path.with_name(digests_path.name + '.tmp'), 'w') as digests_file:
+            json.dump(digests, digests_file)
+        os.replace(digests_path.with_name(digests_path.name + '.tmp'), digests_path)
+
+    return content_hash.hexdigest()
+
+
+def dataset_cache_key(file_path, config):
+    """
+    :param file_path: csv data, e.g. atp.csv
+    :param config: configuration dictionary, see PlayersDB
+    :return: sha256 hex digest of the csv content (see csv_digest, stored in <save directory>/csv_digests.json),
+    the 'players_settings' and the 'dataset_config' section, and 'keep_matches' of the 'sqlite' settings, as the MatchStore
+    of a build without kept matches is empty
+    """
+    digests_path = Path(config['save']) / CSV_DIGESTS if config.get('save') else None
+    key_hash = hashlib.sha256(csv_digest(file_path, digests_path).encode())
+
+    settings = {'players_settings': config['players_settings'], 'dataset_config': config['dataset_config'],
+                'keep_matches': (config.get('sqlite') or {}).get('keep_matches', True)}
+    key_hash.update(json.dumps(settings, sort_keys=True, default=str).encode())
+
+    return key_hash.hexdigest()
+
+
+def save_np(directory, name, values):
+    np.save(Path(directory) / f'{name}.npy', np.asarray(values))
+    return None
+
+
+def load_np(directory, name):
+    return np.load(Path(directory) / f'{name}.npy', mmap_mode='r')
+
+
+def save_database(cache_dir, players_table, match_store, extra_meta=None, group_stats=None):
+    """
+    Writes players_table and match_store to cache_dir. The files are written to a temporary directory first,
+    so an interrupted run never leaves a half-written cache behind.
+    extra_meta: dictionary stored in meta.json as well, e.g. the cursor of a checkpoint
+    group_stats: GroupedStats of the build, see groups.py
+    """
+    cache_dir = Path(cache_dir)
+    tmp_dir = cache_dir.with_name(cache_dir.name + '.tmp')
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    tmp_dir.mkdir(parents=True)
+
+    for slot, column in enumerate(players_table.columns):
+        save_np(tmp_dir, f'player_column_{slot}', column)
+    for name, typecode in MATCH_COLUMNS.items():
+        save_np(tmp_dir, name, np.asarray(getattr(match_store, name), dtype=typecode))
+    for statpos in range(len(match_store.stat_names)):
+        save_np(tmp_dir, f'postmatch1_{statpos}', match_store.postmatch1[statpos])
+        save_np(tmp_dir, f'postmatch2_{statpos}', match_store.postmatch2[statpos])
+
+    """
+    The snapshot series of all players are stored back to back, series_start[player_id] is the start of a series
+    """
+    series_lengths = [len(series) for series in match_store.series]
+    save_np(tmp_dir, 'series_start', np.concatenate([[0], np.cumsum(series_lengths, dtype='q')]).astype('q'))
+    save_np(tmp_dir, 'series', np.concatenate([np.asarray(series, dtype='d') for series in match_store.series])
+            if match_store.series else np.zeros(0, dtype='d'))
+
+    meta = {'template': players_table.template, 'aggregators': players_table.aggregator_settings,
+            'ratings': players_table.rating_settings,
+            'players': players_table.registry.names, 'stat_names': match_store.stat_names}
+    if group_stats is not None:
+        for slot, column in enumerate(group_stats.table.columns):
+            save_np(tmp_dir, f'group_column_{slot}', column)
+        meta['groups'] = {'settings': group_stats.settings, 'template': group_stats.table.template,
+                          'keys': group_stats.table.registry.names[:len(group_stats.table)]}
+    meta.update(extra_meta or {})
+    with open(tmp_dir / 'meta.json', 'w') as meta_file:
+        json.dump(meta, meta_file)
+
+    shutil.rmtree(cache_dir, ignore_errors=True)
+    os.replace(tmp_dir, cache_dir)
+
+    return None
+
+
+def load_database(cache_dir):
+    """
+    :return: PlayerTable and MatchStore backed by read-only memory maps of the files in cache_dir.
+    Both are copied into arrays by make_writable before new matches are added.
+    """
+    cache_dir = Path(cache_dir)
+    with open(cache_dir / 'meta.json') as meta_file:
+        meta = json.load(meta_file)
+
+    registry = PlayerRegistry()
+    for player in meta['players']:
+        registry.intern(player)
+
+    players_table = PlayerTable(meta['template'], registry, meta.get('aggregators'), meta.get('ratings'))
+    players_table.columns = [load_np(cache_dir, f'player_column_{slot}') for slot in range(len(players_table.columns))]
+
+    match_store = MatchStore(players_table, meta['stat_names'])
+    for name in MATCH_COLUMNS:
+        setattr(match_store, name, load_np(cache_dir, name))
+    match_store.postmatch1 = [load_np(cache_dir, f'postmatch1_{statpos}') for statpos in range(len(meta['stat_names']))]
+    match_store.postmatch2 = [load_np(cache_dir, f'postmatch2_{statpos}') for statpos in range(len(meta['stat_names']))]
+
+    series, series_start = load_np(cache_dir, 'series'), load_np(cache_dir, 'series_start')
+    match_store.series = [series[series_start[player_id]:series_start[player_id + 1]]
+                          for player_id in range(len(series_start) - 1)]
+    match_store.player_matchidx, match_store.player_dates = None, None
+    match_store.head_to_head_index = None
+
+    return players_table, match_store
+
+
+def load_groups(cache_dir):
+    """
+    :return: GroupedStats stored with the database in cache_dir, None if there are none.
+    The groups are copied into arrays, so new matches can be added right away.
+    """
+    cache_dir = Path(cache_dir)
+    with open(cache_dir / 'meta.json') as meta_file:
+        meta = json.load(meta_file)
+    if 'groups' not in meta:
+        return None
+
+    registry = PlayerRegistry()
+    for key in meta['groups']['keys']:
+        registry.intern(tuple(key))
+    table = PlayerTable(meta['groups']['template'], registry)
+    table.columns = [load_np(cache_dir, f'group_column_{slot}') for slot in range(len(table.columns))]
+    table.make_writable()
+
+    return GroupedStats(meta['groups']['template'], meta['groups']['settings'], table)
+
+
+def cached_database(cache_root, key):
+    """
+    Path of the cache for key in cache_root if it was written completely, else None
+    """
+    cache_dir = Path(cache_root) / 'cache' / key
+    if (cache_dir / 'meta.json').is_file():
+        """
+        The modification time of meta.json is the last use of the cache, see prune_cache
+        """
+        try:
+            os.utime(cache_dir / 'meta.json')
+        except OSError:
+            pass
+        return cache_dir
+    return None
+
+
+def prune_cache(cache_root, keep):
+    """
+    Removes all but the keep most recently used caches in cache_root (by the modification time of their meta.json)
+    and the temporary directories of interrupted writes
+    """
+    cache_root = Path(cache_root) / 'cache'
+    if not cache_root.is_dir():
+        return None
+    cache_dirs = [cache_dir for cache_dir in cache_root.iterdir() if cache_dir.is_dir()]
+    for cache_dir in cache_dirs:
+        if cache_dir.name.endswith('.tmp'):
+            shutil.rmtree(cache_dir, ignore_errors=True)
+    complete = sorted((cache_dir for cache_dir in cache_dirs if (cache_dir / 'meta.json').is_file()),
+                      key=lambda cache_dir: (cache_dir / 'meta.json').stat().st_mtime_ns, reverse=True)
+    for cache_dir in complete[keep:]:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+    return None
+
+
+def checkpoint_key(file_path, config, players_dict):
+    """
+    Key of the checkpoints of a build: dataset_cache_key and the players the build starts from
+    """
+    key_hash = hashlib.sha256(dataset_cache_key(file_path, config).encode())
+    players = {player: players_dict['Players'][player] for player in players_dict['Players']}
+    key_hash.update(json.dumps(players, sort_keys=True, default=str).encode())
+    return key_hash.hexdigest()
+
+
+def save_checkpoint(checkpoint_dir, players_table, match_store, cursor, quarantine, group_stats=None):
+    """
+    Writes the state of an unfinished build: all rows before cursor have been imported, quarantine holds their bad rows
+    """
+    save_database(checkpoint_dir, players_table, match_store, {'cursor': cursor, 'quarantine': quarantine}, group_stats)
+    return None
+
+
+def load_checkpoint(checkpoint_dir):
+    """
+    :return: PlayerTable, MatchStore, cursor and quarantine of the checkpoint in checkpoint_dir (see save_checkpoint),
+    None if there is no complete checkpoint
+    """
+    checkpoint_dir = Path(checkpoint_dir)
+    if not (checkpoint_dir / 'meta.json').is_file():
+        return None
+    with open(checkpoint_dir / 'meta.json') as meta_file:
+        meta = json.load(meta_file)
+
+    players_table, match_store = load_database(checkpoint_dir)
+    return players_table, match_store, meta['cursor'], meta['quarantine']
+
+
+def remove_checkpoint(checkpoint_dir):
+    shutil.rmtree(checkpoint_dir, ignore_errors=True)
+    return None
@@ -0,0 +1,96 @@
+import numpy as np
+
+
+"""
+Feature matrix export of a MatchStore for match outcome models.
+Every match gives one row of X with the differences of the prematch stats (mean values) of player A and player B,
+and one label in y: 1 if player A won the match, else 0.
+Player A is chosen per match from both players, either by a hash of the match index ('random') or by name ('canonical'),
+so the label does not follow from the column order of the dataset or from the order in which the players were added.
+"""
+
+
+def layout_slots(layout):
+    """
+    :return: {stat: first slot} for a layout of template_layout
+    """
+    slots, slot = {}, 0
+    for stat, types in layout:
+        slots[stat] = slot
+        slot += len(types)
+    return slots
+
+
+def prematch_rows(match_store, player_column, offset_column, positions):
+    """
+    :return: (len(positions), stride) array with the prematch snapshots of one side of the matches at positions.
+    The snapshot series are read as numpy views without copying, only the selected rows are gathered.
+    """
+    player_ids = np.asarray(player_column)[positions]
+    offsets = np.asarray(offset_column)[positions]
+    rows = np.empty((len(positions), match_store.stride))
+
+    order = np.argsort(player_ids, kind='stable')
+    bounds = np.flatnonzero(np.diff(player_ids[order])) + 1
+    for group in np.split(order, bounds):
+        if not len(group):
+            continue
+        series = np.asarray(match_store.series[player_ids[group[0]]], dtype='d').reshape(-1, match_store.stride)
+        rows[group] = series[offsets[group]]
+
+    return rows
+
+
+def swap_mask(matchidx, seed):
+    """
+    Random but reproducible choice of player A per match: one splitmix64 hash of (matchidx, seed).
+    The choice only depends on the match, so full exports and batches agree.
+    """
+    values = np.asarray(matchidx, dtype='u8') + np.uint64(seed) * np.uint64(0x9E3779B97F4A7C15)
+    values = (values ^ (values >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    values = (values ^ (values >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    values = values ^ (values >> np.uint64(31))
+    return (values & np.uint64(1)).astype(bool)
+
+
+def match_features(match_store, stat_names, positions, order='random', seed=0, dtype='float64'):
+    """
+    :param match_store: MatchStore of the matches
+    :param stat_names: stats of the players template used as features, e.g. ['FirstServePCT', ...]
+    :param positions: positions of the matches in the match arrays
+    :param order: 'random' (see swap_mask) or 'canonical' (player A is the player whose name comes first)
+    :param seed: seed of the random order
+    :param dtype: 'float64' or 'float32'
+    :return: X (len(positions), len(stat_names)) C-contiguous array of prematch differences A - B,
+    NaN where one of the players has no values of the stat yet, and y (len(positions),) int8 labels
+    """
+    positions = np.asarray(positions, dtype='q')
+    slots, layout = layout_slots(match_store.layout), dict(match_store.layout)
+    rows1 = prematch_rows(match_store, match_store.player1, match_store.offset1, positions)
+    rows2 = prematch_rows(match_store, match_store.player2, match_store.offset2, positions)
+
+    if order == 'random':
+        swap = swap_mask(np.asarray(match_store.matchidx)[positions], seed)
+    elif order == 'canonical':
+        names = np.asarray(match_store.registry.names, dtype=object)
+        swap = names[np.asarray(match_store.player1)[positions]] > names[np.asarray(match_store.player2)[positions]]
+    else:
+        raise ValueError(f"Unknown player order {order}, use 'random' or 'canonical'.")
+
+    X = np.empty((len(positions), len(stat_names)), dtype=dtype)
+    for column, stat in enumerate(stat_names):
+        slot = slots[stat]
+        values1, values2 = rows1[:, slot], rows2[:, slot]
+        if len(layout[stat]) == 2:
+            """
+            [mean, count] stats: the mean of a player without values is only the template value.
+            Ratings ([rating, rd, volatility] or a single rating) are used as they are.
+            """
+            values1 = np.where(rows1[:, slot + 1] > 0, values1, np.nan)
+            values2 = np.where(rows2[:, slot + 1] > 0, values2, np.nan)
+        X[:, column] = np.where(swap, values2 - values1, values1 - values2)
+
+    player1_won = np.asarray(match_store.winner_side)[positions] == 0
+    y = (player1_won != swap).astype('i1')
+
+    return X, y
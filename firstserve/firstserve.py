@@ -1,8 +1,30 @@
 from copy import deepcopy
+import os
 from pathlib import Path
-from .utils_extract_data import (open_cfg_asdict, check_playerkey, add_new_player_to_db,
-                                 add_empty_match_to_db, incr_one_match_to_db, calc_stat_update, set_matchwinner, decide_setsplayed)
+import sys
+from .cache import (dataset_cache_key, cached_database, load_database, save_database, checkpoint_key, save_checkpoint,
+                    load_checkpoint, remove_checkpoint, load_groups, prune_cache)
+from .aggregators import build_aggregator
+from .ratings import build_rating
+from .features import match_features
+from .groups import GroupedStats
+from .instrumentation import Instrumentation, instrumented_build
+from .jsonl import (JsonLinesReader, JsonLinesWriter, match_record, row_match, write_jsonl, load_index, load_source,
+                    save_source)
+from .leaderboards import Leaderboards
+from .matchstore import MatchStore
+from .parallel import build_parallel
+from .playertable import PlayerTable, PlayersView, count_offset
+from .sqlitestore import SQLiteStore
+from .utils_extract_data import (open_cfg_asdict, parse_scorelines, iter_csv_chunks, next_free_matchidx,
+                                 parse_match_dates, find_bad_rows, drop_rows_before, NO_DATE, QUARANTINE_COLUMNS,
+                                 SCORE_SKIPPED)
+from bisect import bisect_left
+import heapq
 from math import isnan
+from numbers import Integral
+import numpy as np
+from time import perf_counter
 
 
 """
@@ -22,7 +44,96 @@ class PlayersDB:
         assert isinstance(config_path, (str, Path))
         self.config = open_cfg_asdict(config_path)
         self.stats_dict = self.config['players_settings']['stats_dict']
+        self.aggregator_settings = self.config['players_settings'].get('aggregators', {})
+        for name, settings in self.aggregator_settings.items():
+            assert settings['stat'] in self.stats_dict.values(), f"Aggregator {name}: {settings['stat']} is not in stats_dict."
+        self.rating_settings = self.config['players_settings'].get('ratings', {})
+        self.leaderboard_thresholds = self.config['players_settings'].get('leaderboards', {}).get('min_matches')
+        self.group_settings = self.config['players_settings'].get('groups', {})
         self.match_formats = self.config['dataset_config']['generate']['ImportMatchFormats']
+        self.match_outcomes = self.config['dataset_config']['generate'].get('ImportOutcomes', ['completed'])
+        self.date_column = self.config['dataset_config']['generate'].get('DateColumn', 'Date')
+        self.csv_backend = self.config['dataset_config']['generate'].get('CsvBackend', 'pandas')
+
+        """
+        Only the matches of the 'Players' and 'Years' of the config are read from the csv ("all" for no filter),
+        see csv_options. A match is read if one of its players is in 'Players'.
+        """
+        self.import_players = self.config_filter('Players')
+        self.import_years = self.config_filter('Years')
+
+        """
+        Rows that cannot be imported (broken scorelines, missing names, ...) stop the import with 'exit', like earlier versions.
+        With 'quarantine' they are skipped and stored with the reason in the build report, see reject_row.
+        """
+        self.on_bad_rows = self.config['dataset_config']['generate'].get('OnBadRows', 'exit')
+        assert self.on_bad_rows in ['exit', 'quarantine'], "OnBadRows has to be 'exit' or 'quarantine'."
+
+        """
+        The database returned by the last build or append, used by the point-in-time queries (see as_of)
+        """
+        self.players_dict = None
+        self.matchstat_dict = None
+
+        """
+        Leaderboard indexes of the kept players (see leaderboards.py), only with 'leaderboards' in players_settings
+        and for players in a PlayerTable (PlayersView)
+        """
+        self.leaderboards = None
+
+        """
+        Stats per group of matches (e.g. per surface and year) of the last build, see groups.py and grouped_stats.
+        Only with 'groups' in players_settings.
+        """
+        self.group_stats = None
+
+        """
+        Optional SQLite file of the players and matches ('sqlite' in the config, see sqlitestore.py), opened by the builds.
+        With 'keep_matches': False the matches are only written to the file, not to the MatchStore.
+        """
+        self.sqlite_settings = self.config.get('sqlite')
+        self.keep_matches = self.sqlite_settings is None or self.sqlite_settings.get('keep_matches', True)
+        self.sqlite = None
+
+        """
+        Optional JSON Lines export of the matches and players to <save directory>/jsonl ('export_jsonl: True' in the config),
+        written during the builds, see open_jsonl and jsonl.py.
+        jsonl_players: players whose stats changed since players.jsonl was written, None if it has to be written in full
+        """
+        self.export_jsonl = self.config.get('export_jsonl', False)
+        self.jsonl = None
+        self.jsonl_players = None
+
+        """
+        No progress output and no timers by default, see instrument
+        """
+        self.instrumentation = Instrumentation()
+
+    def config_filter(self, key):
+        """
+        :return: set of the values of key in the generate settings of the dataset_config, None for "all"
+        """
+        values = self.config['dataset_config']['generate'].get(key, 'all')
+        if values == 'all' or values is None:
+            return None
+        return set(values) if isinstance(values, (list, tuple, set)) else {values}
+
+    def csv_columns(self):
+        """
+        Columns of the csv used by the import: row id, names, scorelines, date and the stats of stats_dict for both players
+        """
+        group_columns = [settings['column'] for settings in self.group_settings.values()]
+        return ['ID', self.date_column] + QUARANTINE_COLUMNS + group_columns + \
+            [statkey + playeridx for statkey in self.stats_dict for playeridx in ['1', '2']]
+
+    def csv_options(self):
+        """
+        Columns and filters of the config that are pushed down into the csv reading, see iter_csv_chunks:
+        the other columns are not read and the rows of other players or years are dropped before they are converted.
+        E.g. import_csv(file_path, **db.csv_options())
+        """
+        return {'usecols': self.csv_columns(), 'players': self.import_players, 'years': self.import_years,
+                'date_column': self.date_column}
 
     def generate_players_template(self):
         """
@@ -33,72 +144,280 @@ class PlayersDB:
         players_template = self.config['players_settings']['players_stats']
         players_dict['template'] = deepcopy(players_template)
 
+        """
+        Rolling windows, EWMAs and variances are stats of the template as well, see aggregators.py
+        """
+        for name, settings in self.aggregator_settings.items():
+            players_dict['template'][name] = build_aggregator(settings).template_value()
+
+        """
+        Elo / Glicko-2 ratings as well, see ratings.py
+        """
+        for name, settings in self.rating_settings.items():
+            players_dict['template'][name] = build_rating(settings).template_value()
+
         return players_dict
 
-    def add_match_stats_to_db(self, players_dict, player, matches_dict, matchidx):
+    def template_aggregators(self, players_template):
         """
-        players_dict: dictionary of all player stats
-        player: player
-        matches_dict: match_dictionary. We need this to check if the match value in the csv is valid or NaN.
-        stats_dict: translates the naming from the csv into my chosen naming, e.g., 'Serve1stPCT_': 'FirstServePCT'.
-        The function check_playerkey takes ['1', '2'] to see whether we include the stat into 'FirstServePCT'
-         taken from 'Serve1stPCT_1' for 'Name_1' or from 'Serve1stPCT_2' for 'Name_2'
+        Settings of the aggregators that are stats of players_template
         """
+        return {name: settings for name, settings in self.aggregator_settings.items() if name in players_template}
 
+    def template_ratings(self, players_template):
+        """
+        Settings of the ratings that are stats of players_template
+        """
+        return {name: settings for name, settings in self.rating_settings.items() if name in players_template}
+
+    def new_players_table(self, players_dict, registry=None):
+        """
+        New PlayerTable with the players of players_dict and the aggregators and ratings of its template
+        """
         players_template = players_dict['template']
+        return PlayerTable.from_players_dict(players_dict, registry, self.template_aggregators(players_template),
+                                             self.template_ratings(players_template))
+
+    def new_group_stats(self):
+        """
+        Empty GroupedStats of the 'groups' in players_settings, None without groups
+        """
+        if not self.group_settings:
+            return None
+        return GroupedStats(self.config['players_settings']['players_stats'], self.group_settings)
+
+    def match_statkeys(self, players_template):
+        """
+        statkeys of stats_dict that are stored for a match, e.g. ['Serve1stPCT_', 'Serve1stWonPCT_', ...]
+        """
+        return [statkey for statkey in self.stats_dict.keys() if self.stats_dict[statkey] in players_template]
+
+    def generate_match_store(self, players_table):
+        """
+        Generates an empty MatchStore for the matches of the players in players_table.
+        The store is read like the match dictionary {matchidx: {'prematch': ..., 'postmatch': ..., 'winner': ...}}
+        """
+        stat_names = [self.stats_dict[statkey] for statkey in self.match_statkeys(players_table.template)]
+
+        return MatchStore(players_table, stat_names)
+
+    def match_dates(self, matches_dict, row_index_list=None):
+        """
+        Dates of the rows of matches_dict as days since 1970-01-01, NO_DATE for all rows if the dataset has no date column
+        """
+        if row_index_list is None:
+            row_index_list = list(matches_dict['ID'])
+        if self.date_column not in matches_dict:
+            return [NO_DATE] * len(row_index_list)
+        return parse_match_dates([matches_dict[self.date_column][rowidx] for rowidx in row_index_list])
+
+    def instrument(self, progress=None, progress_every=10000, timers=True, profile=False, trace_memory=False):
+        """
+        Sets up the instrumentation of the next builds, see instrumentation.Instrumentation for the parameters.
+        E.g. instrument(progress=print_progress) prints the progress like earlier versions.
+        """
+        self.instrumentation = Instrumentation(progress, progress_every, timers, profile, trace_memory)
+        return None
+
+    def build_report(self):
+        """
+        Report of the last build (stage timers, counters, ...), see instrumentation.Instrumentation
+        """
+        return self.instrumentation.report
+
+    def quarantined_rows(self):
+        """
+        Rows skipped by the last build with 'OnBadRows': 'quarantine', e.g.
+        [{'row': 17, 'match': 17, 'reason': 'Scoreline cannot be read', 'Name_1': ..., 'Result_CUR_1': '6-', ...}]
+        """
+        if self.instrumentation.report is None:
+            return []
+        return self.instrumentation.report['quarantine']
 
-        for statkey in self.stats_dict.keys():
+    def reject_row(self, record):
+        """
+        record: bad row with 'row', 'match', 'reason' and the QUARANTINE_COLUMNS of the csv.
+        Stops the import with the reason ('OnBadRows': 'exit') or quarantines the row ('OnBadRows': 'quarantine').
+        """
+        if self.on_bad_rows == 'exit':
+            sys.exit(f"{record['reason']} (match {record['match']}: {record['Result_CUR_1']})")
+        self.instrumentation.quarantine(record)
+        return None
+
+    def keep_database(self, players_dict, matchstat_dict):
+        """
+        Keeps the database for the point-in-time queries and the leaderboards and returns it unchanged
+        """
+        self.players_dict, self.matchstat_dict = players_dict, matchstat_dict
+
+        if self.leaderboard_thresholds is None or not isinstance(players_dict, PlayersView):
+            self.leaderboards = None
+        elif self.leaderboards is None or self.leaderboards.table is not players_dict.table:
+            self.leaderboards = Leaderboards(players_dict.table, self.leaderboard_thresholds)
+
+        """
+        The matches are exported during the import, the players with their final stats
+        """
+        if self.export_jsonl:
+            with self.instrumentation.stage('jsonl'):
+                if self.jsonl is not None:
+                    self.jsonl.save_index()
+                self.export_players(players_dict)
+
+        return players_dict, matchstat_dict
+
+    def close(self):
+        """
+        Closes the JSON Lines export and the SQLite file. The database in memory can still be queried, except for the
+        queries read from the SQLite file with 'keep_matches': False.
+        """
+        if self.jsonl is not None:
+            self.jsonl.close()
+            self.jsonl = None
+        if self.sqlite is not None:
+            self.sqlite.close()
+            self.sqlite = None
+        return None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def open_sqlite(self, players_table, matchstat_dict, reset=False):
+        """
+        SQLiteStore of the 'sqlite' settings for the players of players_table and the matches of matchstat_dict,
+        None without 'sqlite' settings. reset: remove the players and matches of an earlier build from the file.
+        """
+        if self.sqlite_settings is None:
+            return None
+        if self.sqlite is None or self.sqlite.layout != players_table.layout or \
+                self.sqlite.stat_names != list(matchstat_dict.stat_names):
+            if self.sqlite is not None:
+                self.sqlite.close()
+            self.sqlite = SQLiteStore(self.sqlite_settings['path'], players_table.layout, matchstat_dict.stat_names,
+                                      self.sqlite_settings.get('batch_size', 10000))
+        if reset:
+            self.sqlite.reset()
+        return self.sqlite
+
+    def jsonl_path(self, name):
+        """
+        Path of the JSON Lines export name ('matches' or 'players'), see jsonl.py
+        """
+        return Path(self.config['save']) / 'jsonl' / f'{name}.jsonl'
+
+    def open_jsonl(self, reset=False):
+        """
+        JsonLinesWriter of the exported matches, None without 'export_jsonl'.
+        reset: start a new export, else the matches are appended to the export of an earlier build.
+        The export is about to change, so its mark of the cached database it was exported from is removed.
+        """
+        if not self.export_jsonl:
+            return None
+        save_source(self.jsonl_path('matches'), None)
+        if reset or self.jsonl is None:
+            if self.jsonl is not None:
+                self.jsonl.close()
+            self.jsonl = JsonLinesWriter(self.jsonl_path('matches'), 'matchidx', append=not reset)
+        if reset:
+            self.jsonl_players = None
+        return self.jsonl
+
+    def export_covers(self, matchstat_dict, source):
+        """
+        True if the exported matches are the matches of matchstat_dict from the cached database source (its cache key):
+        the export is marked with source and its complete offset index holds the match indices of matchstat_dict
+        """
+        matches_path = self.jsonl_path('matches')
+        if load_source(matches_path) != source or not matches_path.is_file():
+            return False
+        index = load_index(matches_path)
+        return index is not None and int(index[0][-1]) == os.path.getsize(matches_path) and \
+            np.array_equal(np.asarray(index[1]), np.asarray(matchstat_dict.matchidx))
+
+    def export_match_store(self, matchstat_dict, source=None):
+        """
+        Exports all matches of a MatchStore, e.g. of a parallel build or a database loaded from the cache.
+        source: cache key of a cached database. The export is marked with it, and an export of the same cached database
+        (see export_covers) is kept instead of being written again.
+        """
+        if not self.export_jsonl:
+            return None
+        if source is not None and self.export_covers(matchstat_dict, source):
             """
-            statkey is e.g. 'Serve1stPCT_' or 'ReceivingPointsWonPCT_', etc.
+            New matches are appended to the kept export by the next append (see open_jsonl), the players are written
+            in full by keep_database
             """
-            if self.stats_dict[statkey] in players_template:
-                """
-                playerkey is either 'Name_1' or 'Name_2'. We want to know whether we update stats for player known under 'Name_1' or under 'Name_2'
-                """
-                playerkey = check_playerkey(player, statkey, matches_dict, matchidx)
+            if self.jsonl is not None:
+                self.jsonl.close()
+            self.jsonl, self.jsonl_players = None, None
+            self.instrumentation.count('jsonl kept')
+            return None
 
-                if isnan(matches_dict[playerkey][matchidx]):
-                    """
-                    No value in the dataset, so we do not update this stat for this player. 
-                    This means there was no entry for first serve won percentage or some other stat
-                    """
-                    continue
-                else:
-                    """
-                    We update the value self.stats_dict[statkey] and store it in players_dict
-                    """
-                    player_stat_to_update = players_dict['Players'][player][self.stats_dict[statkey]]
-                    match_stat_for_update = matches_dict[playerkey][matchidx]
-                    calc_stat_update(player_stat_to_update, match_stat_for_update)
+        jsonl = self.open_jsonl(reset=True)
+        with self.instrumentation.stage('jsonl'):
+            for matchidx in matchstat_dict:
+                jsonl.write(match_record(matchidx, matchstat_dict.match_date(matchidx), matchstat_dict[matchidx]))
+                if len(jsonl.lines) >= 10000:
+                    jsonl.flush()
+            jsonl.save_index()
+        if source is not None:
+            save_source(self.jsonl_path('matches'), source)
+        return None
 
+    def export_players(self, players_dict):
+        """
+        Writes the players to players.jsonl. After an append only the records of the players of the new matches
+        (jsonl_players) are added to the end of the file, it is written in full again once it would hold more than
+        twice as many records as players, see jsonl.py.
+        """
+        players_path = self.jsonl_path('players')
+        players = players_dict['Players']
+        index = load_index(players_path) if self.jsonl_players is not None else None
+        if index is not None and len(index[1]) + len(self.jsonl_players) <= 2 * len(players):
+            with JsonLinesWriter(players_path, 'player', append=True) as players_jsonl:
+                for player in sorted(self.jsonl_players):
+                    players_jsonl.write({'player': player, 'stats': players[player]})
+        else:
+            write_jsonl(players_path, 'player',
+                        ({'player': player, 'stats': player_stats} for player, player_stats in players.items()))
+        self.jsonl_players = set()
         return None
 
-    def add_stats_to_match_db(self, players_dict, matchstat_dict, player, matches_dict, matchidx):
+    def jsonl_reader(self, name='matches'):
+        """
+        :return: JsonLinesReader of the JSON Lines export name ('matches' or 'players'), e.g.
+        jsonl_reader('matches').get(12) or jsonl_reader('players').get('Federer R.')
+        """
+        return JsonLinesReader(self.jsonl_path(name))
 
-        players_template = players_dict['template']
+    def next_matchidx(self, matchstat_dict):
+        """
+        Match index after the last stored match, in matchstat_dict or in the SQLite file (see keep_matches)
+        """
+        if self.sqlite is None:
+            return next_free_matchidx(matchstat_dict)
+        return max(next_free_matchidx(matchstat_dict), self.sqlite.next_free_matchidx())
 
-        for statkey in self.stats_dict.keys():
-            if self.stats_dict[statkey] in players_template:
-                playerkey = check_playerkey(player, statkey, matches_dict, matchidx)
-                if isnan(matches_dict[playerkey][matchidx]):
-                    """
-                    No value in the dataset, so we do not update this stat for this player. 
-                    This means there was no entry for first serve won percentage or some other stat
-                    """
-                    continue
-                else:
-                    """
-                    We update the value self.stats_dict[statkey] it in matchstat_dict to have information about the current match
-                    after it is finished (hence 'postmatch')
-                    """
-                    matchstat_dict[matchidx]['postmatch'][player][self.stats_dict[statkey]] = matches_dict[playerkey][matchidx]
+    def players_table(self, players_dict, matchstat_dict):
+        """
+        PlayerTable behind players_dict. A PlayersView returned by this class is used directly,
+        for a plain players dictionary a new table with the player ids of matchstat_dict is filled.
+        """
+        matchstat_dict.make_writable()
+        if isinstance(players_dict, PlayersView):
+            assert players_dict.table.registry is matchstat_dict.registry, "Players and matches are from different databases."
+            players_dict.table.make_writable()
+            return players_dict.table
 
-        return None
+        return self.new_players_table(players_dict, matchstat_dict.registry)
 
     def add_stats_from_rel_outcomes(self, players_dict, matches_dict):
         """
         param: players_dict: dictionary with Player stats
-        param: matchid_list: list of match indeces indexed for an iteration over matches_dict
         param: matches_dict: dictionary of matches, indlucing results relative to both players. I.e. 6-4 6-2 for one player, and 2-6 4-6 for the other player.
         The code is adjusted to use the data set from https://www.kaggle.com/datasets/hwaitt/tennis-20112019 (atp.csv and wta.csv).
         As you see, unfortunately the results are mirrored and the correct result is the winning outcome, 6-4 6-2 in this case.
@@ -106,11 +425,279 @@ class PlayersDB:
         return updated Players database dictionary after including the matches from matches_dict
         """
 
+        return self.add_stats_from_chunks(players_dict, [matches_dict])
+
+    @instrumented_build
+    def add_stats_from_csv(self, players_dict, file_path, chunksize=50000, use_cache=False, workers=1, checkpoint_every=None):
+        """
+        param: players_dict: dictionary with Player stats
+        param: file_path: csv data, e.g. atp.csv or wta.csv
+        param: chunksize: number of rows read from the csv at once. Only one chunk of the csv is held in memory.
+        The csv is read with the backend set by 'CsvBackend' in the config, 'csv' reads it without pandas.
+        Only the columns of the import and the matches of the 'Players' and 'Years' of the config are read, see csv_options.
+        param: use_cache: store the built database in the 'save' directory of the config and load it from the 'load' directory
+        when neither the csv nor the settings have changed. Only used if players_dict holds no players yet, and not with
+        'keep_matches': False, as the matches are then only in the SQLite file and the cached MatchStore would be empty.
+        The csv is only hashed again if its size or modification time changed, and only the 'keep_caches' (4 by default)
+        most recently used caches are kept in the 'save' directory, see cache.py.
+        param: workers: number of processes, the chunks are processed in parallel by add_stats_parallel if larger than 1
+        param: checkpoint_every: checkpoint the build about every checkpoint_every rows, see add_stats_checkpointed.
+        The build is serial then, workers is not used.
+        return updated Players database dictionary and the match dictionary, like add_stats_from_rel_outcomes
+        """
+
+        cache_key = None
+        if use_cache and not players_dict['Players'] and self.keep_matches:
+            cache_key = dataset_cache_key(file_path, self.config)
+            cache_dir = cached_database(self.config['load'], cache_key)
+            if cache_dir is not None:
+                with self.instrumentation.stage('cache'):
+                    players_table, matchstat_dict = load_database(cache_dir)
+                    self.group_stats = load_groups(cache_dir)
+                self.instrumentation.count('cache hits')
+                sqlite = self.open_sqlite(players_table, matchstat_dict, reset=True)
+                if sqlite is not None:
+                    with self.instrumentation.stage('sqlite'):
+                        sqlite.write_match_store(matchstat_dict)
+                        sqlite.write_players(players_table)
+                self.export_match_store(matchstat_dict, cache_key)
+                return self.keep_database(PlayersView(players_table), matchstat_dict)
+
+        if checkpoint_every is not None:
+            players_dict, matchstat_dict = self.add_stats_checkpointed(players_dict, file_path, checkpoint_every, chunksize)
+        else:
+            matches_chunks = iter_csv_chunks(file_path, chunksize, self.csv_backend, **self.csv_options())
+            players_dict, matchstat_dict = self.add_stats_parallel(players_dict, matches_chunks, workers)
+
+        if cache_key is not None:
+            with self.instrumentation.stage('cache'):
+                save_database(Path(self.config['save']) / 'cache' / cache_key, players_dict.table, matchstat_dict,
+                              group_stats=self.group_stats)
+                prune_cache(self.config['save'], self.config.get('keep_caches', 4))
+            if self.jsonl is not None:
+                """
+                The export of the build holds the matches of the cached database, see export_match_store
+                """
+                save_source(self.jsonl_path('matches'), cache_key)
+
+        return players_dict, matchstat_dict
+
+    @instrumented_build
+    def add_stats_checkpointed(self, players_dict, file_path, checkpoint_every, chunksize=50000):
+        """
+        param: players_dict: dictionary with Player stats
+        param: file_path: csv data, e.g. atp.csv or wta.csv
+        param: checkpoint_every: number of rows between two checkpoints. Checkpoints are written after a chunk, so the rows
+        between two checkpoints are rounded up to whole chunks.
+        param: chunksize: number of rows read from the csv at once
+        return updated Players database dictionary and the match dictionary, like add_stats_from_chunks
+
+        The state of the build (players, matches, the cursor of the next row and the quarantined rows) is written to
+        <save directory>/checkpoints/<key>, see cache.checkpoint_key. If the build is interrupted (a crash, Ctrl+C, or a bad
+        row with 'OnBadRows': 'exit'), calling this again with the same csv, settings and players resumes from the last
+        checkpoint instead of the first row. The checkpoint is removed when the build is complete.
+        Every checkpoint writes the whole database, so checkpoint_every should be large compared to the chunksize.
+        """
+
+        assert any(match_format in self.match_formats for match_format in ['Bo3', 'Bo5']), \
+            "No match formats in list - no matches can be added!"
+        assert checkpoint_every >= 1, "checkpoint_every has to be at least one row."
+
+        checkpoint_dir = Path(self.config['save']) / 'checkpoints' / checkpoint_key(file_path, self.config, players_dict)
+        with self.instrumentation.stage('checkpoint'):
+            checkpoint = load_checkpoint(checkpoint_dir)
+
+        if checkpoint is None:
+            players_table = self.new_players_table(players_dict)
+            matchstat_dict = self.generate_match_store(players_table)
+            self.open_sqlite(players_table, matchstat_dict, reset=True)
+            self.open_jsonl(reset=True)
+            self.group_stats = self.new_group_stats()
+            cursor = 0
+        else:
+            players_table, matchstat_dict, cursor, quarantine = checkpoint
+            players_table.make_writable()
+            matchstat_dict.make_writable()
+            self.group_stats = load_groups(checkpoint_dir)
+            for record in quarantine:
+                self.instrumentation.quarantine(record)
+            self.instrumentation.count('resumed rows', cursor)
+
+            """
+            Matches written to the SQLite file after the checkpoint are imported again
+            """
+            sqlite = self.open_sqlite(players_table, matchstat_dict)
+            if sqlite is not None:
+                sqlite.delete_matches_from(cursor)
+                sqlite.write_players(players_table)
+            jsonl = self.open_jsonl()
+            if jsonl is not None:
+                jsonl.drop_from(cursor)
+
+        rows_since_checkpoint = 0
+        for matches_dict in iter_csv_chunks(file_path, chunksize, self.csv_backend, **self.csv_options()):
+            matches_dict = drop_rows_before(matches_dict, cursor)
+            if matches_dict is None:
+                continue
+            self.add_matches_chunk(players_table, matchstat_dict, matches_dict)
+
+            row_index_list = list(matches_dict['ID'])
+            cursor = row_index_list[-1] + 1
+            rows_since_checkpoint += len(row_index_list)
+            if rows_since_checkpoint >= checkpoint_every:
+                with self.instrumentation.stage('checkpoint'):
+                    save_checkpoint(checkpoint_dir, players_table, matchstat_dict, cursor, self.instrumentation.quarantined,
+                                    self.group_stats)
+                    if self.jsonl is not None:
+                        self.jsonl.save_index()
+                self.instrumentation.count('checkpoints')
+                rows_since_checkpoint = 0
+
+        remove_checkpoint(checkpoint_dir)
+
+        return self.keep_database(PlayersView(players_table), matchstat_dict)
+
+    @instrumented_build
+    def add_stats_from_chunks(self, players_dict, matches_chunks):
+        """
+        param: players_dict: dictionary with Player stats
+        param: matches_chunks: iterable of matches dictionaries (see add_stats_from_rel_outcomes), processed in order
+        return updated Players database dictionary and the match dictionary of all chunks
+        """
+
         """ Check the format of the match"""
-        assert ('Bo3' or 'Bo5') in self.match_formats, "No match formats in list - no matches can be added!"
+        assert any(match_format in self.match_formats for match_format in ['Bo3', 'Bo5']), \
+            "No match formats in list - no matches can be added!"
+
+        """
+        The players are copied into a new PlayerTable, so players_dict is not changed
+        """
+        players_table = self.new_players_table(players_dict)
+        matchstat_dict = self.generate_match_store(players_table)
+        self.open_sqlite(players_table, matchstat_dict, reset=True)
+        self.open_jsonl(reset=True)
+        self.group_stats = self.new_group_stats()
+
+        for matches_dict in matches_chunks:
+            self.add_matches_chunk(players_table, matchstat_dict, matches_dict)
+
+        return self.keep_database(PlayersView(players_table), matchstat_dict)
+
+    @instrumented_build
+    def add_stats_parallel(self, players_dict, matches_chunks, workers=None):
+        """
+        param: players_dict: dictionary with Player stats
+        param: matches_chunks: iterable of matches dictionaries (see add_stats_from_rel_outcomes), processed in order
+        param: workers: number of processes, all cores by default. With workers=1 this is add_stats_from_chunks.
+        The aggregators of aggregators.py and the ratings of ratings.py depend on the order of the matches, not only on sums,
+        so with aggregators or ratings in the template this is add_stats_from_chunks as well. So it is if the matches are only
+        stored in the SQLite file ('keep_matches': False), as the parallel build holds all matches in memory, and with
+        grouped stats (groups.py).
+        return updated Players database dictionary and the match dictionary of all chunks
+
+        The chunks are parsed by a process pool. Every worker returns per-player sums (matches, wins, stat sums and counts)
+        of its chunk, which are merged in the order of the chunks, see parallel.build_parallel.
+        The means are sum / count and can differ from add_stats_from_chunks in the last digits.
+        """
+
+        if workers is None:
+            workers = os.cpu_count() or 1
+        players_template = players_dict['template']
+        if workers <= 1 or self.template_aggregators(players_template) or self.template_ratings(players_template) or \
+                not self.keep_matches or self.group_settings:
+            return self.add_stats_from_chunks(players_dict, matches_chunks)
+
+        assert any(match_format in self.match_formats for match_format in ['Bo3', 'Bo5']), \
+            "No match formats in list - no matches can be added!"
+
+        players_table = PlayerTable.from_players_dict(players_dict)
+        matchstat_dict = self.generate_match_store(players_table)
+
+        match_statkeys = self.match_statkeys(players_table.template)
+        stat_slots = [players_table.slots[self.stats_dict[statkey]] for statkey in match_statkeys]
+        build_parallel(players_table, matchstat_dict, matches_chunks, match_statkeys, stat_slots, self.match_dates,
+                       self.match_formats, self.match_outcomes, workers, self.instrumentation, self.reject_row)
+
+        sqlite = self.open_sqlite(players_table, matchstat_dict, reset=True)
+        if sqlite is not None:
+            with self.instrumentation.stage('sqlite'):
+                sqlite.write_match_store(matchstat_dict)
+                sqlite.write_players(players_table)
+        self.export_match_store(matchstat_dict)
+
+        return self.keep_database(PlayersView(players_table), matchstat_dict)
+
+    @instrumented_build
+    def append_matches(self, players_dict, matchstat_dict, matches_dict, matchidx_offset=None):
+        """
+        param: players_dict: players returned by add_stats_from_rel_outcomes (PlayersView) or a players dictionary. Updated in place.
+        param: matchstat_dict: MatchStore of the matches stored so far. The new matches are added in place.
+        param: matches_dict: dictionary of new matches, e.g. the matches of the last week, see add_stats_from_rel_outcomes
+        param: matchidx_offset: added to the row indices of matches_dict to get the match indices in matchstat_dict.
+        By default the new matches are stored after the last match in matchstat_dict. Raises a ValueError before anything
+        is changed if the first new match would not come after the last stored match.
+        Nothing is copied for a PlayersView, so the cost only depends on the number of new matches.
+        return players_dict, matchstat_dict
+        """
+
+        assert any(match_format in self.match_formats for match_format in ['Bo3', 'Bo5']), \
+            "No match formats in list - no matches can be added!"
+
+        players_table = self.players_table(players_dict, matchstat_dict)
+        self.open_sqlite(players_table, matchstat_dict)
+        next_matchidx = self.next_matchidx(matchstat_dict)
+        if matchidx_offset is None:
+            matchidx_offset = next_matchidx
+        elif len(matches_dict['ID']) and min(matches_dict['ID']) + matchidx_offset < next_matchidx:
+            raise ValueError(f"Match index {min(matches_dict['ID']) + matchidx_offset} is not after the last stored match "
+                             f"{next_matchidx - 1}, matches have to be added in ascending order.")
+        self.open_jsonl()
+
+        self.add_matches_chunk(players_table, matchstat_dict, matches_dict, matchidx_offset)
+        self.write_back_players(players_dict, players_table)
 
-        players_dict = deepcopy(players_dict)
-        matchstat_dict = {}
+        return self.keep_database(players_dict, matchstat_dict)
+
+    @instrumented_build
+    def append_csv(self, players_dict, matchstat_dict, file_path, chunksize=50000):
+        """
+        Same as append_matches, with the new matches streamed from a csv file in chunks.
+        """
+
+        assert any(match_format in self.match_formats for match_format in ['Bo3', 'Bo5']), \
+            "No match formats in list - no matches can be added!"
+
+        players_table = self.players_table(players_dict, matchstat_dict)
+        self.open_sqlite(players_table, matchstat_dict)
+        self.open_jsonl()
+        matchidx_offset = self.next_matchidx(matchstat_dict)
+
+        for matches_dict in iter_csv_chunks(file_path, chunksize, self.csv_backend, **self.csv_options()):
+            self.add_matches_chunk(players_table, matchstat_dict, matches_dict, matchidx_offset)
+        self.write_back_players(players_dict, players_table)
+
+        return self.keep_database(players_dict, matchstat_dict)
+
+    @staticmethod
+    def write_back_players(players_dict, players_table):
+        """
+        Copies the players of players_table into a plain players dictionary. A PlayersView already shows the table.
+        """
+        if isinstance(players_dict, PlayersView):
+            return None
+
+        for player, player_id in players_table.players():
+            players_dict['Players'][player] = players_table.player_stats(player_id)
+
+        return None
+
+    def add_matches_chunk(self, players_table, matchstat_dict, matches_dict, matchidx_offset=0):
+        """
+        param: players_table: PlayerTable with Player stats, updated in place
+        param: matchstat_dict: MatchStore of the matches stored so far, the matches from matches_dict are added in place
+        param: matches_dict: dictionary of matches, see add_stats_from_rel_outcomes
+        param: matchidx_offset: the match of row rowidx in matches_dict is stored as matchstat_dict[rowidx + matchidx_offset]
+        """
 
         """
         The reason the code below is so complicated is because of the mirrored scorelines. 
@@ -119,63 +706,402 @@ class PlayersDB:
         or 'Result_CUR_2'.
         """
 
-        match_index_list = list(matches_dict['ID'])
+        row_index_list = list(matches_dict['ID'])
+        match_statkeys = self.match_statkeys(players_table.template)
+        stat_slots = [players_table.slots[self.stats_dict[statkey]] for statkey in match_statkeys]
+        stat_aggregators = [[name for name, settings in players_table.aggregator_settings.items()
+                             if settings['stat'] == self.stats_dict[statkey]] for statkey in match_statkeys]
+        update_ratings = bool(players_table.ratings)
+        leaderboards = self.leaderboards if self.leaderboards is not None and self.leaderboards.table is players_table else None
+        sqlite, keep_matches, sqlite_players = self.sqlite, self.keep_matches, set()
+        jsonl, jsonl_players = self.jsonl, self.jsonl_players
+        group_stats = self.group_stats
+        if group_stats is not None:
+            group_table = group_stats.table
+            group_slots = [group_table.slots[self.stats_dict[statkey]] for statkey in match_statkeys]
 
-        for matchidx in match_index_list:
+        """
+        Stage timers are only read in the loop if they are switched on, see instrument
+        """
+        instrumentation = self.instrumentation
+        timers, progress, progress_every = instrumentation.timers, instrumentation.progress, instrumentation.progress_every
+        stage_seconds = {'player creation': 0., 'snapshot copy': 0., 'stat updates': 0.}
+        players_before, matches_added = len(players_table), 0
 
-            if matchidx % 10000 == 0:
-                print('Importing match : ', matchidx)
+        """
+        All scorelines are parsed at once: parse_scorelines splits the sets, repairs the mirrored tie-break results
+        and counts the sets relative to both players, see decide_setsplayed and set_matchwinner for the single-match version.
+        Matches in formats or with outcomes (e.g. walkovers) that are not configured are skipped.
+        winner_idx / loser_idx hold 0 for 'Name_1' and 1 for 'Name_2'.
+        Bad rows (broken scorelines, missing names, stat values that are not numbers) are handed to reject_row before any
+        match of the chunk is added, and skipped if the import goes on.
+        """
+        with instrumentation.stage('parse scorelines'):
+            winner_idx, loser_idx, _ = parse_scorelines([matches_dict['Result_CUR_1'][rowidx] for rowidx in row_index_list],
+                                                        [matches_dict['Result_CUR_2'][rowidx] for rowidx in row_index_list],
+                                                        self.match_formats, self.match_outcomes)
+            bad_rows = find_bad_rows(winner_idx, [matches_dict['Name_1'][rowidx] for rowidx in row_index_list],
+                                     [matches_dict['Name_2'][rowidx] for rowidx in row_index_list],
+                                     [[matches_dict[statkey + playeridx][rowidx] for rowidx in row_index_list]
+                                      for statkey in match_statkeys for playeridx in ['1', '2']])
+        winner_idx, loser_idx = winner_idx.tolist(), loser_idx.tolist()
+        for matchpos, reason in bad_rows.items():
+            rowidx = row_index_list[matchpos]
+            self.reject_row(dict({'row': rowidx, 'match': rowidx + matchidx_offset, 'reason': reason},
+                                 **{col: matches_dict[col][rowidx] for col in QUARANTINE_COLUMNS}))
+            winner_idx[matchpos] = loser_idx[matchpos] = SCORE_SKIPPED
+        match_dates = self.match_dates(matches_dict, row_index_list)
+        if group_stats is not None:
+            group_keys = group_stats.row_keys(matches_dict, row_index_list)
 
-            """
-            For each match (entry), we split every set and count the number of sets below:
-            if len(rel_match_result) == 2 for each split string, it's a two-set match
-            """
+        for matchpos, rowidx in enumerate(row_index_list):
 
-            match_results = [matches_dict['Result_CUR_1'][matchidx].split(), matches_dict['Result_CUR_2'][matchidx].split()]
-            player1_str, player2_str = [matches_dict['Name_1'][matchidx], matches_dict['Name_2'][matchidx]]
+            matchidx = rowidx + matchidx_offset
 
-            if (all(len(rel_match_result) == 2 for rel_match_result in match_results) or
-                    all(len(rel_match_result) == 3 for rel_match_result in match_results)):
-                """
-                Two sets played or three sets played.
-                twosetsplayed/threesetsplayed is a dictionary in style {player1: setswon_by_player1, player2: setswon_by_player2}, 
-                showing both players as keys with int number of sets won by each as item. 
-                We need to use this method twice because we have two relative match results: 'Result_CUR_1' and 'Result_CUR_2'. 
-                We have two dictionaries in twosetsplayed_rel to compare whether the data consistently shows the correct winner for both relative scorelines.
-                """
-                matchstat_dict[matchidx] = add_empty_match_to_db(player1_str, player2_str)
-                allsetsplayed_rel = decide_setsplayed(match_results, player1_str, player2_str)
+            if progress is not None and matchidx % progress_every == 0:
+                progress(matchidx, dict(instrumentation.counters, rows=instrumentation.counters['rows'] + matchpos))
 
-            else:
-                """Bo5 format is not implemented yet and the dataset does probably not display correct Bo5 match outcomes."""
+            winner_side, loser_side = winner_idx[matchpos], loser_idx[matchpos]
+            if winner_side == SCORE_SKIPPED:
                 continue
 
             """
-            Check both setwinners_dict_rel entries to see whether results are consistent and retrieve 'winner' and 'loser'.
+            Players are handled by their id in players_table from here on. If a player is missing, 
+            players_table.player_id adds a new entry with the template stats (winner first, like add_new_player_to_db before).
+            """
+            if timers:
+                time_start = perf_counter()
+            player_names = [matches_dict['Name_1'][rowidx], matches_dict['Name_2'][rowidx]]
+            player_ids = [0, 0]
+            player_ids[winner_side] = players_table.player_id(player_names[winner_side])
+            player_ids[loser_side] = players_table.player_id(player_names[loser_side])
+            if leaderboards is not None:
+                leaderboards.mark_changed(player_ids)
+            if timers:
+                time_players = perf_counter()
+                stage_seconds['player creation'] += time_players - time_start
+
+            """
+            Here we store the match with the stats of both players before the match ('prematch', appended to the
+            snapshot series of the players in matchstat_dict) and the match stats from the dataset ('postmatch'),
+            and in the SQLite file if there is one
             """
-            winner, loser = set_matchwinner(allsetsplayed_rel, player1_str, player2_str)
+            postmatch_values = [[matches_dict[statkey + playeridx][rowidx] for statkey in match_statkeys]
+                                for playeridx in ['1', '2']]
+            prematch_rows = [players_table.row(player_id) for player_id in player_ids]
+            if keep_matches:
+                matchstat_dict.add_match(matchidx, player_ids, winner_side, prematch_rows, postmatch_values,
+                                         match_dates[matchpos])
+            if sqlite is not None:
+                sqlite.add_match(matchidx, player_ids, winner_side, prematch_rows, postmatch_values, match_dates[matchpos])
+                sqlite_players.update(player_ids)
+            if jsonl is not None:
+                jsonl.write(match_record(matchidx, match_dates[matchpos],
+                                         row_match(player_names, winner_side, players_table.layout, prematch_rows,
+                                                   matchstat_dict.stat_names, postmatch_values)))
+                if jsonl_players is not None:
+                    jsonl_players.update(player_names)
+            if timers:
+                time_snapshot = perf_counter()
+                stage_seconds['snapshot copy'] += time_snapshot - time_players
 
             """
-            Update the entries in players_dict for both players, winner and loser with incr_one_match_to_db. 
-            If a player is missing, make a new entry with add_new_player_to_db.
+            Update the stats of winner and loser, see incr_one_match_to_db and calc_stat_update.
+            The ratings of both players are updated from their ratings before the match, which are in the snapshots already.
             """
+            players_table.incr_one_match(player_ids[loser_side], won=False)
+            players_table.incr_one_match(player_ids[winner_side], won=True)
+            if update_ratings:
+                players_table.update_ratings(player_ids[winner_side], player_ids[loser_side], match_dates[matchpos])
 
-            for player in [winner, loser]:
-                if player not in players_dict['Players']:
-                    add_new_player_to_db(players_dict, player)
-                matchstat_dict[matchidx]['prematch'][player] = deepcopy(players_dict['Players'][player])
+            for side in [winner_side, loser_side]:
+                for slot, aggregator_names, match_stat in zip(stat_slots, stat_aggregators, postmatch_values[side]):
+                    if isnan(match_stat):
+                        """
+                        No value in the dataset, so we do not update this stat for this player. 
+                        """
+                        continue
+                    players_table.calc_stat_update(player_ids[side], slot, match_stat)
+                    for name in aggregator_names:
+                        players_table.update_aggregator(player_ids[side], name, match_stat, match_dates[matchpos])
 
-            incr_one_match_to_db(players_dict, loser, {'won': False})
-            incr_one_match_to_db(players_dict, winner, {'won': True})
+            """
+            The same updates for the groups of the match (e.g. surface and year) of both players, see groups.py
+            """
+            if group_stats is not None:
+                for side in [winner_side, loser_side]:
+                    group_id = group_stats.group_id(player_names[side], group_keys[matchpos])
+                    group_table.incr_one_match(group_id, won=side == winner_side)
+                    for slot, match_stat in zip(group_slots, postmatch_values[side]):
+                        if not isnan(match_stat):
+                            group_table.calc_stat_update(group_id, slot, match_stat)
+
+            matches_added += 1
+            if timers:
+                stage_seconds['stat updates'] += perf_counter() - time_snapshot
+
+        if sqlite is not None:
+            with instrumentation.stage('sqlite'):
+                sqlite.write_players(players_table, sorted(sqlite_players))
+                sqlite.flush()
+        if jsonl is not None:
+            with instrumentation.stage('jsonl'):
+                jsonl.flush()
+
+        instrumentation.count('chunks')
+        instrumentation.count('rows', len(row_index_list))
+        instrumentation.count('matches', matches_added)
+        instrumentation.count('skipped', len(row_index_list) - matches_added)
+        instrumentation.count('new players', len(players_table) - players_before)
+        if timers:
+            for stage, seconds in stage_seconds.items():
+                instrumentation.add_time(stage, seconds, matches_added)
+
+        return None
+
+    def player_history(self, player):
+        """
+        param: player: name of the player
+        return player id (None for players without matches), match indices and dates of the matches of the player
+        (see MatchStore.player_history) and True if their dates are not in order (see MatchStore.unordered_dates).
+        With 'keep_matches': False the history is read from the SQLite file, as the MatchStore holds no matches.
+        """
+        if player not in self.players_dict['Players']:
+            raise KeyError(player)
+        player_id = self.matchstat_dict.registry.ids.get(player)
+        if player_id is None:
+            return None, [], [], False
+        if not self.keep_matches:
+            return (player_id, *self.sqlite.player_history(player_id))
+        history_matchidx, history_dates = self.matchstat_dict.player_history(player_id)
+        return player_id, history_matchidx, history_dates, player_id in self.matchstat_dict.unordered_dates
+
+    def snapshot(self, player, player_id, history_matchidx, matches_before):
+        """
+        Stats of the player before their match number matches_before (counted from 0), the current stats after their
+        last match. With 'keep_matches': False the stats are read from the SQLite file.
+        """
+        if matches_before >= len(history_matchidx):
+            return self.players_dict['Players'][player]
+        if not self.keep_matches:
+            return self.sqlite.prematch(player_id, history_matchidx[matches_before])
+        return self.matchstat_dict.snapshot(player_id, matches_before)
+
+    def as_of_position(self, player, when):
+        """
+        param: player: name of the player
+        param: when: match index (int) or date (e.g. '2015-06-01', datetime.date) of the point in time
+        return player id and the number k of matches of the player before when.
+        Matches without a date count at the date of the match of the player before them (see MatchStore.player_history).
+        Dates have to ascend with the match index, as in the dataset: date queries for a player with a match dated before
+        one of their earlier matches raise a ValueError.
+        """
+        assert self.matchstat_dict is not None, "No database built yet, see add_stats_from_csv."
+        player_id, history_matchidx, history_dates, unordered = self.player_history(player)
+        if isinstance(when, Integral):
+            return player_id, bisect_left(history_matchidx, when)
+        self.check_dates_ascend(player, unordered)
+        return player_id, bisect_left(history_dates, parse_match_dates([when])[0])
+
+    @staticmethod
+    def check_dates_ascend(player, unordered):
+        """
+        Raises a ValueError if the matches of the player are not in the order of their dates, see as_of_position
+        """
+        if unordered:
+            raise ValueError(f"The matches of {player} are not in the order of their dates, "
+                             f"query them by match index instead of by date.")
+        return None
+
+    def as_of(self, player, when):
+        """
+        param: player: name of the player
+        param: when: match index (int) or date of the point in time, see as_of_position
+        return stats of the player before the match with index when / before the date when, in the format of the template.
+
+        Snapshot k of the snapshot series of a player (see MatchStore) holds the stats before their k-th match, so the query
+        is a bisection in the time index of the player. After their last match the current stats are returned.
+        """
+        assert self.matchstat_dict is not None, "No database built yet, see add_stats_from_csv."
+        player_id, history_matchidx, history_dates, unordered = self.player_history(player)
+        if isinstance(when, Integral):
+            matches_before = bisect_left(history_matchidx, when)
+        else:
+            self.check_dates_ascend(player, unordered)
+            matches_before = bisect_left(history_dates, parse_match_dates([when])[0])
+        return self.snapshot(player, player_id, history_matchidx, matches_before)
+
+    def as_of_batch(self, queries):
+        """
+        param: queries: iterable of (player, when) pairs, see as_of
+        return list with the stats of every query, in the order of queries.
+        All dates are parsed at once and the time index of every player is looked up once.
+        """
+        assert self.matchstat_dict is not None, "No database built yet, see add_stats_from_csv."
+        queries = list(queries)
+        dates = iter(parse_match_dates([when for _, when in queries if not isinstance(when, Integral)]))
+
+        results = []
+        histories = {}
+        for player, when in queries:
+            if player not in histories:
+                histories[player] = self.player_history(player)
+            player_id, history_matchidx, history_dates, unordered = histories[player]
+
+            if isinstance(when, Integral):
+                matches_before = bisect_left(history_matchidx, when)
+            else:
+                self.check_dates_ascend(player, unordered)
+                matches_before = bisect_left(history_dates, next(dates))
+            results.append(self.snapshot(player, player_id, history_matchidx, matches_before))
+
+        return results
+
+    def head_to_head(self, player_a, player_b):
+        """
+        param: player_a, player_b: names of both players
+        return head-to-head record of both players in the last built database:
+        {'matches': [matchidx, ...], 'wins': [wins of player_a, wins of player_b], 'deltas': {stat: mean of player_a - player_b}}
+        The pair is looked up in the head-to-head index of the MatchStore, the cost does not depend on the number of matches.
+        With 'keep_matches': False the record is read from the common matches of both players in the SQLite file.
+        """
+        assert self.matchstat_dict is not None, "No database built yet, see add_stats_from_csv."
+        player_ids = self.matchstat_dict.registry.ids
+        if player_a not in player_ids or player_b not in player_ids:
+            return {'matches': [], 'wins': [0, 0], 'deltas': {}}
 
-            for player in [winner, loser]:
-                self.add_match_stats_to_db(players_dict, player, matches_dict, matchidx)
-                self.add_stats_to_match_db(players_dict, matchstat_dict, player, matches_dict, matchidx)
+        if not self.keep_matches:
+            return self.sqlite.head_to_head(player_ids[player_a], player_ids[player_b])
+        return self.matchstat_dict.head_to_head().record(player_ids[player_a], player_ids[player_b])
 
-            matchstat_dict[matchidx]['winner'] = winner
+    def head_to_head_features(self, player_pairs):
+        """
+        param: player_pairs: iterable of (player_a, player_b) names, e.g. all pairings of a tournament draw
+        return feature names and an array with one row per pair, see HeadToHeadIndex.features:
+        ['H2H Matches', 'H2H Wins_1', 'H2H Wins_2', 'H2H <stat> Delta', ...]
+        """
+        assert self.matchstat_dict is not None, "No database built yet, see add_stats_from_csv."
+        player_ids = self.matchstat_dict.registry.ids
+        stat_names = self.matchstat_dict.stat_names
+        feature_names = ['H2H Matches', 'H2H Wins_1', 'H2H Wins_2'] + [f'H2H {stat} Delta' for stat in stat_names]
 
+        if not self.keep_matches:
             """
-            Here we store the matches with all the necessary stats
+            Without matches in memory every pair is read from the SQLite file, see head_to_head
             """
+            player_pairs = list(player_pairs)
+            features = np.full((len(player_pairs), len(feature_names)), np.nan)
+            for row, (player_a, player_b) in enumerate(player_pairs):
+                record = self.head_to_head(player_a, player_b)
+                features[row, :3] = [len(record['matches'])] + record['wins']
+                for statpos, stat in enumerate(stat_names):
+                    features[row, 3 + statpos] = record['deltas'].get(stat, np.nan)
+            return feature_names, features
 
-        return players_dict, matchstat_dict
+        index = self.matchstat_dict.head_to_head()
+        return feature_names, index.features([(player_ids.get(player_a), player_ids.get(player_b))
+                                              for player_a, player_b in player_pairs])
+
+    def match(self, matchidx):
+        """
+        param: matchidx: index of the match
+        return match in the format of the match dictionary, read from the SQLite file with 'keep_matches': False.
+        Raises a KeyError for unknown match indices.
+        """
+        assert self.matchstat_dict is not None, "No database built yet, see add_stats_from_csv."
+        if self.keep_matches:
+            return self.matchstat_dict[matchidx]
+        for _, match in self.sqlite.iter_matches(matchidx, matchidx + 1):
+            return match
+        raise KeyError(matchidx)
+
+    def match_count(self):
+        """
+        Number of matches in the last built database, counted in the SQLite file with 'keep_matches': False
+        """
+        assert self.matchstat_dict is not None, "No database built yet, see add_stats_from_csv."
+        return len(self.matchstat_dict) if self.keep_matches else len(self.sqlite)
+
+    def leaderboard(self, stat, k=10, min_matches=0):
+        """
+        param: stat: stat of the players template, e.g. 'WinrateTotal', 'FirstServePCT' (ranked by the mean) or 'Elo'
+        param: k: number of players
+        param: min_matches: only players with at least min_matches matches ('Number of Matches') are ranked
+        return [(player, value), ...] of the k players with the highest values in the last built database, ties by name.
+        Players without values of a stat with a count (e.g. [mean, count], see playertable.count_offset) are not ranked.
+        With 'leaderboards' in players_settings the players are read from the sorted indexes of leaderboards.py,
+        else (or for a min_matches below all thresholds) all players are scanned.
+        """
+        assert self.players_dict is not None, "No database built yet, see add_stats_from_csv."
+        if self.leaderboards is not None:
+            leaders = self.leaderboards.top(stat, k, min_matches)
+            if leaders is not None:
+                return leaders
+
+        template_value = self.players_dict['template'][stat]
+        count_entry = count_offset(tuple(type(entry) for entry in template_value)) \
+            if isinstance(template_value, (list, tuple)) else None
+        ranked = []
+        for player, player_stats in self.players_dict['Players'].items():
+            if player_stats.get('Number of Matches', 0) < min_matches:
+                continue
+            value = player_stats[stat]
+            if isinstance(value, list):
+                if count_entry is not None and value[count_entry] == 0:
+                    continue
+                value = value[0]
+            ranked.append((-value, player))
+
+        return [(player, -value) for value, player in heapq.nsmallest(k, ranked)]
+
+    def grouped_stats(self, player, **values):
+        """
+        :param player: name of the player
+        :param values: values of some of the group dimensions of 'groups' in players_settings, e.g. Surface='Clay', Year=2015
+        :return: stats of the player in the matches with these values, merged over the other dimensions, see groups.py.
+        Raises a KeyError if the player has no such matches.
+        """
+        assert self.group_stats is not None, "No grouped stats, see 'groups' in players_settings."
+        return self.group_stats.stats(player, **values)
+
+    def feature_names(self):
+        """
+        Columns of the feature matrix: the stats of stats_dict in the players template, in the order of stats_dict,
+        then the ratings in the template (see ratings.py, the difference of the ratings without deviation and volatility)
+        """
+        assert self.matchstat_dict is not None, "No database built yet, see add_stats_from_csv."
+        stored_stats = dict(self.matchstat_dict.layout)
+        return list(self.matchstat_dict.stat_names) + [name for name in self.rating_settings if name in stored_stats]
+
+    def check_matches_kept(self, query):
+        """
+        Raises a ValueError for queries that need the snapshot series of the MatchStore, which holds no matches with
+        'keep_matches': False
+        """
+        if not self.keep_matches:
+            raise ValueError(f"{query} needs the matches in memory, but with 'keep_matches': False the match history "
+                             f"is only stored in the SQLite file {self.sqlite_settings['path']}.")
+        return None
+
+    def feature_matrix(self, order='random', seed=0, dtype='float64'):
+        """
+        param: order: 'random' or 'canonical' choice of player A per match, see features.match_features
+        param: seed: seed of the random order
+        param: dtype: 'float64' or 'float32'
+        return X with the prematch stat differences of player A and player B of all matches in the last built database
+        (columns see feature_names, NaN where a player has no values of a stat yet) and y, 1 if player A won
+        """
+        assert self.matchstat_dict is not None, "No database built yet, see add_stats_from_csv."
+        self.check_matches_kept('feature_matrix')
+        return match_features(self.matchstat_dict, self.feature_names(), range(len(self.matchstat_dict)), order, seed, dtype)
+
+    def iter_feature_batches(self, batch_size=100000, order='random', seed=0, dtype='float64'):
+        """
+        Same as feature_matrix, as generator of (X, y) for batch_size matches at a time in the order of the match indices.
+        The batches concatenate to feature_matrix with the same order and seed.
+        """
+        assert self.matchstat_dict is not None, "No database built yet, see add_stats_from_csv."
+        self.check_matches_kept('iter_feature_batches')
+        for start in range(0, len(self.matchstat_dict), batch_size):
+            yield match_features(self.matchstat_dict, self.feature_names(),
+                                 range(start, min(start + batch_size, len(self.matchstat_dict))), order, seed, dtype)
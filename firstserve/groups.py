@@ -0,0 +1,142 @@
+import numpy as np
+from .playertable import PlayerTable, restore_stats
+from .utils_extract_data import NO_DATE, match_years
+
+
+"""
+Player stats per group of matches, e.g. per surface, season and tournament level, declared in players_settings:
+
+'groups': {'Surface': {'column': 'Surface'},
+           'Year': {'column': 'Date', 'by': 'year'},
+           'Level': {'column': 'Tournament', 'levels': ['Grand Slam', 'Masters 1000', 'ATP500', 'ATP250']}}
+
+Every dimension reads one column of the csv. 'by': 'year' groups a date column by the year, 'levels' groups by the first
+level the value starts with ('Other' if there is none). Missing values are grouped as None.
+
+The stats of 'players_stats' (not the aggregators and ratings, which depend on the order of all matches of a player)
+are kept for every (player, value of every dimension) in a PlayerTable of its own, updated in the same pass as the
+players (see PlayersDB.add_matches_chunk). A query with some of the dimensions merges the groups of the player that
+match, e.g. stats('Federer R.', Surface='Clay') merges all years and levels.
+"""
+
+OTHER_LEVEL = 'Other'
+
+
+class GroupDimension:
+    def __init__(self, name, column, by=None, levels=None):
+        """
+        :param name: name of the dimension in the queries, e.g. 'Surface'
+        :param column: column of the csv
+        :param by: 'year' for the year of a date column
+        :param levels: prefixes of the values, e.g. ['Grand Slam', 'Masters 1000'] for 'Grand Slam 2' -> 'Grand Slam'
+        """
+        assert by in [None, 'year'], f"Group {name}: 'by' has to be 'year'."
+        self.name = name
+        self.column = column
+        self.by = by
+        self.levels = levels
+
+    def values(self, column_values):
+        """
+        :param column_values: values of the column for some rows
+        :return: group value of every row
+        """
+        if self.by == 'year':
+            return [None if year == NO_DATE else year for year in match_years(column_values).tolist()]
+        values = [None if value is None or (isinstance(value, float) and np.isnan(value)) or value == '' else value
+                  for value in column_values]
+        if self.levels is None:
+            return values
+        return [None if value is None else
+                next((level for level in self.levels if str(value).startswith(level)), OTHER_LEVEL)
+                for value in values]
+
+
+class GroupedStats:
+    def __init__(self, players_template, group_settings, table=None):
+        """
+        :param players_template: template of the grouped stats, 'players_stats' of players_settings
+        :param group_settings: 'groups' of players_settings, see above
+        :param table: PlayerTable of the groups, e.g. loaded from the cache. A new table by default.
+        The groups are the "players" of the table, named (player, value of every dimension).
+        """
+        self.settings = group_settings
+        self.dimensions = [GroupDimension(name, **settings) for name, settings in group_settings.items()]
+        self.table = PlayerTable(players_template) if table is None else table
+
+        """
+        Group ids of every player, for the queries
+        """
+        self.player_groups = {}
+        for group_id, key in enumerate(self.table.registry.names[:len(self.table)]):
+            self.player_groups.setdefault(key[0], []).append(group_id)
+
+    def row_keys(self, matches_dict, row_index_list):
+        """
+        :return: tuple of the group values of every row of matches_dict, None values if a column is missing
+        """
+        values = [dimension.values([matches_dict[dimension.column][rowidx] for rowidx in row_index_list])
+                  if dimension.column in matches_dict else [None] * len(row_index_list)
+                  for dimension in self.dimensions]
+        return list(zip(*values))
+
+    def group_id(self, player, row_key):
+        """
+        Id of the group of player with the group values row_key, new groups start with the template stats
+        """
+        key = (player, *row_key)
+        group_id = self.table.registry.ids.get(key)
+        if group_id is None or group_id >= len(self.table):
+            group_id = self.table.player_id(key)
+            self.player_groups.setdefault(player, []).append(group_id)
+        return group_id
+
+    def matching_groups(self, player, values):
+        """
+        :return: list of ({dimension: value}, group id) of the groups of player with the values of some dimensions
+        """
+        names = [dimension.name for dimension in self.dimensions]
+        unknown = set(values) - set(names)
+        if unknown:
+            raise ValueError(f"Unknown group dimensions {sorted(unknown)}, the groups are {names}.")
+        matching = []
+        for group_id in self.player_groups.get(player, []):
+            group_values = dict(zip(names, self.table.registry.names[group_id][1:]))
+            if all(group_values[name] == value for name, value in values.items()):
+                matching.append((group_values, group_id))
+        return matching
+
+    def groups(self, player, **values):
+        """
+        :param player: name of the player
+        :param values: values of some of the dimensions, e.g. Surface='Clay', Year=2015
+        :return: list of ({dimension: value}, stats) of all groups of the player with these values
+        """
+        return [(group_values, self.table.player_stats(group_id))
+                for group_values, group_id in self.matching_groups(player, values)]
+
+    def stats(self, player, **values):
+        """
+        :return: stats of the player in the format of the template, merged over all groups with values (see groups).
+        Counts are added up, [mean, count] stats are weighted by their counts and the winrate is computed again.
+        Raises a KeyError if the player has no matches with these values.
+        """
+        table = self.table
+        group_ids = [group_id for _, group_id in self.matching_groups(player, values)]
+        if not group_ids:
+            raise KeyError((player, values))
+
+        merged = []
+        for stat, types in table.layout:
+            slot = table.slots[stat]
+            if len(types) == 2:
+                counts = [table.columns[slot + 1][group_id] for group_id in group_ids]
+                total = sum(counts)
+                mean = sum(table.columns[slot][group_id] * count for group_id, count in zip(group_ids, counts))
+                merged.extend([mean / total if total else table.initial_values[slot], total])
+            else:
+                merged.extend(sum(table.columns[slot + entry][group_id] for group_id in group_ids)
+                              for entry in range(len(types)))
+        if table.winrate_slot is not None and table.matches_slot is not None and merged[table.matches_slot]:
+            merged[table.winrate_slot] = merged[table.wins_slot] / merged[table.matches_slot]
+        return restore_stats(table.layout, merged)
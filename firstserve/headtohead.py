@@ -0,0 +1,166 @@
+from array import array
+from math import isnan
+import numpy as np
+from .playertable import to_array
+
+
+"""
+Head-to-head index of a MatchStore.
+Every unordered pair of players that met gets one slot. A slot holds the match indices of the pair, the wins of both players
+and, for every match stat, the sum and count of the differences between both players.
+Pairs are stored as (low id, high id), the wins and differences are counted from the side of the player with the lower id
+and turned around when the pair is asked for the other way round.
+"""
+
+
+class HeadToHeadIndex:
+    def __init__(self, stat_names):
+        """
+        :param stat_names: names of the match stats of the MatchStore, e.g. ['FirstServePCT', ...]
+        """
+        self.stat_names = list(stat_names)
+        self.slots = {}
+        self.matches = []
+        self.wins_low = array('l')
+        self.wins_high = array('l')
+        self.delta_sums = [array('d') for _ in self.stat_names]
+        self.delta_counts = [array('l') for _ in self.stat_names]
+
+    @classmethod
+    def from_match_store(cls, match_store):
+        """
+        Builds the index from the match arrays of match_store in one pass, e.g. after a parallel build or a cache load
+        """
+        index = cls(match_store.stat_names)
+        player1, player2 = np.asarray(match_store.player1, dtype='q'), np.asarray(match_store.player2, dtype='q')
+        if not len(player1):
+            return index
+
+        low, high = np.minimum(player1, player2), np.maximum(player1, player2)
+        pair_keys = low * (int(max(player1.max(), player2.max())) + 1) + high
+        first_keys, first_pos, pair_slot = np.unique(pair_keys, return_index=True, return_inverse=True)
+
+        """
+        Slots are numbered by the first match of the pair, as in add_match
+        """
+        slot_order = np.argsort(first_pos, kind='stable')
+        renumber = np.empty_like(slot_order)
+        renumber[slot_order] = np.arange(len(slot_order))
+        pair_slot = renumber[pair_slot]
+        n_pairs = len(first_keys)
+
+        for slot, pos in enumerate(first_pos[slot_order].tolist()):
+            index.slots[(int(low[pos]), int(high[pos]))] = slot
+
+        matchidx = np.asarray(match_store.matchidx, dtype='q')
+        order = np.argsort(pair_slot, kind='stable')
+        index.matches = [to_array('q', np.ascontiguousarray(pair_matches))
+                         for pair_matches in np.split(matchidx[order], np.cumsum(np.bincount(pair_slot, minlength=n_pairs))[:-1])]
+
+        winner = np.where(np.asarray(match_store.winner_side) == 0, player1, player2)
+        index.wins_low = to_array('l', np.bincount(pair_slot, weights=winner == low, minlength=n_pairs).astype('l'))
+        index.wins_high = to_array('l', np.bincount(pair_slot, weights=winner == high, minlength=n_pairs).astype('l'))
+
+        sign = np.where(player1 == low, 1., -1.)
+        for statpos in range(len(index.stat_names)):
+            deltas = sign * (np.asarray(match_store.postmatch1[statpos]) - np.asarray(match_store.postmatch2[statpos]))
+            valid = ~np.isnan(deltas)
+            index.delta_sums[statpos] = to_array('d', np.bincount(pair_slot, weights=np.where(valid, deltas, 0.),
+                                                                  minlength=n_pairs))
+            index.delta_counts[statpos] = to_array('l', np.bincount(pair_slot, weights=valid,
+                                                                    minlength=n_pairs).astype('l'))
+
+        return index
+
+    def __len__(self):
+        return len(self.matches)
+
+    def add_match(self, matchidx, player_ids, winner_side, postmatch_values):
+        """
+        Same parameters as MatchStore.add_match, postmatch_values hold NaN for missing stats
+        """
+        low_side = 0 if player_ids[0] <= player_ids[1] else 1
+        pair = (player_ids[low_side], player_ids[1 - low_side])
+        slot = self.slots.get(pair)
+        if slot is None:
+            slot = len(self.matches)
+            self.slots[pair] = slot
+            self.matches.append(array('q'))
+            self.wins_low.append(0)
+            self.wins_high.append(0)
+            for statpos in range(len(self.stat_names)):
+                self.delta_sums[statpos].append(0.)
+                self.delta_counts[statpos].append(0)
+
+        self.matches[slot].append(matchidx)
+        if winner_side == low_side:
+            self.wins_low[slot] += 1
+        else:
+            self.wins_high[slot] += 1
+        for statpos in range(len(self.stat_names)):
+            delta = postmatch_values[low_side][statpos] - postmatch_values[1 - low_side][statpos]
+            if isnan(delta):
+                continue
+            self.delta_sums[statpos][slot] += delta
+            self.delta_counts[statpos][slot] += 1
+
+        return None
+
+    def lookup(self, player_id_a, player_id_b):
+        """
+        :return: slot of the pair (None if both never met) and True if player_id_a is the player with the lower id
+        """
+        if player_id_a <= player_id_b:
+            return self.slots.get((player_id_a, player_id_b)), True
+        return self.slots.get((player_id_b, player_id_a)), False
+
+    def record(self, player_id_a, player_id_b):
+        """
+        :return: {'matches': [matchidx, ...], 'wins': [wins of a, wins of b], 'deltas': {stat: mean of a - b}}.
+        Stats without values in the matches of the pair are left out.
+        """
+        slot, a_is_low = self.lookup(player_id_a, player_id_b)
+        if slot is None:
+            return {'matches': [], 'wins': [0, 0], 'deltas': {}}
+
+        sign = 1. if a_is_low else -1.
+        wins = [self.wins_low[slot], self.wins_high[slot]]
+        deltas = {}
+        for stat, sums, counts in zip(self.stat_names, self.delta_sums, self.delta_counts):
+            if counts[slot]:
+                deltas[stat] = sign * sums[slot] / counts[slot]
+
+        return {'matches': list(self.matches[slot]), 'wins': wins if a_is_low else wins[::-1], 'deltas': deltas}
+
+    def features(self, player_pairs):
+        """
+        :param player_pairs: sequence of (player_id_a, player_id_b), None for unknown players
+        :return: (len(player_pairs), 3 + len(stat_names)) array with the number of matches, the wins of a, the wins of b
+        and the mean differences a - b of every stat, NaN where the pair has no values
+        """
+        features = np.full((len(player_pairs), 3 + len(self.stat_names)), np.nan)
+        features[:, :3] = 0.
+
+        slots, signs, rows = [], [], []
+        for row, (player_id_a, player_id_b) in enumerate(player_pairs):
+            if player_id_a is None or player_id_b is None:
+                continue
+            slot, a_is_low = self.lookup(player_id_a, player_id_b)
+            if slot is not None:
+                slots.append(slot)
+                signs.append(1. if a_is_low else -1.)
+                rows.append(row)
+        if not rows:
+            return features
+
+        slots, signs, rows = np.asarray(slots), np.asarray(signs), np.asarray(rows)
+        wins_low, wins_high = np.asarray(self.wins_low)[slots], np.asarray(self.wins_high)[slots]
+        features[rows, 0] = wins_low + wins_high
+        features[rows, 1] = np.where(signs > 0, wins_low, wins_high)
+        features[rows, 2] = np.where(signs > 0, wins_high, wins_low)
+        for statpos in range(len(self.stat_names)):
+            counts = np.asarray(self.delta_counts[statpos])[slots]
+            sums = np.asarray(self.delta_sums[statpos])[slots]
+            features[rows, 3 + statpos] = np.where(counts > 0, signs * sums / np.maximum(counts, 1), np.nan)
+
+        return features
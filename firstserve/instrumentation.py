@@ -0,0 +1,146 @@
+import time
+import tracemalloc
+from collections import defaultdict
+from contextlib import contextmanager
+from functools import wraps
+
+
+"""
+Instrumentation of the PlayersDB builds.
+Instrumentation: progress callback, wall time and calls per stage, counters and optional cProfile / tracemalloc hooks.
+After every build (add_stats_from_csv, add_stats_from_rel_outcomes, append_matches, ...) the results are collected in a report:
+
+{'build': 'add_stats_from_csv', 'seconds': 1.2,
+ 'stages': {'parse scorelines': {'seconds': 0.1, 'calls': 2}, ...},
+ 'counters': {'chunks': 2, 'rows': 100000, 'matches': 98000, 'skipped': 2000, 'new players': 1500, ...},
+ 'quarantine': [{'row': 17, 'match': 17, 'reason': 'Scoreline cannot be read', 'Name_1': ..., ...}, ...],
+ 'peak memory MB': 45.1,    (only with trace_memory)
+ 'profile': pstats.Stats}   (only with profile)
+
+Without timers the stage timers are not started in the import loop, only the counters are updated once per chunk.
+The quarantine holds the rows skipped with 'OnBadRows': 'quarantine' (see PlayersDB.reject_row), with the reason.
+"""
+
+STAGES = ['parse scorelines', 'player creation', 'snapshot copy', 'stat updates', 'parallel chunks', 'parallel merge',
+          'cache', 'checkpoint', 'sqlite', 'jsonl']
+
+
+def print_progress(matchidx, counters):
+    """
+    Progress callback with the output of earlier versions: 'Importing match :  10000'
+    """
+    print('Importing match : ', matchidx)
+
+
+class Instrumentation:
+    def __init__(self, progress=None, progress_every=10000, timers=False, profile=False, trace_memory=False):
+        """
+        :param progress: function called with (matchidx, counters) for every match index divisible by progress_every,
+        e.g. print_progress. No progress output by default.
+        :param progress_every: see progress
+        :param timers: measure the wall time and the calls of every stage of the import loop
+        :param profile: run every build under cProfile, the pstats.Stats are stored in the report
+        :param trace_memory: trace the peak memory of every build with tracemalloc
+        """
+        self.progress = progress
+        self.progress_every = progress_every
+        self.timers = timers
+        self.profile = profile
+        self.trace_memory = trace_memory
+
+        self.report = None
+        self.depth = 0
+        self.reset()
+
+    def reset(self):
+        self.seconds = defaultdict(float)
+        self.calls = defaultdict(int)
+        self.counters = defaultdict(int)
+        self.quarantined = []
+        return None
+
+    def add_time(self, stage, seconds, calls=1):
+        self.seconds[stage] += seconds
+        self.calls[stage] += calls
+        return None
+
+    def count(self, counter, number=1):
+        self.counters[counter] += number
+        return None
+
+    def quarantine(self, record):
+        """
+        Stores a bad row of the build, see PlayersDB.reject_row
+        """
+        self.quarantined.append(record)
+        self.counters['quarantined'] += 1
+        return None
+
+    @contextmanager
+    def stage(self, stage):
+        """
+        Times one call of a stage, for stages that run once per chunk. Only timed with timers.
+        """
+        if not self.timers:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(stage, time.perf_counter() - start)
+
+    @contextmanager
+    def build(self, name):
+        """
+        Wraps a build of PlayersDB. Builds calling other builds (e.g. add_stats_from_csv -> add_stats_parallel)
+        give one report, named after the outermost build.
+        """
+        if self.depth > 0:
+            self.depth += 1
+            try:
+                yield
+            finally:
+                self.depth -= 1
+            return
+
+        self.reset()
+        self.depth = 1
+        profiler = None
+        if self.profile:
+            import cProfile
+            profiler = cProfile.Profile()
+        if self.trace_memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        if profiler is not None:
+            profiler.enable()
+        try:
+            yield
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            seconds = time.perf_counter() - start
+            self.depth = 0
+
+            self.report = {'build': name, 'seconds': seconds,
+                           'stages': {stage: {'seconds': self.seconds[stage], 'calls': self.calls[stage]}
+                                      for stage in STAGES if self.calls[stage]},
+                           'counters': dict(self.counters), 'quarantine': list(self.quarantined)}
+            if self.trace_memory:
+                self.report['peak memory MB'] = tracemalloc.get_traced_memory()[1] / 1e6
+                tracemalloc.stop()
+            if profiler is not None:
+                import pstats
+                self.report['profile'] = pstats.Stats(profiler)
+
+
+def instrumented_build(build_method):
+    """
+    Decorator of the build methods of PlayersDB: the build runs inside self.instrumentation.build
+    """
+    @wraps(build_method)
+    def instrumented(self, *args, **kwargs):
+        with self.instrumentation.build(build_method.__name__):
+            return build_method(self, *args, **kwargs)
+    return instrumented
@@ -0,0 +1,286 @@
+from array import array
+from itertools import islice
+import json
+from math import isnan
+import os
+from pathlib import Path
+import numpy as np
+from .playertable import restore_stats
+from .utils_extract_data import NO_DATE
+
+
+"""
+JSON Lines export of a database, one record per line, written while the matches are imported
+(top-level 'export_jsonl: True' in the config, see PlayersDB.open_jsonl):
+
+<save directory>/jsonl/matches.jsonl   {"matchidx": 0, "date": "2015-01-05", "prematch": ..., "postmatch": ..., "winner": ...}
+<save directory>/jsonl/players.jsonl   {"player": "Federer R.", "stats": {...}}
+
+Every file has an offset index next to it (<name>.offsets.npy with the start of every record and the end of the file,
+<name>.keys.npy or <name>.keys.json with the match index / player of every record), so JsonLinesReader reads single records
+without parsing the rest of the file. The matches are appended to matches.jsonl chunk by chunk. players.jsonl is written
+at the end of every build. An append only adds the new records of the players of its matches to the end of players.jsonl,
+so the last record of a player holds their current stats (see JsonLinesReader.get), until the file holds twice as many
+records as players and is written again (see PlayersDB.export_players).
+An export of a cached database is marked with the cache key (<name>.source), so a later load of the same cache keeps it
+instead of exporting all matches again (see PlayersDB.export_match_store).
+"""
+
+
+def index_paths(path):
+    path = Path(path)
+    return path.with_name(path.name + '.offsets.npy'), path.with_name(path.name + '.keys.npy'), \
+        path.with_name(path.name + '.keys.json')
+
+
+def save_index(path, offsets, keys):
+    """
+    Writes the offset index of the JSON Lines file path. Integer keys are stored as .npy, other keys as .json.
+    """
+    offsets_path, keys_npy_path, keys_json_path = index_paths(path)
+    integer_keys = all(isinstance(key, int) for key in keys)
+    keys_path = keys_npy_path if integer_keys else keys_json_path
+    for stale_path in [keys_npy_path, keys_json_path]:
+        if stale_path != keys_path and stale_path.exists():
+            stale_path.unlink()
+
+    """
+    The keys are written before the offsets, the offsets are only read with keys of the same length (see load_index)
+    """
+    if integer_keys:
+        with open(keys_path.with_name(keys_path.name + '.tmp'), 'wb') as keys_file:
+            np.save(keys_file, np.asarray(keys, dtype='q'))
+    else:
+        with open(keys_path.with_name(keys_path.name + '.tmp'), 'w') as keys_file:
+            json.dump(list(keys), keys_file)
+    os.replace(keys_path.with_name(keys_path.name + '.tmp'), keys_path)
+    with open(offsets_path.with_name(offsets_path.name + '.tmp'), 'wb') as offsets_file:
+        np.save(offsets_file, np.asarray(offsets, dtype='q'))
+    os.replace(offsets_path.with_name(offsets_path.name + '.tmp'), offsets_path)
+    return None
+
+
+def source_path(path):
+    path = Path(path)
+    return path.with_name(path.name + '.source')
+
+
+def load_source(path):
+    """
+    :return: source of the JSON Lines file path (e.g. the cache key of the exported database), None if it has none
+    """
+    try:
+        return source_path(path).read_text()
+    except OSError:
+        return None
+
+
+def save_source(path, source):
+    """
+    Marks the JSON Lines file path with source, None removes the mark, e.g. before the file is changed
+    """
+    if source is None:
+        if source_path(path).exists():
+            source_path(path).unlink()
+        return None
+    source_path(path).write_text(source)
+    return None
+
+
+def load_index(path):
+    """
+    :return: offsets and keys of the JSON Lines file path, None if there is no complete index
+    """
+    offsets_path, keys_npy_path, keys_json_path = index_paths(path)
+    if not offsets_path.is_file():
+        return None
+    offsets = np.load(offsets_path, mmap_mode='r')
+    if keys_npy_path.is_file():
+        keys = np.load(keys_npy_path, mmap_mode='r')
+    elif keys_json_path.is_file():
+        with open(keys_json_path) as keys_file:
+            keys = json.load(keys_file)
+    else:
+        return None
+    if len(offsets) != len(keys) + 1:
+        return None
+    return offsets, keys
+
+
+def match_record(matchidx, day, match):
+    """
+    :param matchidx: index of the match
+    :param day: date of the match as days since 1970-01-01, NO_DATE if there is none
+    :param match: match in the format of the MatchStore, {'prematch': ..., 'postmatch': ..., 'winner': ...}
+    """
+    date = None if day == NO_DATE else str(np.datetime64(int(day), 'D'))
+    return dict({'matchidx': int(matchidx), 'date': date}, **match)
+
+
+def row_match(player_names, winner_side, layout, prematch_rows, stat_names, postmatch_values):
+    """
+    Match in the format of the MatchStore from the stored values of both players before the match (see PlayerTable.row)
+    and their match stats, stats missing in the dataset are left out
+    """
+    return {'prematch': {player: restore_stats(layout, row) for player, row in zip(player_names, prematch_rows)},
+            'postmatch': {player: {stat: value for stat, value in zip(stat_names, values) if not isnan(value)}
+                          for player, values in zip(player_names, postmatch_values)},
+            'winner': player_names[winner_side]}
+
+
+class JsonLinesWriter:
+    def __init__(self, path, key, append=False):
+        """
+        :param path: JSON Lines file, the directory is created if it does not exist
+        :param key: field of the records that is their key in the index, e.g. 'matchidx'
+        :param append: add records to the end of an existing file. Records after the last saved index (e.g. of an
+        interrupted build) are removed. A new file by default.
+        """
+        self.path = Path(path)
+        self.key = key
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        index = load_index(self.path) if append and self.path.is_file() else None
+        if index is None:
+            self.offsets, self.keys = array('q', [0]), []
+            self.file = open(self.path, 'wb')
+            save_index(self.path, self.offsets, self.keys)
+        else:
+            offsets, keys = index
+            self.offsets = array('q', np.asarray(offsets, dtype='q').tobytes())
+            self.keys = keys.tolist() if isinstance(keys, np.ndarray) else list(keys)
+            self.file = open(self.path, 'r+b')
+            self.file.truncate(self.offsets[-1])
+            self.file.seek(self.offsets[-1])
+
+        """
+        Lines written since the last flush
+        """
+        self.lines = []
+
+    def write(self, record):
+        line = (json.dumps(record) + '\n').encode()
+        self.lines.append(line)
+        self.keys.append(record[self.key])
+        self.offsets.append(self.offsets[-1] + len(line))
+        return None
+
+    def flush(self):
+        """
+        Writes the buffered lines at once
+        """
+        if self.lines:
+            self.file.write(b''.join(self.lines))
+            self.file.flush()
+            self.lines = []
+        return None
+
+    def save_index(self):
+        self.flush()
+        save_index(self.path, self.offsets, self.keys)
+        return None
+
+    def drop_from(self, key):
+        """
+        Removes the records from the first record with a key of at least key, e.g. matches imported after a checkpoint
+        """
+        self.flush()
+        position = next((position for position, record_key in enumerate(self.keys) if record_key >= key), len(self.keys))
+        self.keys, self.offsets = self.keys[:position], self.offsets[:position + 1]
+        self.file.truncate(self.offsets[-1])
+        self.file.seek(self.offsets[-1])
+        return None
+
+    def __len__(self):
+        return len(self.keys)
+
+    def close(self):
+        self.save_index()
+        self.file.close()
+        return None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+
+def write_jsonl(path, key, records):
+    """
+    Writes the records to a new JSON Lines file with its index
+    """
+    with JsonLinesWriter(path, key) as writer:
+        for record in records:
+            writer.write(record)
+            if len(writer.lines) >= 10000:
+                writer.flush()
+    return None
+
+
+class JsonLinesReader:
+    def __init__(self, path):
+        """
+        Lazy reader of a JSON Lines file written by JsonLinesWriter. Records are only parsed when they are read.
+        Without an index (or with an index of another length of the file) the offsets are found by reading the lines once,
+        and the keys (the first field of every record) by parsing every record at the first get.
+        """
+        self.path = Path(path)
+        self.file = open(self.path, 'rb')
+        index = load_index(self.path)
+        if index is not None and int(index[0][-1]) == os.path.getsize(self.path):
+            self.offsets, self.keys = index
+        else:
+            offsets = [0]
+            for line in self.file:
+                offsets.append(offsets[-1] + len(line))
+            self.offsets, self.keys = np.asarray(offsets, dtype='q'), None
+        self.positions = None
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def record(self, position):
+        """
+        :return: record at position (0 for the first line)
+        """
+        if not -len(self) <= position < len(self):
+            raise IndexError(position)
+        position %= len(self)
+        self.file.seek(int(self.offsets[position]))
+        return json.loads(self.file.read(int(self.offsets[position + 1] - self.offsets[position])))
+
+    def __getitem__(self, position):
+        return self.record(position)
+
+    def get(self, key):
+        """
+        :return: record with key, e.g. a match index or a player, the last one if there are several (players.jsonl after
+        appends). Raises a KeyError for unknown keys.
+        """
+        if self.positions is None:
+            if self.keys is None:
+                self.keys = [next(iter(record.values())) for record in self]
+            self.positions = {record_key: position for position, record_key in enumerate(
+                self.keys.tolist() if isinstance(self.keys, np.ndarray) else self.keys)}
+        return self.record(self.positions[key])
+
+    def __iter__(self):
+        """
+        Records in the order of the file, one line at a time
+        """
+        with open(self.path, 'rb') as lines:
+            for line in islice(lines, len(self)):
+                yield json.loads(line)
+
+    def close(self):
+        self.file.close()
+        return None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
@@ -0,0 +1,148 @@
+from bisect import bisect_left, insort
+import numpy as np
+from .playertable import count_offset
+
+
+"""
+Top-k leaderboards of the player stats, declared in players_settings:
+
+'leaderboards': {'min_matches': [0, 100]}
+
+For every stat of the players template and every threshold of 'min_matches' a sorted index of the players with at least
+that many matches ('Number of Matches') is kept. Stats with more entries are ranked by their first entry (the mean,
+the Glicko-2 rating), stats with a count (e.g. [mean, count] or the [mean, variance, count] aggregators, see
+playertable.count_offset) only for the players with values.
+
+The import loop only marks the players of every match as changed (see PlayersDB.add_matches_chunk). The next query
+moves the changed players in the sorted indexes, or sorts an index again if most players have changed, so a top-k query
+reads k entries instead of scanning all players.
+"""
+
+
+class StatLeaderboard:
+    def __init__(self, players_table, stat, min_matches):
+        """
+        Players with at least min_matches matches, sorted by stat (highest first, ties by name)
+        """
+        self.table = players_table
+        self.stat = stat
+        self.min_matches = min_matches
+        self.slot = players_table.slots[stat]
+        count_entry = count_offset(dict(players_table.layout)[stat])
+        self.count_slot = None if count_entry is None else self.slot + count_entry
+
+        """
+        keys: sorted (-value, player) of all ranked players, entries: key of every ranked player id
+        """
+        self.keys = []
+        self.entries = {}
+
+    def key(self, player_id):
+        """
+        :return: (-value, player) of a player, None if the player is not ranked
+        """
+        columns = self.table.columns
+        if self.min_matches and columns[self.table.matches_slot][player_id] < self.min_matches:
+            return None
+        if self.count_slot is not None and columns[self.count_slot][player_id] == 0:
+            return None
+        return -columns[self.slot][player_id], self.table.registry.names[player_id]
+
+    def rebuild(self):
+        n_players = len(self.table)
+        values = np.asarray(self.table.columns[self.slot][:n_players], dtype='d')
+        ranked = np.ones(n_players, dtype=bool)
+        if self.min_matches:
+            ranked &= np.asarray(self.table.columns[self.table.matches_slot][:n_players], dtype='d') >= self.min_matches
+        if self.count_slot is not None:
+            ranked &= np.asarray(self.table.columns[self.count_slot][:n_players], dtype='d') != 0
+
+        player_ids = np.flatnonzero(ranked).tolist()
+        names = self.table.registry.names
+        keys = [(-value, names[player_id]) for value, player_id in zip(values[ranked].tolist(), player_ids)]
+        self.entries = dict(zip(player_ids, keys))
+        self.keys = sorted(keys)
+        return None
+
+    def update(self, player_id):
+        old_key, new_key = self.entries.get(player_id), self.key(player_id)
+        if old_key == new_key:
+            return None
+        if old_key is not None:
+            del self.keys[bisect_left(self.keys, old_key)]
+            del self.entries[player_id]
+        if new_key is not None:
+            insort(self.keys, new_key)
+            self.entries[player_id] = new_key
+        return None
+
+    def top(self, k, min_matches):
+        """
+        :return: [(player, value), ...] of the k best players with at least min_matches (>= self.min_matches) matches
+        """
+        if min_matches <= self.min_matches:
+            return [(player, -value) for value, player in self.keys[:k]]
+
+        matches, player_ids = self.table.columns[self.table.matches_slot], self.table.registry.ids
+        leaders = []
+        for value, player in self.keys:
+            if len(leaders) == k:
+                break
+            if matches[player_ids[player]] >= min_matches:
+                leaders.append((player, -value))
+        return leaders
+
+
+class Leaderboards:
+    def __init__(self, players_table, thresholds):
+        """
+        :param players_table: PlayerTable of the ranked players
+        :param thresholds: minimum numbers of matches with an index, e.g. [0, 100]
+        All indexes are sorted at the first query.
+        """
+        assert not any(thresholds) or players_table.matches_slot is not None, \
+            "Leaderboards with min_matches need 'Number of Matches' in the players template."
+        self.table = players_table
+        self.thresholds = sorted(set(thresholds))
+        self.boards = {(stat, min_matches): StatLeaderboard(players_table, stat, min_matches)
+                       for stat, _ in players_table.layout for min_matches in self.thresholds}
+
+        """
+        Ids of the players changed since the last query, None if all indexes have to be sorted again
+        """
+        self.changed = None
+
+    def mark_changed(self, player_ids):
+        if self.changed is not None:
+            self.changed.update(player_ids)
+        return None
+
+    def mark_all_changed(self):
+        self.changed = None
+        return None
+
+    def refresh(self):
+        """
+        Brings all indexes up to date with the changed players. If more than an eighth of the players changed,
+        sorting again is cheaper than moving them one by one.
+        """
+        if self.changed is not None and len(self.changed) <= len(self.table) // 8:
+            for board in self.boards.values():
+                for player_id in self.changed:
+                    board.update(player_id)
+        elif self.changed is None or self.changed:
+            for board in self.boards.values():
+                board.rebuild()
+        self.changed = set()
+        return None
+
+    def top(self, stat, k, min_matches=0):
+        """
+        :return: [(player, value), ...] of the k best players by stat with at least min_matches matches, from the index
+        with the largest threshold up to min_matches. None if there is no such index.
+        """
+        thresholds = [threshold for threshold in self.thresholds if threshold <= min_matches]
+        if not thresholds or (stat, thresholds[-1]) not in self.boards:
+            return None
+        self.refresh()
+        return self.boards[(stat, thresholds[-1])].top(k, min_matches)
@@ -0,0 +1,255 @@
+from array import array
+from bisect import bisect_left
+from collections.abc import Mapping
+from math import isnan
+import numpy as np
+from .headtohead import HeadToHeadIndex
+from .playertable import restore_stats, to_array
+from .utils_extract_data import NO_DATE
+
+
+"""
+Compact storage of the match database.
+MatchStore: read-only dictionary view {matchidx: {'prematch': ..., 'postmatch': ..., 'winner': ...}} of matches stored in arrays
+"""
+
+"""
+Typecodes of the per-match arrays of a MatchStore. Dates are stored as days since 1970-01-01, see parse_match_dates.
+"""
+MATCH_COLUMNS = {'matchidx': 'q', 'player1': 'l', 'player2': 'l', 'winner_side': 'b', 'offset1': 'l', 'offset2': 'l',
+                 'date': 'q'}
+
+
+def ascending_dates(history):
+    """
+    :param history: dates of the matches of a player in the order of the matches, NO_DATE where it is missing
+    :return: the latest date up to every match (see MatchStore.player_history) and True if a dated match is dated
+    before one of the matches before it
+    """
+    history = np.asarray(history, dtype='q')
+    history_dates = np.maximum.accumulate(history) if len(history) else history
+    return history_dates, bool(np.any((history != NO_DATE) & (history != history_dates)))
+
+
+class MatchStore(Mapping):
+    def __init__(self, players_table, stat_names):
+        """
+        :param players_table: PlayerTable of the players. The store uses the same player ids and stat layout.
+        :param stat_names: names of the match stats stored for both players after a match, e.g. ['FirstServePCT', ...]
+
+        The player stats before a match ('prematch') are not copied per match. Every player has one array-backed time series
+        of their stats, a new entry is appended to it for every match they play. A match only keeps the offsets into both series.
+        """
+        self.registry = players_table.registry
+        self.layout = players_table.layout
+        self.stat_names = list(stat_names)
+        self.stride = players_table.stride
+
+        self.series = []
+
+        for name, typecode in MATCH_COLUMNS.items():
+            setattr(self, name, array(typecode))
+        self.postmatch1 = [array('d') for _ in self.stat_names]
+        self.postmatch2 = [array('d') for _ in self.stat_names]
+
+        """
+        Time index of every player: match indices and dates of their matches, in the order of their snapshot series.
+        None if it has to be built from the match arrays first (see player_history).
+        unordered_dates: ids of the players with a match dated before one of their earlier matches
+        """
+        self.player_matchidx = []
+        self.player_dates = []
+        self.unordered_dates = set()
+
+        """
+        Head-to-head index of all pairs of players, None if it has to be built from the match arrays first (see head_to_head)
+        """
+        self.head_to_head_index = HeadToHeadIndex(self.stat_names)
+
+    def make_writable(self):
+        """
+        Arrays loaded from a cache are read-only memory maps, they are copied into arrays before matches are added
+        """
+        for name, typecode in MATCH_COLUMNS.items():
+            setattr(self, name, to_array(typecode, getattr(self, name)))
+        self.postmatch1 = [to_array('d', column) for column in self.postmatch1]
+        self.postmatch2 = [to_array('d', column) for column in self.postmatch2]
+        self.series = [to_array('d', series) for series in self.series]
+        if self.player_matchidx is not None:
+            self.player_matchidx = [to_array('q', history) for history in self.player_matchidx]
+            self.player_dates = [to_array('q', history) for history in self.player_dates]
+        return None
+
+    def record_snapshot(self, player_id, player_row):
+        """
+        Appends the current stats of a player (see PlayerTable.row) to their series.
+        :return: offset of the snapshot in the series of the player
+        """
+        while len(self.series) <= player_id:
+            self.series.append(array('d'))
+        series = self.series[player_id]
+        offset = len(series) // self.stride
+        series.extend(player_row)
+        return offset
+
+    def snapshot(self, player_id, offset):
+        """
+        Returns the stats of a player stored at offset as a new dictionary in the format of the template
+        """
+        slot = offset * self.stride
+        return restore_stats(self.layout, self.series[player_id][slot:slot + self.stride])
+
+    def add_match(self, matchidx, player_ids, winner_side, prematch_rows, postmatch_values, date=NO_DATE):
+        """
+        :param matchidx: index of the match, has to be larger than all stored match indices
+        :param player_ids: ids of ['Name_1', 'Name_2'] of the match
+        :param winner_side: 0 if 'Name_1' won, 1 if 'Name_2' won
+        :param prematch_rows: stats of both players before the match (see PlayerTable.row), in the order of player_ids
+        :param postmatch_values: two lists with the match stats of both players in the order of stat_names, NaN if missing
+        :param date: days since 1970-01-01
+        """
+        if self.matchidx and matchidx <= self.matchidx[-1]:
+            raise ValueError(f"Match index {matchidx} is already stored, matches have to be added in ascending order.")
+
+        self.matchidx.append(matchidx)
+        self.player1.append(player_ids[0])
+        self.player2.append(player_ids[1])
+        self.winner_side.append(winner_side)
+        self.offset1.append(self.record_snapshot(player_ids[0], prematch_rows[0]))
+        self.offset2.append(self.record_snapshot(player_ids[1], prematch_rows[1]))
+        self.date.append(date)
+        for statpos in range(len(self.stat_names)):
+            self.postmatch1[statpos].append(postmatch_values[0][statpos])
+            self.postmatch2[statpos].append(postmatch_values[1][statpos])
+
+        if self.player_matchidx is not None:
+            for player_id in player_ids:
+                while len(self.player_matchidx) <= player_id:
+                    self.player_matchidx.append(array('q'))
+                    self.player_dates.append(array('q'))
+                self.player_matchidx[player_id].append(matchidx)
+                history_dates = self.player_dates[player_id]
+                if history_dates and date < history_dates[-1]:
+                    if date != NO_DATE:
+                        self.unordered_dates.add(player_id)
+                    history_dates.append(history_dates[-1])
+                else:
+                    history_dates.append(date)
+
+        if self.head_to_head_index is not None:
+            self.head_to_head_index.add_match(matchidx, player_ids, winner_side, postmatch_values)
+
+        return None
+
+    def add_matches_bulk(self, matchidx, player_ids, winner_side, offsets, postmatch, series_blocks, dates):
+        """
+        Adds many matches at once to an empty store, from numpy arrays (see parallel.build_parallel)
+        :param matchidx: (n,) ascending match indices
+        :param player_ids: (n, 2) ids of 'Name_1' and 'Name_2'
+        :param winner_side: (n,) 0 if 'Name_1' won, 1 if 'Name_2' won
+        :param offsets: (n, 2) offsets of the prematch snapshots in the series of both players
+        :param postmatch: (n, 2, len(stat_names)) match stats of both players, NaN if missing
+        :param series_blocks: one (snapshots, stride) array per player id with the snapshot series of the player
+        :param dates: (n,) days since 1970-01-01
+        """
+        assert len(self) == 0, "Matches can only be added in bulk to an empty store."
+
+        columns = {'matchidx': matchidx, 'player1': player_ids[:, 0], 'player2': player_ids[:, 1],
+                   'winner_side': winner_side, 'offset1': offsets[:, 0], 'offset2': offsets[:, 1], 'date': dates}
+        for name, typecode in MATCH_COLUMNS.items():
+            setattr(self, name, to_array(typecode, np.ascontiguousarray(columns[name], dtype=typecode)))
+        for statpos in range(len(self.stat_names)):
+            self.postmatch1[statpos] = to_array('d', np.ascontiguousarray(postmatch[:, 0, statpos]))
+            self.postmatch2[statpos] = to_array('d', np.ascontiguousarray(postmatch[:, 1, statpos]))
+        self.series = [to_array('d', np.ascontiguousarray(block).reshape(-1)) for block in series_blocks]
+        self.player_matchidx, self.player_dates = None, None
+        self.head_to_head_index = None
+
+        return None
+
+    def player_history(self, player_id):
+        """
+        :return: match indices and dates of all matches of a player, in the order of their snapshots.
+        Snapshot k of a player holds their stats after their first k matches.
+        The dates are the latest date up to every match, so a match without a date has the date of the match before it
+        (NO_DATE before the first dated match) and the dates ascend for the bisection. Players with matches dated before
+        one of their earlier matches are in unordered_dates.
+        For stores filled in bulk or loaded from the cache the time index is built here from the match arrays, once.
+        """
+        if self.player_matchidx is None:
+            player_ids = np.concatenate([np.asarray(self.player1), np.asarray(self.player2)])
+            offsets = np.concatenate([np.asarray(self.offset1), np.asarray(self.offset2)])
+            matchidx = np.tile(np.asarray(self.matchidx), 2)
+            dates = np.tile(np.asarray(self.date), 2)
+            order = np.lexsort((offsets, player_ids))
+            counts = np.bincount(player_ids, minlength=len(self.series))
+            bounds = np.cumsum(counts)[:-1]
+            self.player_matchidx = [to_array('q', np.ascontiguousarray(history))
+                                    for history in np.split(matchidx[order], bounds)]
+            self.player_dates, self.unordered_dates = [], set()
+            for player_id, history in enumerate(np.split(dates[order], bounds)):
+                history_dates, unordered = ascending_dates(history)
+                if unordered:
+                    self.unordered_dates.add(player_id)
+                self.player_dates.append(to_array('q', np.ascontiguousarray(history_dates)))
+
+        if player_id >= len(self.player_matchidx):
+            return array('q'), array('q')
+        return self.player_matchidx[player_id], self.player_dates[player_id]
+
+    def head_to_head(self):
+        """
+        :return: HeadToHeadIndex of the store. For stores filled in bulk or loaded from the cache it is built here, once.
+        """
+        if self.head_to_head_index is None:
+            self.head_to_head_index = HeadToHeadIndex.from_match_store(self)
+        return self.head_to_head_index
+
+    def match_date(self, matchidx):
+        """
+        Date of a match as days since 1970-01-01, NO_DATE if the dataset has no date for it
+        """
+        return int(self.date[self.position(matchidx)])
+
+    def position(self, matchidx):
+        """
+        Position of matchidx in the arrays, found by bisection. Raises a KeyError for unknown matches.
+        """
+        matchpos = bisect_left(self.matchidx, matchidx)
+        if matchpos == len(self.matchidx) or self.matchidx[matchpos] != matchidx:
+            raise KeyError(matchidx)
+        return matchpos
+
+    def postmatch(self, postmatch_columns, matchpos):
+        """
+        Match stats of one player, stats missing in the dataset are left out
+        """
+        postmatch_stats = {}
+        for stat, column in zip(self.stat_names, postmatch_columns):
+            if not isnan(column[matchpos]):
+                postmatch_stats[stat] = column[matchpos]
+        return postmatch_stats
+
+    def __getitem__(self, matchidx):
+        matchpos = self.position(matchidx)
+        player1, player2 = self.player1[matchpos], self.player2[matchpos]
+        name1, name2 = self.registry.names[player1], self.registry.names[player2]
+
+        return {'prematch': {name1: self.snapshot(player1, self.offset1[matchpos]),
+                             name2: self.snapshot(player2, self.offset2[matchpos])},
+                'postmatch': {name1: self.postmatch(self.postmatch1, matchpos),
+                              name2: self.postmatch(self.postmatch2, matchpos)},
+                'winner': [name1, name2][self.winner_side[matchpos]]}
+
+    def __contains__(self, matchidx):
+        matchpos = bisect_left(self.matchidx, matchidx)
+        return matchpos < len(self.matchidx) and self.matchidx[matchpos] == matchidx
+
+    def __iter__(self):
+        return map(int, self.matchidx)
+
+    def __reversed__(self):
+        return map(int, reversed(self.matchidx))
+
+    def __len__(self):
+        return len(self.matchidx)
@@ -0,0 +1,285 @@
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import sys
+import numpy as np
+from .instrumentation import Instrumentation
+from .playertable import to_array
+from .utils_extract_data import parse_scorelines, find_bad_rows, QUARANTINE_COLUMNS, SCORE_SKIPPED
+
+
+"""
+Parallel build of a database from mergeable accumulators.
+The stats of a player after n matches only depend on sums over these matches: number of matches, wins and, for every
+[mean, count] stat, the sum and the count of the match values. Every worker computes these sums for one chunk of matches
+(per player in total, and per match as prefix sum over the earlier matches of the chunk). Adding the totals of all earlier
+chunks gives the stats before every match, so the snapshots do not depend on the order in which the workers finish.
+
+Accumulator columns: 0 matches, 1 wins, then sum and count of every stat of stats_dict.
+"""
+
+
+def project_chunk(matches_dict, statkeys, dates):
+    """
+    Only the columns needed for the stats are sent to the workers, as plain lists.
+    dates: days since 1970-01-01 of the matches, see PlayersDB.match_dates
+    """
+    rows = list(matches_dict['ID'])
+    columns = {'row': rows, 'date': dates}
+    for col in ['Name_1', 'Name_2', 'Result_CUR_1', 'Result_CUR_2'] + [statkey + playeridx for statkey in statkeys
+                                                                      for playeridx in ['1', '2']]:
+        columns[col] = [matches_dict[col][rowidx] for rowidx in rows]
+    return columns
+
+
+def exclusive_group_cumsum(groups, values):
+    """
+    :param groups: group id of every row
+    :param values: 2d array, one row per entry of groups
+    :return: sum of values over the earlier rows of the same group, and the rank of every row within its group
+    """
+    order = np.argsort(groups, kind='stable')
+    sorted_values = values[order]
+    cumsum = np.cumsum(sorted_values, axis=0)
+
+    sorted_groups = groups[order]
+    starts = np.flatnonzero(np.r_[True, sorted_groups[1:] != sorted_groups[:-1]])
+    group_start = starts[np.searchsorted(starts, np.arange(len(groups)), side='right') - 1]
+    before_group = np.where((group_start > 0)[:, None], cumsum[np.maximum(group_start - 1, 0)], 0.)
+
+    exclusive, rank = np.empty_like(values), np.empty(len(groups), dtype='q')
+    exclusive[order] = cumsum - sorted_values - before_group
+    rank[order] = np.arange(len(groups)) - group_start
+
+    return exclusive, rank
+
+
+def partial_accumulators(columns, statkeys, match_formats, match_outcomes):
+    """
+    Worker function: parses one chunk and returns its accumulators.
+    Players are numbered by their first appearance in the chunk (winner before loser), see PlayersDB.add_matches_chunk.
+    Bad rows (see find_bad_rows) are left out and returned with their reason, the caller decides whether to stop.
+    """
+    winner_idx, _, _ = parse_scorelines(columns['Result_CUR_1'], columns['Result_CUR_2'], match_formats, match_outcomes)
+
+    stat_columns = [[columns[statkey + playeridx] for statkey in statkeys] for playeridx in ['1', '2']]
+    bad_rows = find_bad_rows(winner_idx, columns['Name_1'], columns['Name_2'],
+                             [column for side_columns in stat_columns for column in side_columns])
+    bad_records = [dict({'row': columns['row'][matchpos], 'match': columns['row'][matchpos], 'reason': reason},
+                        **{col: columns[col][matchpos] for col in QUARANTINE_COLUMNS})
+                   for matchpos, reason in bad_rows.items()]
+    if bad_rows:
+        winner_idx[list(bad_rows)] = SCORE_SKIPPED
+
+    keep = np.flatnonzero(winner_idx >= 0)
+    winner_side = winner_idx[keep]
+
+    names, local_ids = [], {}
+    player_ids = np.empty((len(keep), 2), dtype='q')
+    for matchnum, (matchpos, side) in enumerate(zip(keep.tolist(), winner_side.tolist())):
+        for playerside in [side, 1 - side]:
+            player = columns['Name_' + str(playerside + 1)][matchpos]
+            if player not in local_ids:
+                local_ids[player] = len(names)
+                names.append(player)
+            player_ids[matchnum, playerside] = local_ids[player]
+
+    if bad_rows:
+        """
+        Stat values that are not numbers can only be converted without the bad rows
+        """
+        keep_list = keep.tolist()
+        stat_columns = [[[column[matchpos] for matchpos in keep_list] for column in side_columns]
+                        for side_columns in stat_columns]
+        postmatch = np.array(stat_columns, dtype='d').reshape(2, len(statkeys), -1).transpose(2, 0, 1)
+    else:
+        postmatch = np.array(stat_columns, dtype='d').reshape(2, len(statkeys), -1)[:, :, keep].transpose(2, 0, 1)
+
+    """
+    One accumulator row per match and player, in the order (match, 'Name_1'), (match, 'Name_2'), ...
+    """
+    won = np.zeros((len(keep), 2))
+    won[np.arange(len(keep)), winner_side] = 1.
+    valid = ~np.isnan(postmatch)
+    increments = np.empty((len(keep), 2, 2 + 2 * len(statkeys)))
+    increments[:, :, 0] = 1.
+    increments[:, :, 1] = won
+    increments[:, :, 2::2] = np.where(valid, postmatch, 0.)
+    increments[:, :, 3::2] = valid
+    increments = increments.reshape(2 * len(keep), -1)
+
+    player_ids = player_ids.reshape(-1)
+    prefix, rank = exclusive_group_cumsum(player_ids, increments)
+    totals = np.zeros((len(names), increments.shape[1]))
+    np.add.at(totals, player_ids, increments)
+
+    return {'n_rows': len(columns['row']), 'rows': np.asarray(columns['row'], dtype='q')[keep], 'dates': np.asarray(columns['date'], dtype='q')[keep],
+            'winner_side': winner_side, 'names': names, 'player_ids': player_ids, 'postmatch': postmatch, 'prefix': prefix, 'rank': rank, 'totals': totals,
+            'bad_rows': bad_records}
+
+
+def iter_partial_accumulators(matches_chunks, statkeys, match_dates, match_formats, match_outcomes, workers):
+    """
+    Yields the accumulators of the chunks in the order of the chunks. At most 2 * workers chunks are in flight,
+    so the chunks are still read lazily.
+    match_dates: function returning the dates of the rows of a matches dictionary, see PlayersDB.match_dates
+    """
+    if workers <= 1:
+        for matches_dict in matches_chunks:
+            yield partial_accumulators(project_chunk(matches_dict, statkeys, match_dates(matches_dict)), statkeys,
+                                       match_formats, match_outcomes)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for matches_dict in matches_chunks:
+            pending.append(executor.submit(partial_accumulators,
+                                           project_chunk(matches_dict, statkeys, match_dates(matches_dict)), statkeys,
+                                           match_formats, match_outcomes))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def stat_rows(players_table, stat_slots, accumulators, start_accumulators, start_rows):
+    """
+    :return: rows of players_table (see PlayerTable.row) for the given accumulators.
+    Values of players without new matches or stat values are taken from start_rows, as in the serial build.
+    """
+    rows = start_rows.copy()
+    matches, wins = accumulators[:, 0], accumulators[:, 1]
+    new_matches = matches > start_accumulators[:, 0]
+    if players_table.matches_slot is not None:
+        rows[:, players_table.matches_slot] = matches
+    if players_table.wins_slot is not None:
+        rows[:, players_table.wins_slot] = wins
+    if players_table.winrate_slot is not None:
+        rows[:, players_table.winrate_slot] = np.where(new_matches, wins / np.maximum(matches, 1.),
+                                                       start_rows[:, players_table.winrate_slot])
+    for statpos, slot in enumerate(stat_slots):
+        sums, counts = accumulators[:, 2 + 2 * statpos], accumulators[:, 3 + 2 * statpos]
+        new_values = counts > start_accumulators[:, 3 + 2 * statpos]
+        rows[:, slot] = np.where(new_values, sums / np.maximum(counts, 1.), start_rows[:, slot])
+        rows[:, slot + 1] = counts
+    return rows
+
+
+def build_parallel(players_table, matchstat_dict, matches_chunks, statkeys, stat_slots, match_dates, match_formats,
+                   match_outcomes, workers, instrumentation=None, reject_row=None):
+    """
+    Adds the matches of matches_chunks to an empty matchstat_dict and players_table (see PlayersDB.add_stats_parallel).
+    Means are computed as sum / count instead of the running mean of calc_stat_update, so they can differ from the
+    serial build in the last digits.
+    instrumentation: Instrumentation of the build. 'parallel chunks' is the time spent waiting for the workers,
+    'parallel merge' the time spent merging their sums.
+    reject_row: function called with the record of every bad row (see partial_accumulators), e.g. PlayersDB.reject_row.
+    By default the build stops at the first bad row.
+    """
+    assert len(matchstat_dict) == 0, "The parallel build needs an empty match store."
+    if instrumentation is None:
+        instrumentation = Instrumentation()
+    players_before = len(players_table)
+
+    n_accumulators = 2 + 2 * len(statkeys)
+    accumulators = np.zeros((0, n_accumulators))
+    start_accumulators = np.zeros((0, n_accumulators))
+    start_rows = np.zeros((0, len(players_table.columns)))
+    series_length = np.zeros(0, dtype='q')
+    chunk_results = []
+
+    partials = iter_partial_accumulators(matches_chunks, statkeys, match_dates, match_formats, match_outcomes, workers)
+    while True:
+        with instrumentation.stage('parallel chunks'):
+            partial = next(partials, None)
+        if partial is None:
+            break
+        for record in partial['bad_rows']:
+            if reject_row is None:
+                sys.exit(f"{record['reason']} (row {record['row']})")
+            reject_row(record)
+
+        instrumentation.count('chunks')
+        instrumentation.count('rows', partial['n_rows'])
+        instrumentation.count('matches', len(partial['rows']))
+        instrumentation.count('skipped', partial['n_rows'] - len(partial['rows']))
+        with instrumentation.stage('parallel merge'):
+            accumulators, start_accumulators, start_rows, series_length = merge_partial(
+                players_table, stat_slots, partial, accumulators, start_accumulators, start_rows, series_length,
+                chunk_results)
+
+    instrumentation.count('new players', len(players_table) - players_before)
+    if not chunk_results:
+        return None
+
+    with instrumentation.stage('parallel merge'):
+        store_chunk_results(players_table, matchstat_dict, stat_slots, chunk_results, accumulators, start_accumulators,
+                            start_rows, series_length)
+
+    return None
+
+
+def merge_partial(players_table, stat_slots, partial, accumulators, start_accumulators, start_rows, series_length,
+                  chunk_results):
+    """
+    Adds the accumulators of one chunk to the accumulators of all earlier chunks, the prematch sums and snapshot offsets
+    of the matches of the chunk are appended to chunk_results
+    :return: accumulators, start_accumulators, start_rows, series_length (grown by the new players of the chunk)
+    """
+    n_accumulators = accumulators.shape[1]
+    global_ids = np.array([players_table.player_id(player) for player in partial['names']], dtype='q')
+
+    """
+    Players that are new to the accumulators start with their stats in players_table
+    """
+    if len(players_table) > len(accumulators):
+        new_rows = np.array([players_table.row(player_id) for player_id in range(len(accumulators), len(players_table))])
+        new_accumulators = np.zeros((len(new_rows), n_accumulators))
+        if players_table.matches_slot is not None:
+            new_accumulators[:, 0] = new_rows[:, players_table.matches_slot]
+        if players_table.wins_slot is not None:
+            new_accumulators[:, 1] = new_rows[:, players_table.wins_slot]
+        for statpos, slot in enumerate(stat_slots):
+            new_accumulators[:, 2 + 2 * statpos] = new_rows[:, slot] * new_rows[:, slot + 1]
+            new_accumulators[:, 3 + 2 * statpos] = new_rows[:, slot + 1]
+        accumulators = np.vstack([accumulators, new_accumulators])
+        start_accumulators = np.vstack([start_accumulators, new_accumulators])
+        start_rows = np.vstack([start_rows, new_rows])
+        series_length = np.concatenate([series_length, np.zeros(len(new_rows), dtype='q')])
+
+    player_ids = global_ids[partial['player_ids']]
+    chunk_results.append({'rows': partial['rows'], 'dates': partial['dates'], 'winner_side': partial['winner_side'],
+                          'player_ids': player_ids, 'postmatch': partial['postmatch'],
+                          'prematch': accumulators[player_ids] + partial['prefix'],
+                          'offsets': series_length[player_ids] + partial['rank']})
+
+    accumulators[global_ids] += partial['totals']
+    series_length[global_ids] += partial['totals'][:, 0].astype('q')
+
+    return accumulators, start_accumulators, start_rows, series_length
+
+
+def store_chunk_results(players_table, matchstat_dict, stat_slots, chunk_results, accumulators, start_accumulators,
+                        start_rows, series_length):
+    """
+    Stores the matches of all chunks in matchstat_dict and the final stats in players_table
+    """
+    player_ids = np.concatenate([result['player_ids'] for result in chunk_results])
+    offsets = np.concatenate([result['offsets'] for result in chunk_results])
+    prematch_rows = stat_rows(players_table, stat_slots, np.concatenate([result['prematch'] for result in chunk_results]),
+                              start_accumulators[player_ids], start_rows[player_ids])
+
+    """
+    Snapshot series: the prematch rows of every player in the order of their matches
+    """
+    order = np.lexsort((offsets, player_ids))
+    series_blocks = np.split(prematch_rows[order], np.cumsum(series_length)[:-1])
+    matchstat_dict.add_matches_bulk(np.concatenate([result['rows'] for result in chunk_results]), player_ids.reshape(-1, 2),
+                                    np.concatenate([result['winner_side'] for result in chunk_results]),
+                                    offsets.reshape(-1, 2), np.concatenate([result['postmatch'] for result in chunk_results]),
+                                    series_blocks, np.concatenate([result['dates'] for result in chunk_results]))
+
+    final_rows = stat_rows(players_table, stat_slots, accumulators, start_accumulators, start_rows)
+    for slot in range(len(players_table.columns)):
+        players_table.columns[slot] = to_array('d', np.ascontiguousarray(final_rows[:, slot]))
+
+    return None
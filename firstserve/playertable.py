@@ -0,0 +1,282 @@
+from array import array
+from collections.abc import Mapping
+from copy import deepcopy
+from .aggregators import build_aggregator
+from .ratings import build_rating
+
+
+"""
+Array-backed storage of the player stats.
+PlayerRegistry: interns player names to integer ids
+PlayerTable: one array per stored value of the players template, indexed by player id
+PlayersView: read-only dictionary view {'Players': {player: stats}, 'template': template} of a PlayerTable
+"""
+
+
+def template_layout(players_template):
+    """
+    :param players_template: template of the player stats, e.g. {'WinsTotal': 0., 'FirstServePCT': [0., 0], ...}
+    :return: list of (stat, types) with one python type per stored value.
+    Single values take one slot in the arrays, [mean, count] stats take two slots.
+    """
+    layout = []
+    for stat, value in players_template.items():
+        if isinstance(value, (list, tuple)):
+            layout.append((stat, tuple(type(entry) for entry in value)))
+        else:
+            layout.append((stat, (type(value),)))
+    return layout
+
+
+def count_offset(types):
+    """
+    :param types: types of the stored values of a stat, see template_layout
+    :return: offset of the count of the stat in its slots, None for stats without a count.
+    Stats with a count are the [mean, count] stats, the aggregators [mean, count], [mean, weight] and
+    [mean, variance, count] (see aggregators.py). A count of 0 means the player has no values of the stat yet.
+    Single values and the Glicko-2 [rating, deviation, volatility] have no count.
+    """
+    if len(types) > 1 and (types[-1] is int or len(types) == 2):
+        return len(types) - 1
+    return None
+
+
+def restore_value(value, value_type):
+    """
+    Values are stored as floats, counts are turned back into ints if the template stores them as ints.
+    """
+    if value_type is int and value.is_integer():
+        return int(value)
+    return float(value)
+
+
+def to_array(typecode, values):
+    """
+    Copies values (e.g. a read-only memory map loaded from the cache) into a growable array.array
+    """
+    if isinstance(values, array):
+        return values
+    values_array = array(typecode)
+    values_array.frombytes(memoryview(values).cast('B'))
+    return values_array
+
+
+def restore_stats(layout, values):
+    """
+    :param layout: see template_layout
+    :param values: sequence of stored values in the order of the layout slots
+    :return: dictionary in the format of the players template
+    """
+    player_stats = {}
+    slot = 0
+    for stat, types in layout:
+        if len(types) == 1:
+            player_stats[stat] = restore_value(values[slot], types[0])
+        else:
+            player_stats[stat] = [restore_value(values[slot + entry], types[entry]) for entry in range(len(types))]
+        slot += len(types)
+    return player_stats
+
+
+class PlayerRegistry:
+    def __init__(self):
+        """
+        Player names are compared once, when they are interned. Afterwards players are only handled by their id.
+        """
+        self.names = []
+        self.ids = {}
+
+    def intern(self, player):
+        player_id = self.ids.get(player)
+        if player_id is None:
+            player_id = len(self.names)
+            self.ids[player] = player_id
+            self.names.append(player)
+        return player_id
+
+    def __len__(self):
+        return len(self.names)
+
+
+class PlayerTable:
+    def __init__(self, players_template, registry=None, aggregator_settings=None, rating_settings=None):
+        """
+        :param players_template: template of the player stats, see PlayersDB.generate_players_template
+        :param registry: PlayerRegistry, e.g. shared with a MatchStore. A new registry is used by default.
+        :param aggregator_settings: 'aggregators' of players_settings, see aggregators.py. The aggregators are stats of
+        players_template, their hidden state is stored in columns after the stride columns of the template stats.
+        :param rating_settings: 'ratings' of players_settings, see ratings.py. Stored like the aggregators.
+        """
+        self.template = deepcopy(players_template)
+        self.layout = template_layout(self.template)
+        self.registry = PlayerRegistry() if registry is None else registry
+
+        self.initial_values = []
+        self.slots = {}
+        for stat, types in self.layout:
+            self.slots[stat] = len(self.initial_values)
+            value = self.template[stat]
+            self.initial_values.extend(value if len(types) > 1 else [value])
+        self.stride = len(self.initial_values)
+
+        self.aggregator_settings = deepcopy(aggregator_settings) if aggregator_settings else {}
+        self.aggregators = {}
+        self.hidden_slots = {}
+        for name, settings in self.aggregator_settings.items():
+            self.aggregators[name] = build_aggregator(settings)
+            self.hidden_slots[name] = len(self.initial_values)
+            self.initial_values.extend(self.aggregators[name].hidden_values())
+        self.rating_settings = deepcopy(rating_settings) if rating_settings else {}
+        self.ratings = {}
+        for name, settings in self.rating_settings.items():
+            self.ratings[name] = build_rating(settings)
+            self.hidden_slots[name] = len(self.initial_values)
+            self.initial_values.extend(self.ratings[name].hidden_values())
+        self.columns = [array('d') for _ in self.initial_values]
+
+        self.matches_slot = self.slots.get('Number of Matches')
+        self.wins_slot = self.slots.get('WinsTotal')
+        self.winrate_slot = self.slots.get('WinrateTotal')
+
+    @classmethod
+    def from_players_dict(cls, players_dict, registry=None, aggregator_settings=None, rating_settings=None):
+        """
+        New PlayerTable with the template and the players of a players dictionary (or PlayersView).
+        The hidden state of the aggregators and ratings is not part of a players dictionary, so windows and EWMAs start
+        again and Glicko-2 rating deviations do not grow for the time before the first new match.
+        """
+        table = cls(players_dict['template'], registry, aggregator_settings, rating_settings)
+        for player, player_stats in players_dict['Players'].items():
+            table.set_player_stats(player, player_stats)
+        return table
+
+    def __len__(self):
+        return len(self.columns[0]) if self.columns else 0
+
+    def make_writable(self):
+        """
+        Columns loaded from a cache are read-only memory maps, they are copied into arrays before the table is changed
+        """
+        self.columns = [to_array('d', column) for column in self.columns]
+        return None
+
+    def __contains__(self, player):
+        player_id = self.registry.ids.get(player)
+        return player_id is not None and player_id < len(self)
+
+    def player_id(self, player):
+        """
+        Returns the id of player. Unknown players are added with the values of the template (see add_new_player_to_db).
+        """
+        player_id = self.registry.intern(player)
+        while len(self) <= player_id:
+            for column, value in zip(self.columns, self.initial_values):
+                column.append(value)
+        return player_id
+
+    def set_player_stats(self, player, player_stats):
+        player_id = self.player_id(player)
+        for stat, types in self.layout:
+            slot = self.slots[stat]
+            values = player_stats[stat] if len(types) > 1 else [player_stats[stat]]
+            for entry, value in enumerate(values):
+                self.columns[slot + entry][player_id] = value
+        return player_id
+
+    def row(self, player_id):
+        """
+        All stored values of the template stats of a player, in the order of the layout slots
+        """
+        return [column[player_id] for column in self.columns[:self.stride]]
+
+    def player_stats(self, player_id):
+        return restore_stats(self.layout, self.row(player_id))
+
+    def incr_one_match(self, player_id, won):
+        """
+        Same as incr_one_match_to_db, for the player with player_id
+        """
+        if self.matches_slot is not None:
+            self.columns[self.matches_slot][player_id] += 1
+        if self.wins_slot is not None and won:
+            self.columns[self.wins_slot][player_id] += 1
+        if self.winrate_slot is not None:
+            self.columns[self.winrate_slot][player_id] = self.columns[self.wins_slot][player_id] / \
+                                                         self.columns[self.matches_slot][player_id]
+        return None
+
+    def calc_stat_update(self, player_id, slot, match_stat_curr):
+        """
+        Same as calc_stat_update, for the [mean, count] stat stored at slot, slot + 1
+        """
+        means, counts = self.columns[slot], self.columns[slot + 1]
+        match_count_last = counts[player_id]
+        if match_count_last == 0:
+            means[player_id] = match_stat_curr
+        else:
+            means[player_id] = (match_stat_curr + match_count_last * means[player_id]) / (1 + match_count_last)
+        counts[player_id] = match_count_last + 1
+        return None
+
+    def update_aggregator(self, player_id, name, match_stat_curr, day):
+        """
+        Updates the aggregator name (see aggregators.py) of a player with a new match value
+        """
+        self.aggregators[name].update(self.columns, player_id, self.slots[name], self.hidden_slots[name], match_stat_curr,
+                                      day)
+        return None
+
+    def update_ratings(self, winner_id, loser_id, day):
+        """
+        Updates all ratings (see ratings.py) of winner and loser of a match
+        """
+        for name, rating in self.ratings.items():
+            rating.update(self.columns, self.slots[name], self.hidden_slots[name], winner_id, loser_id, day)
+        return None
+
+    def players(self):
+        """
+        (player, player_id) of all players in the table, in the order they were added
+        """
+        return [(player, player_id) for player_id, player in enumerate(self.registry.names[:len(self)])]
+
+
+class PlayerStatsView(Mapping):
+    def __init__(self, table):
+        self.table = table
+
+    def __getitem__(self, player):
+        if player not in self.table:
+            raise KeyError(player)
+        return self.table.player_stats(self.table.registry.ids[player])
+
+    def __contains__(self, player):
+        return player in self.table
+
+    def __iter__(self):
+        return iter(self.table.registry.names[:len(self.table)])
+
+    def __len__(self):
+        return len(self.table)
+
+
+class PlayersView(Mapping):
+    def __init__(self, table):
+        """
+        Dictionary view in the format of PlayersDB.generate_players_template: {'Players': {...}, 'template': {...}}.
+        The stats of a player are returned as a new dictionary, changing it does not change the table.
+        """
+        self.table = table
+
+    def __getitem__(self, key):
+        if key == 'Players':
+            return PlayerStatsView(self.table)
+        elif key == 'template':
+            return self.table.template
+        raise KeyError(key)
+
+    def __iter__(self):
+        return iter(['Players', 'template'])
+
+    def __len__(self):
+        return 2
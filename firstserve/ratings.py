@@ -0,0 +1,165 @@
+from math import exp, log, pi, sqrt
+from .utils_extract_data import NO_DATE
+
+
+"""
+Online player ratings, updated once per match in the import loop (see PlayersDB.add_matches_chunk), declared in
+players_settings:
+
+'ratings': {'Elo': {'type': 'elo', 'k': 32},
+            'Glicko2': {'type': 'glicko2', 'tau': 0.5, 'rd_period_days': 30}}
+
+Like the aggregators of aggregators.py every rating is a stat of the players template, so the ratings of both players
+before a match are part of the prematch snapshots in the match store and no second pass over the matches is needed.
+Both players are updated from the ratings before the match. The ratings do not depend on the surface.
+State that is not part of the stats (the day of the last match for Glicko-2) is kept in hidden columns of the PlayerTable.
+"""
+
+"""
+Glicko-2 works on a scale of (rating - 1500) / GLICKO2_SCALE, see http://www.glicko.net/glicko/glicko2.pdf
+"""
+GLICKO2_SCALE = 173.7178
+GLICKO2_EPSILON = 1e-6
+
+
+class Elo:
+    def __init__(self, k=32., initial=1500., scale=400.):
+        """
+        Elo rating: the winner gains k * (1 - expected score), the loser loses the same.
+        scale: rating difference at which the stronger player is expected to win 10 of 11 matches
+        """
+        self.k = k
+        self.initial = initial
+        self.scale = scale
+
+    def template_value(self):
+        return float(self.initial)
+
+    def hidden_values(self):
+        return []
+
+    def update(self, columns, slot, hidden_slot, winner_id, loser_id, day):
+        ratings = columns[slot]
+        expected = 1. / (1. + 10. ** ((ratings[loser_id] - ratings[winner_id]) / self.scale))
+        change = self.k * (1. - expected)
+        ratings[winner_id] += change
+        ratings[loser_id] -= change
+        return None
+
+
+def glicko2_period(rating, rd, volatility, results, tau):
+    """
+    One rating period of Glicko-2 (steps 2 to 8 of Glickman's paper).
+    :param rating: rating of the player, e.g. 1500.
+    :param rd: rating deviation of the player, e.g. 350.
+    :param volatility: volatility of the player, e.g. 0.06
+    :param results: list of (rating, rd, score) of the opponents of the period, score 1. for a win and 0. for a loss
+    :param tau: constraint on the change of the volatility, e.g. 0.5
+    :return: rating, rd and volatility after the period
+    """
+    mu, phi = (rating - 1500.) / GLICKO2_SCALE, rd / GLICKO2_SCALE
+    if not results:
+        return rating, GLICKO2_SCALE * sqrt(phi * phi + volatility * volatility), volatility
+
+    inverse_variance, improvement = 0., 0.
+    for opponent_rating, opponent_rd, score in results:
+        opponent_phi = opponent_rd / GLICKO2_SCALE
+        g = 1. / sqrt(1. + 3. * opponent_phi * opponent_phi / (pi * pi))
+        expected = 1. / (1. + exp(-g * (mu - (opponent_rating - 1500.) / GLICKO2_SCALE)))
+        inverse_variance += g * g * expected * (1. - expected)
+        improvement += g * (score - expected)
+    variance = 1. / inverse_variance
+    delta = variance * improvement
+
+    """
+    New volatility: root of f by the Illinois algorithm (step 5)
+    """
+    a = log(volatility * volatility)
+
+    def f(x):
+        ex = exp(x)
+        return ex * (delta * delta - phi * phi - variance - ex) / (2. * (phi * phi + variance + ex) ** 2) - (x - a) / (tau * tau)
+
+    lower = a
+    if delta * delta > phi * phi + variance:
+        upper = log(delta * delta - phi * phi - variance)
+    else:
+        step = 1
+        while f(a - step * tau) < 0:
+            step += 1
+        upper = a - step * tau
+    f_lower, f_upper = f(lower), f(upper)
+    while abs(upper - lower) > GLICKO2_EPSILON:
+        new = lower + (lower - upper) * f_lower / (f_upper - f_lower)
+        f_new = f(new)
+        if f_new * f_upper <= 0:
+            lower, f_lower = upper, f_upper
+        else:
+            f_lower /= 2.
+        upper, f_upper = new, f_new
+    new_volatility = exp(lower / 2.)
+
+    phi_star = sqrt(phi * phi + new_volatility * new_volatility)
+    new_phi = 1. / sqrt(1. / (phi_star * phi_star) + inverse_variance)
+    new_mu = mu + new_phi * new_phi * improvement
+
+    return 1500. + GLICKO2_SCALE * new_mu, GLICKO2_SCALE * new_phi, new_volatility
+
+
+class Glicko2:
+    def __init__(self, tau=0.5, initial=1500., rd=350., volatility=0.06, rd_period_days=None):
+        """
+        Glicko-2 rating with every match as one rating period: [rating, rd, volatility].
+        rd_period_days: the rating deviation grows as for one period without matches every rd_period_days days without
+        a match (by the match dates, not for matches without a date). Not by default.
+        The rating deviation never exceeds the rd of new players.
+        """
+        self.tau = tau
+        self.initial = initial
+        self.rd = rd
+        self.volatility = volatility
+        self.rd_period_days = rd_period_days
+
+    def template_value(self):
+        return [float(self.initial), float(self.rd), float(self.volatility)]
+
+    def hidden_values(self):
+        """
+        Day of the last match
+        """
+        return [float(NO_DATE)]
+
+    def prematch_rd(self, rd, volatility, last_day, day):
+        if self.rd_period_days is None or day == NO_DATE or last_day == NO_DATE:
+            return rd
+        periods = max(day - last_day, 0.) / self.rd_period_days
+        return min(sqrt(rd * rd + periods * (GLICKO2_SCALE * volatility) ** 2), self.rd)
+
+    def update(self, columns, slot, hidden_slot, winner_id, loser_id, day):
+        ratings, rds, volatilities, last_days = columns[slot], columns[slot + 1], columns[slot + 2], columns[hidden_slot]
+        before = {player_id: (ratings[player_id],
+                              self.prematch_rd(rds[player_id], volatilities[player_id], last_days[player_id], day),
+                              volatilities[player_id])
+                  for player_id in [winner_id, loser_id]}
+
+        for player_id, opponent_id, score in [(winner_id, loser_id, 1.), (loser_id, winner_id, 0.)]:
+            rating, rd, volatility = before[player_id]
+            opponent_rating, opponent_rd, _ = before[opponent_id]
+            rating, rd, volatility = glicko2_period(rating, rd, volatility, [(opponent_rating, opponent_rd, score)], self.tau)
+            ratings[player_id], rds[player_id], volatilities[player_id] = rating, min(rd, self.rd), volatility
+            if day != NO_DATE:
+                last_days[player_id] = day
+        return None
+
+
+def build_rating(settings):
+    """
+    :param settings: settings of one rating, see above
+    :return: Elo or Glicko2
+    """
+    options = {option: value for option, value in settings.items() if option != 'type'}
+    if settings['type'] == 'elo':
+        return Elo(**options)
+    elif settings['type'] == 'glicko2':
+        return Glicko2(**options)
+    raise ValueError(f"Unknown rating type {settings['type']}, use 'elo' or 'glicko2'.")
@@ -0,0 +1,280 @@
+import argparse
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import json
+from urllib.error import HTTPError
+from urllib.parse import parse_qs, quote, unquote, urlencode, urlsplit
+from urllib.request import Request, urlopen
+from .firstserve import PlayersDB
+
+
+"""
+Local query service over a resident PlayersDB, so repeated analyses do not rebuild the database from the csv.
+The database is built (or loaded from the cache) once, then served over HTTP on localhost only:
+
+GET  /players/<player>?when=2015-06-01      stats of a player, before a match index or date with when (see PlayersDB.as_of)
+GET  /leaderboard?stat=WinrateTotal&k=10&min_matches=100     see PlayersDB.leaderboard
+GET  /matches/<matchidx>                    match in the format of the match dictionary, see PlayersDB.match
+GET  /head_to_head?a=<player>&b=<player>    see PlayersDB.head_to_head
+GET  /info                                  number of players and matches, hits of the response cache
+POST /append                                {'rows': [{'Name_1': ..., 'Result_CUR_1': ..., ...}, ...]}, see PlayersDB.append_matches
+
+Responses are JSON. GET responses are kept in an LRU cache, which is cleared by every append.
+Requests are handled one at a time, so appends and queries never overlap.
+
+    $ python -m firstserve.service --config configs/config_simpledb.yml --csv tennisdata/atp.csv --use-cache --port 8765
+
+QueryClient is the Python client of the service.
+"""
+
+LOCAL_HOSTS = {'127.0.0.1', 'localhost'}
+
+
+def required(params, *names):
+    """
+    :return: values of the query parameters names. Raises a ValueError if one is missing, so the request is answered
+    with 400 and not with 404 as for unknown players or matches.
+    """
+    missing = [name for name in names if name not in params]
+    if missing:
+        raise ValueError(f"Missing query parameter: {', '.join(missing)}")
+    return [params[name] for name in names]
+
+
+def to_json(value):
+    """
+    Encodes a response, numpy values (e.g. of the head-to-head index) are converted to python values
+    """
+    return json.dumps(value, default=lambda obj: obj.tolist()).encode()
+
+
+class ResponseCache:
+    def __init__(self, maxsize=1024):
+        """
+        LRU cache of encoded responses by request path
+        """
+        self.maxsize = maxsize
+        self.responses = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        response = self.responses.get(key)
+        if response is None:
+            self.misses += 1
+            return None
+        self.responses.move_to_end(key)
+        self.hits += 1
+        return response
+
+    def put(self, key, response):
+        self.responses[key] = response
+        self.responses.move_to_end(key)
+        while len(self.responses) > self.maxsize:
+            self.responses.popitem(last=False)
+        return None
+
+    def clear(self):
+        self.responses.clear()
+        return None
+
+    def info(self):
+        return {'size': len(self.responses), 'maxsize': self.maxsize, 'hits': self.hits, 'misses': self.misses}
+
+
+class QueryService:
+    def __init__(self, db, cache_size=1024):
+        """
+        :param db: PlayersDB with a built database (see PlayersDB.keep_database)
+        :param cache_size: number of responses kept in the LRU cache
+        """
+        assert db.matchstat_dict is not None, "No database built yet, see add_stats_from_csv."
+        self.db = db
+        self.cache = ResponseCache(cache_size)
+
+    def query(self, path, params):
+        """
+        :param path: parts of the request path, e.g. ['players', 'Federer R.']
+        :param params: query parameters, one value each
+        :return: result of the query. Raises a KeyError for unknown players / matches, a ValueError for bad or missing
+        parameters.
+        """
+        if len(path) == 2 and path[0] == 'players':
+            when = params.get('when')
+            if when is None:
+                return self.db.players_dict['Players'][path[1]]
+            return self.db.as_of(path[1], int(when) if when.lstrip('-').isdigit() else when)
+        elif path == ['leaderboard']:
+            stat, = required(params, 'stat')
+            return self.db.leaderboard(stat, int(params.get('k', 10)), int(params.get('min_matches', 0)))
+        elif len(path) == 2 and path[0] == 'matches':
+            return self.db.match(int(path[1]))
+        elif path == ['head_to_head']:
+            return self.db.head_to_head(*required(params, 'a', 'b'))
+        elif path == ['info']:
+            return {'players': len(self.db.players_dict['Players']), 'matches': self.db.match_count(),
+                    'cache': self.cache.info()}
+        raise KeyError('/'.join(path))
+
+    def get(self, target):
+        """
+        :param target: request path with the query string, e.g. '/leaderboard?stat=WinrateTotal'
+        :return: HTTP status and the encoded response
+        """
+        if target.startswith('/info'):
+            return self.respond(target)
+        response = self.cache.get(target)
+        if response is None:
+            response = self.respond(target)
+            if response[0] == 200:
+                self.cache.put(target, response)
+        return response
+
+    def respond(self, target):
+        url = urlsplit(target)
+        path = [unquote(part) for part in url.path.strip('/').split('/')]
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        try:
+            return 200, to_json(self.query(path, params))
+        except KeyError as error:
+            return 404, to_json({'error': f"Not found: {error}"})
+        except (ValueError, TypeError) as error:
+            return 400, to_json({'error': str(error)})
+
+    def append(self, rows):
+        """
+        :param rows: list of new matches, one dictionary per csv row
+        :return: HTTP status and the encoded response with the new numbers of players and matches
+        """
+        columns = {col for row in rows for col in row}
+        matches_dict = {col: {rowidx: row.get(col) for rowidx, row in enumerate(rows)} for col in columns}
+        matches_dict['ID'] = {rowidx: rowidx for rowidx in range(len(rows))}
+        try:
+            self.db.append_matches(self.db.players_dict, self.db.matchstat_dict, matches_dict)
+        except SystemExit as error:
+            """
+            A bad row with 'OnBadRows': 'exit' stops the append, not the service
+            """
+            return 400, to_json({'error': str(error)})
+        except KeyError as error:
+            """
+            Rows without a column of the import, e.g. 'Name_2', are rejected before any match is added
+            """
+            return 400, to_json({'error': f"Missing column: {error}"})
+        except (ValueError, TypeError) as error:
+            return 400, to_json({'error': str(error)})
+        finally:
+            self.cache.clear()
+
+        return 200, to_json({'players': len(self.db.players_dict['Players']), 'matches': self.db.match_count(),
+                             'quarantine': self.db.quarantined_rows()})
+
+
+class QueryRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.send(*self.server.service.get(self.path))
+
+    def do_POST(self):
+        if urlsplit(self.path).path.strip('/') != 'append':
+            self.send(404, to_json({'error': f"Not found: {self.path}"}))
+            return
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        self.send(*self.server.service.append(body.get('rows', [])))
+
+    def send(self, status, response):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+    def log_message(self, format, *args):
+        return None
+
+
+def serve(db, host='127.0.0.1', port=8765, cache_size=1024):
+    """
+    :param db: PlayersDB with a built database
+    :param host: localhost address to listen on, the service is not reachable from other machines
+    :param port: port, 0 for any free port (see server.server_address)
+    :param cache_size: number of responses kept in the LRU cache
+    :return: HTTPServer of the service, run it with serve_forever()
+    """
+    assert host in LOCAL_HOSTS, "The query service only listens on localhost."
+    server = HTTPServer((host, port), QueryRequestHandler)
+    server.service = QueryService(db, cache_size)
+    return server
+
+
+class QueryClient:
+    def __init__(self, host='127.0.0.1', port=8765, timeout=60.):
+        """
+        Python client of the query service, the results are returned as by the methods of PlayersDB
+        (tuples as lists, match indices as ints)
+        """
+        self.url = f'http://{host}:{port}'
+        self.timeout = timeout
+
+    def request(self, path, params=None, body=None):
+        url = self.url + path + (f'?{urlencode(params)}' if params else '')
+        request = Request(url, data=None if body is None else json.dumps(body).encode(),
+                          headers={'Content-Type': 'application/json'})
+        try:
+            with urlopen(request, timeout=self.timeout) as response:
+                return json.loads(response.read())
+        except HTTPError as error:
+            message = json.loads(error.read()).get('error', str(error))
+            if error.code == 404:
+                raise KeyError(message) from None
+            raise ValueError(message) from None
+
+    def player(self, player, when=None):
+        return self.request(f'/players/{quote(player, safe="")}', None if when is None else {'when': when})
+
+    def leaderboard(self, stat, k=10, min_matches=0):
+        return self.request('/leaderboard', {'stat': stat, 'k': k, 'min_matches': min_matches})
+
+    def match(self, matchidx):
+        return self.request(f'/matches/{matchidx}')
+
+    def head_to_head(self, player_a, player_b):
+        return self.request('/head_to_head', {'a': player_a, 'b': player_b})
+
+    def info(self):
+        return self.request('/info')
+
+    def append(self, matches_dict):
+        """
+        :param matches_dict: new matches in the format of import_csv
+        """
+        rows = [{col: values[rowidx] for col, values in matches_dict.items()} for rowidx in matches_dict['ID']]
+        return self.request('/append', body={'rows': rows})
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local query service over a firstserve database')
+    parser.add_argument('--config', required=True, help='config of PlayersDB, e.g. configs/config_simpledb.yml')
+    parser.add_argument('--csv', required=True, help='csv data, e.g. atp.csv')
+    parser.add_argument('--host', default='127.0.0.1', help='localhost address')
+    parser.add_argument('--port', type=int, default=8765, help='port')
+    parser.add_argument('--chunksize', type=int, default=50000, help='chunksize of add_stats_from_csv')
+    parser.add_argument('--workers', type=int, default=1, help='workers of add_stats_from_csv')
+    parser.add_argument('--use-cache', action='store_true', help='load / store the database in the cache of the config')
+    parser.add_argument('--cache-size', type=int, default=1024, help='number of responses kept in the LRU cache')
+    args = parser.parse_args()
+
+    db = PlayersDB(args.config)
+    db.add_stats_from_csv(db.generate_players_template(), args.csv, args.chunksize, args.use_cache, args.workers)
+    server = serve(db, args.host, args.port, args.cache_size)
+    print(f'Serving {db.match_count()} matches on http://{args.host}:{server.server_address[1]}', flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
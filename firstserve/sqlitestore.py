@@ -0,0 +1,335 @@
+import json
+import sqlite3
+from numbers import Integral
+from math import isnan
+from .matchstore import ascending_dates
+from .playertable import restore_stats
+from .utils_extract_data import NO_DATE, parse_match_dates
+
+
+"""
+Optional SQLite storage of a database (players and matches), declared at the top level of the config:
+
+sqlite: {path: './savedata/simpletest/firstserve.sqlite', batch_size: 10000, keep_matches: True}
+
+PlayersDB writes every match to the file during the import, in transactions of batch_size matches (executemany),
+and the stats of the players of every chunk. With keep_matches: False the matches are only stored in the file and not
+in the MatchStore in memory, so the full history does not have to fit in memory; it is read back with the streaming
+methods of SQLiteStore (iter_matches, iter_player_matches, iter_players). The queries of PlayersDB (as_of, head_to_head)
+read the matches of the players they need with player_history, prematch and head_to_head.
+
+Tables:
+players(player_id, name, <stored values of the players template>)
+matches(matchidx, date, player1, player2, winner_side)
+match_players(matchidx, side, player_id, date, won, <prematch values of the player>, <postmatch stats of the player>)
+with indexes on the player ids, the match indices and the dates. Missing dates and stat values are NULL.
+"""
+
+
+def quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def value_columns(layout):
+    """
+    :return: one column name per stored value of a layout (see template_layout), e.g. ['WinsTotal', 'FirstServePCT[0]', ...]
+    """
+    return [stat if len(types) == 1 else f'{stat}[{entry}]' for stat, types in layout for entry in range(len(types))]
+
+
+class SQLiteStore:
+    def __init__(self, path, layout, stat_names, batch_size=10000):
+        """
+        :param path: SQLite file, created if it does not exist. Tables of a different players template are replaced.
+        :param layout: layout of the players template, see template_layout
+        :param stat_names: match stats stored for both players, see MatchStore
+        :param batch_size: number of matches written in one transaction
+        """
+        self.path = path
+        self.layout = layout
+        self.stat_names = list(stat_names)
+        self.batch_size = batch_size
+        self.value_columns = value_columns(layout)
+
+        """
+        The connection is used by one thread at a time, but not always the one that opened it, e.g. the queries of the
+        query service (service.py) run in the thread of its server
+        """
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode = WAL')
+        self.connection.execute('PRAGMA synchronous = NORMAL')
+        self.create_tables()
+
+        """
+        Matches added since the last flush
+        """
+        self.match_rows = []
+        self.side_rows = []
+
+    def create_tables(self):
+        schema = json.dumps({'layout': [[stat, [value_type.__name__ for value_type in types]] for stat, types in self.layout],
+                             'stat_names': self.stat_names})
+        connection = self.connection
+        with connection:
+            connection.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+            stored_schema = connection.execute("SELECT value FROM meta WHERE key = 'schema'").fetchone()
+            if stored_schema is not None and stored_schema[0] != schema:
+                for table in ['players', 'matches', 'match_players']:
+                    connection.execute(f'DROP TABLE IF EXISTS {table}')
+            connection.execute("INSERT OR REPLACE INTO meta VALUES ('schema', ?)", (schema,))
+
+            values = ', '.join(f'{quote(column)} REAL' for column in self.value_columns)
+            prematch = ', '.join(f'{quote("pre " + column)} REAL' for column in self.value_columns)
+            postmatch = ''.join(f', {quote("post " + stat)} REAL' for stat in self.stat_names)
+            connection.execute(f'CREATE TABLE IF NOT EXISTS players (player_id INTEGER PRIMARY KEY, name TEXT UNIQUE NOT NULL, '
+                               f'{values})')
+            connection.execute('CREATE TABLE IF NOT EXISTS matches (matchidx INTEGER PRIMARY KEY, date INTEGER, '
+                               'player1 INTEGER NOT NULL, player2 INTEGER NOT NULL, winner_side INTEGER NOT NULL)')
+            connection.execute(f'CREATE TABLE IF NOT EXISTS match_players (matchidx INTEGER NOT NULL, side INTEGER NOT NULL, '
+                               f'player_id INTEGER NOT NULL, date INTEGER, won INTEGER NOT NULL, {prematch}{postmatch}, '
+                               f'PRIMARY KEY (matchidx, side)) WITHOUT ROWID')
+            connection.execute('CREATE INDEX IF NOT EXISTS matches_date ON matches (date)')
+            connection.execute('CREATE INDEX IF NOT EXISTS match_players_player ON match_players (player_id, matchidx)')
+            connection.execute('CREATE INDEX IF NOT EXISTS match_players_date ON match_players (date)')
+        return None
+
+    def reset(self):
+        """
+        Removes all players and matches, e.g. before a new build
+        """
+        self.match_rows, self.side_rows = [], []
+        with self.connection:
+            for table in ['players', 'matches', 'match_players']:
+                self.connection.execute(f'DELETE FROM {table}')
+        return None
+
+    def add_match(self, matchidx, player_ids, winner_side, prematch_rows, postmatch_values, date=NO_DATE):
+        """
+        Same parameters as MatchStore.add_match. The match is written with the next flush, at the latest after
+        batch_size matches.
+        """
+        date = None if date == NO_DATE else date
+        self.match_rows.append((matchidx, date, player_ids[0], player_ids[1], winner_side))
+        for side in [0, 1]:
+            self.side_rows.append((matchidx, side, player_ids[side], date, int(side == winner_side),
+                                   *prematch_rows[side], *postmatch_values[side]))
+        if len(self.match_rows) >= self.batch_size:
+            self.flush()
+        return None
+
+    def flush(self):
+        """
+        Writes the added matches in one transaction
+        """
+        if not self.match_rows:
+            return None
+        n_values = 5 + len(self.value_columns) + len(self.stat_names)
+        with self.connection:
+            self.connection.executemany('INSERT OR REPLACE INTO matches VALUES (?, ?, ?, ?, ?)', self.match_rows)
+            self.connection.executemany(f'INSERT OR REPLACE INTO match_players VALUES ({", ".join(["?"] * n_values)})',
+                                        self.side_rows)
+        self.match_rows, self.side_rows = [], []
+        return None
+
+    def write_players(self, players_table, player_ids=None):
+        """
+        Writes the current stats of the players with player_ids (all players by default) in one transaction
+        """
+        if player_ids is None:
+            player_ids = range(len(players_table))
+        names = players_table.registry.names
+        rows = [(player_id, names[player_id], *players_table.row(player_id)) for player_id in player_ids]
+        with self.connection:
+            self.connection.executemany(f'INSERT OR REPLACE INTO players VALUES '
+                                        f'({", ".join(["?"] * (2 + len(self.value_columns)))})', rows)
+        return None
+
+    def write_match_store(self, match_store):
+        """
+        Writes all matches of a MatchStore, e.g. of a parallel build or a database loaded from the cache
+        """
+        stride, series = match_store.stride, match_store.series
+        for matchpos in range(len(match_store)):
+            player_ids = [int(match_store.player1[matchpos]), int(match_store.player2[matchpos])]
+            offsets = [int(match_store.offset1[matchpos]), int(match_store.offset2[matchpos])]
+            self.add_match(int(match_store.matchidx[matchpos]), player_ids, int(match_store.winner_side[matchpos]),
+                           [[float(value) for value in series[player_id][offset * stride:(offset + 1) * stride]]
+                            for player_id, offset in zip(player_ids, offsets)],
+                           [[float(column[matchpos]) for column in match_store.postmatch1],
+                            [float(column[matchpos]) for column in match_store.postmatch2]],
+                           int(match_store.date[matchpos]))
+        self.flush()
+        return None
+
+    def delete_matches_from(self, matchidx):
+        """
+        Removes the matches with an index of at least matchidx, e.g. matches written after the last checkpoint
+        """
+        self.flush()
+        with self.connection:
+            self.connection.execute('DELETE FROM matches WHERE matchidx >= ?', (matchidx,))
+            self.connection.execute('DELETE FROM match_players WHERE matchidx >= ?', (matchidx,))
+        return None
+
+    def next_free_matchidx(self):
+        self.flush()
+        last_matchidx = self.connection.execute('SELECT MAX(matchidx) FROM matches').fetchone()[0]
+        return 0 if last_matchidx is None else last_matchidx + 1
+
+    def __len__(self):
+        self.flush()
+        return self.connection.execute('SELECT COUNT(*) FROM matches').fetchone()[0]
+
+    def iter_rows(self, query, parameters=()):
+        """
+        Streams the rows of a query, self.batch_size rows are held in memory at once
+        """
+        self.flush()
+        cursor = self.connection.execute(query, parameters)
+        while True:
+            rows = cursor.fetchmany(self.batch_size)
+            if not rows:
+                return
+            yield from rows
+
+    def range_filter(self, start, end):
+        """
+        :param start: first match index (int) or date (e.g. '2015-06-01'), None for no limit
+        :param end: match index or date before which the range ends, None for no limit
+        :return: SQL condition and its parameters
+        """
+        conditions, parameters = [], []
+        for when, operator in [(start, '>='), (end, '<')]:
+            if when is None:
+                continue
+            if isinstance(when, Integral):
+                conditions.append(f'mp.matchidx {operator} ?')
+                parameters.append(int(when))
+            else:
+                conditions.append(f'mp.date {operator} ?')
+                parameters.append(parse_match_dates([when])[0])
+        return ' AND '.join(conditions) or '1', parameters
+
+    def player_stats(self, values):
+        """
+        NaN values are stored as NULL by SQLite
+        """
+        return restore_stats(self.layout, [float('nan') if value is None else value for value in values])
+
+    def postmatch(self, values):
+        """
+        Match stats of one player, stats missing in the dataset (NULL) are left out like in MatchStore
+        """
+        return {stat: value for stat, value in zip(self.stat_names, values) if value is not None}
+
+    def player(self, player):
+        """
+        :return: stats of a player in the format of the players template. Raises a KeyError for unknown players.
+        """
+        self.flush()
+        row = self.connection.execute(f'SELECT {", ".join(map(quote, self.value_columns))} FROM players WHERE name = ?',
+                                      (player,)).fetchone()
+        if row is None:
+            raise KeyError(player)
+        return self.player_stats(row)
+
+    def iter_players(self):
+        """
+        :return: generator of (player, stats) in the order the players were added
+        """
+        for row in self.iter_rows(f'SELECT name, {", ".join(map(quote, self.value_columns))} FROM players '
+                                  f'ORDER BY player_id'):
+            yield row[0], self.player_stats(row[1:])
+
+    def iter_player_matches(self, player, start=None, end=None):
+        """
+        :param player: name of the player
+        :param start: first match index or date, see range_filter
+        :param end: match index or date before which the matches end
+        :return: generator of {'matchidx', 'date', 'won', 'prematch', 'postmatch'} of the matches of the player in order,
+        with the stats of the player before the match and their match stats. 'date' is None where it is missing.
+        """
+        self.flush()
+        player_id = self.connection.execute('SELECT player_id FROM players WHERE name = ?', (player,)).fetchone()
+        if player_id is None:
+            raise KeyError(player)
+        condition, parameters = self.range_filter(start, end)
+        stride = len(self.value_columns)
+        for row in self.iter_rows(f'SELECT * FROM match_players AS mp WHERE mp.player_id = ? AND {condition} '
+                                  f'ORDER BY mp.matchidx', [player_id[0]] + parameters):
+            yield {'matchidx': row[0], 'date': row[3], 'won': bool(row[4]), 'prematch': self.player_stats(row[5:5 + stride]),
+                   'postmatch': self.postmatch(row[5 + stride:])}
+
+    def player_history(self, player_id):
+        """
+        :return: match indices and dates of all matches of a player like MatchStore.player_history, and True if a match of
+        the player is dated before one of their earlier matches (see MatchStore.unordered_dates)
+        """
+        rows = list(self.iter_rows('SELECT matchidx, date FROM match_players WHERE player_id = ? ORDER BY matchidx',
+                                   (player_id,)))
+        history_matchidx = [matchidx for matchidx, _ in rows]
+        history_dates, unordered = ascending_dates([NO_DATE if date is None else date for _, date in rows])
+        return history_matchidx, history_dates.tolist(), unordered
+
+    def prematch(self, player_id, matchidx):
+        """
+        :return: stats of a player before the match with index matchidx, in the format of the players template.
+        Raises a KeyError if the player did not play the match.
+        """
+        self.flush()
+        row = self.connection.execute(f'SELECT {", ".join(quote("pre " + column) for column in self.value_columns)} '
+                                      f'FROM match_players WHERE matchidx = ? AND player_id = ?',
+                                      (matchidx, player_id)).fetchone()
+        if row is None:
+            raise KeyError(matchidx)
+        return self.player_stats(row)
+
+    def head_to_head(self, player_id_a, player_id_b):
+        """
+        :return: head-to-head record of both players in the format of HeadToHeadIndex.record, from their common matches
+        """
+        postmatch = ', '.join(f'{table}.{quote("post " + stat)}' for table in ['a', 'b'] for stat in self.stat_names)
+        rows = self.iter_rows(f'SELECT a.matchidx, a.won, {postmatch} FROM match_players AS a '
+                              f'JOIN match_players AS b ON b.matchidx = a.matchidx AND b.side != a.side '
+                              f'WHERE a.player_id = ? AND b.player_id = ? ORDER BY a.matchidx', (player_id_a, player_id_b))
+
+        n_stats = len(self.stat_names)
+        record = {'matches': [], 'wins': [0, 0], 'deltas': {}}
+        delta_sums, delta_counts = [0.] * n_stats, [0] * n_stats
+        for row in rows:
+            record['matches'].append(row[0])
+            record['wins'][0 if row[1] else 1] += 1
+            for statpos in range(n_stats):
+                value_a, value_b = row[2 + statpos], row[2 + n_stats + statpos]
+                if value_a is None or value_b is None or isnan(value_a - value_b):
+                    continue
+                delta_sums[statpos] += value_a - value_b
+                delta_counts[statpos] += 1
+        for stat, delta_sum, delta_count in zip(self.stat_names, delta_sums, delta_counts):
+            if delta_count:
+                record['deltas'][stat] = delta_sum / delta_count
+
+        return record
+
+    def iter_matches(self, start=None, end=None):
+        """
+        :param start: first match index or date, see range_filter
+        :param end: match index or date before which the matches end
+        :return: generator of (matchidx, match) in the order of the matches, match in the format of the MatchStore:
+        {'prematch': {player: stats}, 'postmatch': {player: stats}, 'winner': player}
+        """
+        condition, parameters = self.range_filter(start, end)
+        stride = len(self.value_columns)
+        rows = self.iter_rows(f'SELECT p.name, mp.* FROM match_players AS mp JOIN players AS p USING (player_id) '
+                              f'WHERE {condition} ORDER BY mp.matchidx, mp.side', parameters)
+        for row1, row2 in zip(rows, rows):
+            match = {'prematch': {}, 'postmatch': {}, 'winner': row1[0] if row1[5] else row2[0]}
+            for row in [row1, row2]:
+                match['prematch'][row[0]] = self.player_stats(row[6:6 + stride])
+                match['postmatch'][row[0]] = self.postmatch(row[6 + stride:])
+            yield row1[1], match
+
+    def close(self):
+        self.flush()
+        self.connection.close()
+        return None
@@ -0,0 +1,129 @@
+import random
+import numpy as np
+from pandas import DataFrame
+
+
+"""
+Seeded generator of synthetic match data in the format of atp.csv / wta.csv from
+https://www.kaggle.com/datasets/hwaitt/tennis-20112019, e.g. for tests and benchmarks without the dataset.
+
+Like in the dataset, the scoreline of the loser is the mirrored scoreline of the winner, character by character:
+'6-4 2-6 10-8' -> '8-01 6-2 4-6'. Tie-break deciders therefore show the leading-zero artifacts, retired matches show
+the mirrored marker ('.ter'), and a share of the stat values is missing (NaN).
+"""
+
+SYNTHETIC_STATKEYS = ['Serve1stPCT_', 'Serve1stWonPCT_', 'Serve2ndWonPCT_', 'ReceivingPointsWonPCT_']
+SYNTHETIC_SURFACES = ['Hard', 'Clay', 'Grass', 'Carpet']
+SYNTHETIC_TOURNAMENTS = {'Grand Slam': 4, 'Masters 1000': 9, 'ATP500': 13, 'ATP250': 40}
+
+"""
+(games of the winner, games of the loser) of a set, the last set can also be decided by a long tie-break set
+"""
+SET_SCORES = [(6, 0), (6, 1), (6, 2), (6, 3), (6, 4), (7, 5), (7, 6)]
+DECIDER_SCORES = [(10, 8), (10, 6), (12, 10)]
+
+
+def synthetic_scoreline(rnd, best_of, retired_share=0.):
+    """
+    :param rnd: random.Random
+    :param best_of: 3 or 5
+    :param retired_share: share of matches that end with a retirement of the loser
+    :return: scoreline relative to the winner, e.g. '6-4 3-6 7-6' or '6-4 2-1 ret.'
+    """
+    sets_to_win = best_of // 2 + 1
+    sets_lost = rnd.randrange(sets_to_win)
+    outcomes = [True] * (sets_to_win - 1) + [False] * sets_lost
+    rnd.shuffle(outcomes)
+    outcomes.append(True)
+
+    sets = []
+    for setnum, won in enumerate(outcomes):
+        decider = setnum == len(outcomes) - 1 and sets_lost == sets_to_win - 1
+        games = rnd.choice(SET_SCORES + (DECIDER_SCORES if decider else []))
+        sets.append(games if won else games[::-1])
+
+    if rnd.random() < retired_share:
+        cut = rnd.randrange(1, len(sets))
+        sets = sets[:cut] + [(rnd.randrange(1, 5), rnd.randrange(0, 4))]
+        return ' '.join(f'{games_w}-{games_l}' for games_w, games_l in sets) + ' ret.'
+
+    return ' '.join(f'{games_w}-{games_l}' for games_w, games_l in sets)
+
+
+def generate_matches_frame(n_matches, seed=0, n_players=1000, nan_share=0.05, bo5_share=0.1, retired_share=0.02,
+                           start_row=0, start_date='2011-01-03', players_seed=None):
+    """
+    :param n_matches: number of rows
+    :param seed: seed of the generator, the same seed gives the same rows
+    :param n_players: number of players, named 'Player 0', 'Player 1', ...
+    :param nan_share: share of missing stat values
+    :param bo5_share: share of best-of-five matches
+    :param retired_share: share of retired matches
+    :param start_row: 'ID' of the first row, e.g. for the rows of a second chunk
+    :param start_date: date of the first match, the matches are spread over about 60 matches per day
+    :param players_seed: seed of the player strengths, seed by default. Chunks of one dataset share the players_seed.
+    :return: DataFrame with the columns of atp.csv used by PlayersDB
+    """
+    rnd = random.Random(seed)
+    np_rnd = np.random.default_rng(seed)
+
+    """
+    Players with a low number play more matches, stronger players win more often
+    """
+    strength = np.random.default_rng(seed if players_seed is None else players_seed).normal(size=n_players)
+    appearance = 1. / (np.arange(n_players) + 10.)
+    player_pairs = np_rnd.choice(n_players, size=(n_matches, 2), p=appearance / appearance.sum())
+    player_pairs[:, 1] = np.where(player_pairs[:, 0] == player_pairs[:, 1], (player_pairs[:, 1] + 1) % n_players,
+                                  player_pairs[:, 1])
+    first_wins = np_rnd.random(n_matches) < 1. / (1. + np.exp(strength[player_pairs[:, 1]] - strength[player_pairs[:, 0]]))
+
+    tournaments = [(f'{level} {num}', level) for level, count in SYNTHETIC_TOURNAMENTS.items() for num in range(count)]
+    tournament_ids = np_rnd.integers(len(tournaments), size=n_matches)
+
+    results_1, results_2 = [], []
+    for matchnum in range(n_matches):
+        best_of = 5 if tournaments[tournament_ids[matchnum]][1] == 'Grand Slam' and rnd.random() < bo5_share * 4 else 3
+        scoreline = synthetic_scoreline(rnd, best_of, retired_share)
+        if first_wins[matchnum]:
+            results_1.append(scoreline)
+            results_2.append(scoreline[::-1])
+        else:
+            results_1.append(scoreline[::-1])
+            results_2.append(scoreline)
+
+    row_ids = np.arange(start_row, start_row + n_matches)
+    columns = {'ID': row_ids,
+               'Date': (np.datetime64(start_date, 'D') + row_ids // 60).astype(str),
+               'Tournament': [tournaments[tournament_id][0] for tournament_id in tournament_ids],
+               'Surface': np.asarray(SYNTHETIC_SURFACES, dtype=object)[np_rnd.integers(len(SYNTHETIC_SURFACES),
+                                                                                       size=n_matches)],
+               'Name_1': [f'Player {player}' for player in player_pairs[:, 0]],
+               'Name_2': [f'Player {player}' for player in player_pairs[:, 1]],
+               'Result_CUR_1': results_1, 'Result_CUR_2': results_2}
+
+    for statkey in SYNTHETIC_STATKEYS:
+        for playeridx in ['1', '2']:
+            values = np.clip(np_rnd.normal(0.6, 0.08, size=n_matches), 0., 1.).round(3)
+            values[np_rnd.random(n_matches) < nan_share] = np.nan
+            columns[statkey + playeridx] = values
+
+    return DataFrame(columns)
+
+
+def generate_matches(n_matches, seed=0, **kwargs):
+    """
+    Same as generate_matches_frame, as dictionary in the format of import_csv
+    """
+    return generate_matches_frame(n_matches, seed, **kwargs).to_dict()
+
+
+def write_synthetic_csv(file_path, n_matches, seed=0, chunksize=100000, **kwargs):
+    """
+    Writes n_matches synthetic rows to file_path, chunksize rows at a time, so large files do not have to fit in memory.
+    Every chunk has its own seed derived from seed, so the file only depends on seed and chunksize.
+    """
+    for start_row in range(0, n_matches, chunksize):
+        chunk = generate_matches_frame(min(chunksize, n_matches - start_row), seed=seed * 1000003 + start_row,
+                                       start_row=start_row, players_seed=seed, **kwargs)
+        chunk.to_csv(file_path, mode='w' if start_row == 0 else 'a', header=start_row == 0, index=False)
+    return None
@@ -1,8 +1,61 @@
+import csv
 from copy import deepcopy
-import yaml
-from pandas import read_csv
+from functools import lru_cache
+from itertools import islice
+from numbers import Real
+import re
+import numpy as np
 import sys
 
+"""
+pandas and yaml are only imported by the functions that need them (import_csv, the 'pandas' backend of
+iter_csv_chunks, open_cfg_asdict), so loading a cached database or reading the csv with the 'csv' backend
+does not import them.
+"""
+
+"""
+Codes used by parse_scoreline / parse_scorelines for matches without a winner index.
+SCORE_SKIPPED: the match is not imported, e.g. a walkover, a missing scoreline or a format / outcome that is not configured.
+SCORE_CONTRADICTION / SCORE_EQUAL_GAMES: the rows on which set_matchwinner and count_sets would stop the import.
+The build (PlayersDB.add_matches_chunk) handles these rows by 'OnBadRows', see SCORE_ERRORS below.
+SCORE_INVALID: the scoreline has a set that cannot be read as games, e.g. '6-' or 'abc'.
+"""
+SCORE_SKIPPED = -1
+SCORE_CONTRADICTION = -2
+SCORE_EQUAL_GAMES = -3
+SCORE_INVALID = -4
+
+"""
+Reasons for rows that cannot be imported, see find_bad_rows. Depending on 'OnBadRows' in the config the import stops
+with the reason, like earlier versions, or the row is stored with its reason in the quarantine of the build report.
+QUARANTINE_COLUMNS are the columns of the csv stored with a quarantined row.
+"""
+SCORE_ERRORS = {SCORE_EQUAL_GAMES: "Set result cannot have equal games by both players!",
+                SCORE_CONTRADICTION: "Contradictions between results relative to player 1 and results relative to player 2",
+                SCORE_INVALID: "Scoreline cannot be read"}
+MISSING_PLAYER = "Player name is missing"
+STAT_NOT_A_NUMBER = "Stat value is not a number"
+QUARANTINE_COLUMNS = ['Name_1', 'Name_2', 'Result_CUR_1', 'Result_CUR_2']
+
+"""
+Markers of retired and walkover matches, compared in lower case without dots. 
+The mirrored scorelines show them reversed as well, e.g. 'ret.' -> '.ter'.
+"""
+RETIREMENT_MARKERS = {'ret', 'retired', 'rtd', 'def', 'disq'}
+WALKOVER_MARKERS = {'w/o', 'wo', 'walkover'}
+SCORELINE_CACHE_SIZE = 1 << 16
+
+"""
+Match dates are stored as days since 1970-01-01. NO_DATE marks a missing or unreadable date.
+"""
+NO_DATE = -(1 << 63)
+
+"""
+Cells read as NaN by the 'csv' backend of iter_csv_chunks, the default NaN values of pandas.read_csv
+"""
+CSV_NA_VALUES = {'', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN', '<NA>', 'N/A',
+                 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null'}
+
 
 def incr_one_match_to_db(players_dict, player, outcome):
     """
@@ -224,6 +277,200 @@ def threesetsplayed(player1, player2, result_list):
     return sets_counted_dict
 
 
+def split_scoreline(result):
+    """
+    :param result: relative scoreline, e.g. '6-4 7-6(5)', '6-4 2-1 ret.' or its mirrored version '.ter 1-2 4-6'
+    :return: sets, marker, marker_forward
+    sets: list of set results without tie-break points, e.g. ['6-4', '7-6']
+    marker: 'retired', 'walkover' or None
+    marker_forward: True if the marker is written forward ('ret.'), False if it is mirrored ('.ter')
+    """
+    sets = []
+    marker, marker_forward = None, None
+    for token in result.split():
+        word = token.lower().strip('.')
+        for candidate, forward in [(word, True), (word[::-1], False)]:
+            if candidate in RETIREMENT_MARKERS:
+                marker, marker_forward = 'retired', forward
+                break
+            if candidate in WALKOVER_MARKERS:
+                marker, marker_forward = 'walkover', forward
+                break
+        else:
+            """
+            Tie-break points are dropped, also in mirrored form: '7-6(5)' -> '7-6' and ')5(6-7' -> '6-7'
+            """
+            sets.append(re.sub(r'\(\d*\)|\)\d*\(', '', token))
+
+    return sets, marker, marker_forward
+
+
+def count_sets_rel(sets):
+    """
+    :param sets: set results relative to one player, e.g. ['6-4', '2-6', '01-8']
+    :return: [sets won by the player, sets won by the opponent], equal_games, valid
+    The mirrored tie-break results are repaired like in twosets_check_leadingzeroes (two sets)
+    and threesets_check_leadingzeroes (first set of three or more sets).
+    """
+    setcount = [0, 0]
+    equal_games = False
+    for set_number, playedset in enumerate(sets):
+        games = playedset.split('-')
+        if len(games) < 2 or not (games[0].isdigit() and games[1].isdigit()):
+            return setcount, equal_games, False
+        for player in [0, 1]:
+            if len(sets) == 2 and len(games[player]) > 1 and games[player][0] == '0':
+                games[player] = games[player][::-1]
+            elif len(sets) > 2 and set_number == 0 and len(games[player]) > 1:
+                games[player] = games[player][::-1]
+        gamesint = [int(games[0]), int(games[1])]
+        if gamesint[0] > gamesint[1]:
+            setcount[0] += 1
+        elif gamesint[1] > gamesint[0]:
+            setcount[1] += 1
+        else:
+            equal_games = True
+    return setcount, equal_games, True
+
+
+@lru_cache(maxsize=SCORELINE_CACHE_SIZE)
+def parse_scoreline(result_1, result_2):
+    """
+    :param result_1: scoreline relative to 'Name_1', e.g. '6-4 2-6 10-8'
+    :param result_2: scoreline relative to 'Name_2', e.g. '8-01 6-2 4-6'
+    :return: winner_idx, sets_rel, match_format, outcome
+    winner_idx: 0 for 'Name_1', 1 for 'Name_2', or one of the SCORE_ codes
+    sets_rel: ((sets of 'Name_1', sets of 'Name_2') relative to 'Result_CUR_1', (...) relative to 'Result_CUR_2')
+    match_format: 'Bo3', 'Bo5' or None
+    outcome: 'completed', 'retired', 'walkover' or None
+
+    The data set only has a few thousand different scorelines, the results are cached on the pair of scorelines.
+    Completed matches give the same winners as decide_setsplayed and set_matchwinner, for two to five sets.
+    In a retired match the last set is not finished, so the sets do not tell the winner. The winner is the player
+    whose scoreline shows the retirement marker written forward: the other scoreline is the mirrored one.
+    """
+    if not (isinstance(result_1, str) and isinstance(result_2, str)):
+        return SCORE_SKIPPED, ((0, 0), (0, 0)), None, None
+
+    (sets_1, marker_1, forward_1), (sets_2, marker_2, forward_2) = split_scoreline(result_1), split_scoreline(result_2)
+
+    if 'walkover' in [marker_1, marker_2]:
+        return SCORE_SKIPPED, ((0, 0), (0, 0)), None, 'walkover'
+
+    setcount_1, equal_games_1, valid_1 = count_sets_rel(sets_1)
+    setcount_2, equal_games_2, valid_2 = count_sets_rel(sets_2)
+    """
+    Relative to 'Result_CUR_2' the sets of 'Name_2' come first
+    """
+    sets_rel = ((setcount_1[0], setcount_1[1]), (setcount_2[1], setcount_2[0]))
+
+    if not (valid_1 and valid_2):
+        return SCORE_INVALID, sets_rel, None, None
+
+    if 'retired' in [marker_1, marker_2]:
+        match_format = 'Bo5' if max(len(sets_1), len(sets_2)) > 3 else 'Bo3'
+        if marker_1 == 'retired' and forward_1 and not (marker_2 == 'retired' and forward_2):
+            return 0, sets_rel, match_format, 'retired'
+        elif marker_2 == 'retired' and forward_2 and not (marker_1 == 'retired' and forward_1):
+            return 1, sets_rel, match_format, 'retired'
+        return SCORE_SKIPPED, sets_rel, match_format, 'retired'
+
+    if len(sets_1) != len(sets_2) or not 2 <= len(sets_1) <= 5:
+        return SCORE_SKIPPED, sets_rel, None, 'completed'
+
+    """
+    Only Bo5 matches have more than three sets, so the format of these is known even if the scorelines are broken
+    """
+    error_format = 'Bo5' if len(sets_1) > 3 else None
+    if equal_games_1 or equal_games_2:
+        return SCORE_EQUAL_GAMES, sets_rel, error_format, 'completed'
+
+    if sets_rel[0][0] > sets_rel[0][1] and sets_rel[1][0] > sets_rel[1][1]:
+        winner_idx = 0
+    elif sets_rel[0][1] > sets_rel[0][0] and sets_rel[1][1] > sets_rel[1][0]:
+        winner_idx = 1
+    else:
+        return SCORE_CONTRADICTION, sets_rel, error_format, 'completed'
+
+    """
+    The winner of a Bo3 match has won two sets, the winner of a Bo5 match three. Other set counts are no known format.
+    """
+    match_format = {2: 'Bo3', 3: 'Bo5'}.get(sets_rel[0][winner_idx])
+    if match_format is None or len(sets_1) > {'Bo3': 3, 'Bo5': 5}[match_format]:
+        return SCORE_SKIPPED, sets_rel, None, 'completed'
+
+    return winner_idx, sets_rel, match_format, 'completed'
+
+
+def parse_scorelines(results_1, results_2, match_formats=None, outcomes=None):
+    """
+    Batch version of parse_scoreline for whole 'Result_CUR_1' / 'Result_CUR_2' columns.
+    :param results_1: sequence of scorelines relative to 'Name_1', e.g. ['6-4 6-2', '4-6 6-3 01-8']
+    :param results_2: sequence of scorelines relative to 'Name_2', e.g. ['2-6 4-6', '8-10 3-6 6-4']
+    :param match_formats: imported formats, e.g. ['Bo3']. Matches in other formats get SCORE_SKIPPED. All formats if None.
+    :param outcomes: imported outcomes, e.g. ['completed', 'retired']. Other matches get SCORE_SKIPPED. All outcomes if None.
+    :return: winner_idx, loser_idx, sets_rel
+    winner_idx / loser_idx: int arrays with 0 for 'Name_1' and 1 for 'Name_2'. Matches without a winner carry
+    one of the SCORE_ codes in both arrays.
+    sets_rel: int array of shape (n, 2, 2), sets_rel[match, scoreline, player] counts the sets won by
+    'Name_1' (player 0) and 'Name_2' (player 1), relative to 'Result_CUR_1' (scoreline 0) and 'Result_CUR_2' (scoreline 1).
+    Repeated pairs of scorelines are parsed once and then taken from the cache of parse_scoreline.
+    This replaces the pandas string pipeline of earlier versions (str.split(expand=True) per set), which only read
+    two or three plain sets and was slower: on 200k synthetic rows with about 7k different pairs of scorelines the
+    pipeline took 5.3s for the plain rows, this loop 0.41s with a cold cache.
+    """
+    results_1, results_2 = list(results_1), list(results_2)
+    assert len(results_1) == len(results_2), "Both relative scorelines are needed for every match."
+
+    winner_idx = np.empty(len(results_1), dtype=int)
+    sets_rel = np.zeros((len(results_1), 2, 2), dtype=int)
+
+    for matchpos, (result_1, result_2) in enumerate(zip(results_1, results_2)):
+        winner, sets_rel[matchpos], match_format, outcome = parse_scoreline(result_1, result_2)
+        """
+        Broken scorelines of a format that is not imported anyway do not stop the import
+        """
+        if (winner >= 0 or match_format is not None) and match_formats is not None and match_format not in match_formats:
+            winner = SCORE_SKIPPED
+        elif winner >= 0 and outcomes is not None and outcome not in outcomes:
+            winner = SCORE_SKIPPED
+        winner_idx[matchpos] = winner
+
+    loser_idx = np.where(winner_idx >= 0, 1 - winner_idx, winner_idx)
+
+    return winner_idx, loser_idx, sets_rel
+
+
+def find_bad_rows(winner_idx, names_1, names_2, stat_columns):
+    """
+    :param winner_idx: winner indices of the rows, see parse_scorelines
+    :param names_1: 'Name_1' of the rows
+    :param names_2: 'Name_2' of the rows
+    :param stat_columns: one list of stat values per stat column, e.g. 'Serve1stPCT_1', in the order of the rows
+    :return: {position of the row: reason} for the rows that cannot be imported: broken scorelines, and imported matches
+    with a missing player name or a stat value that is not a number. Missing stat values (NaN) are fine.
+    Columns of plain names and floats are checked in one pass, single rows are only looked at in other columns.
+    """
+    bad_rows = {int(matchpos): SCORE_ERRORS[int(winner_idx[matchpos])]
+                for matchpos in np.flatnonzero(winner_idx < SCORE_SKIPPED)}
+
+    for names in [names_1, names_2]:
+        if all(type(name) is str for name in names):
+            continue
+        for matchpos, name in enumerate(names):
+            if not isinstance(name, str) and winner_idx[matchpos] >= 0:
+                bad_rows.setdefault(matchpos, MISSING_PLAYER)
+
+    for column in stat_columns:
+        if all(type(value) is float for value in column):
+            continue
+        for matchpos, value in enumerate(column):
+            if (not isinstance(value, Real) or isinstance(value, bool)) and winner_idx[matchpos] >= 0:
+                bad_rows.setdefault(matchpos, STAT_NOT_A_NUMBER)
+
+    return dict(sorted(bad_rows.items()))
+
+
 def check_playerkey(player, keycheck, matches_dict, matchidx):
     """
     keycheck: 'Serve1stPCT_' or 'ReceivingPointsWonPCT_', etc.
@@ -252,7 +499,75 @@ def add_empty_match_to_db(name1, name2):
     return empty_match_stats
 
 
+def next_free_matchidx(matchstat_dict):
+    """
+    Matches are stored in ascending order, so the last key of matchstat_dict is the highest match index.
+    reversed() on a dictionary does not touch the other entries.
+    """
+    if not matchstat_dict:
+        return 0
+    return next(reversed(matchstat_dict)) + 1
+
+
+def parse_match_dates(dates):
+    """
+    :param dates: dates of the matches, e.g. the 'Date' column of the csv ('2011-01-02'), datetime objects or Timestamps
+    :return: list of days since 1970-01-01, NO_DATE where the date is missing or cannot be read
+    """
+    dates = [date if isinstance(date, str) or hasattr(date, 'year') else 'NaT' for date in dates]
+    try:
+        timestamps = np.array(dates, dtype='datetime64[D]')
+    except ValueError:
+        """
+        Not in ISO format (e.g. '02.01.2011' or with a time of day), parsed by pandas
+        """
+        from pandas import to_datetime
+        timestamps = to_datetime(dates, errors='coerce').values.astype('datetime64[D]')
+    return np.where(np.isnat(timestamps), NO_DATE, timestamps.astype('q')).tolist()
+
+
+def match_years(dates):
+    """
+    :param dates: dates of the matches, see parse_match_dates
+    :return: numpy array of the years of the matches, NO_DATE where the date is missing or cannot be read
+    """
+    days = np.array(parse_match_dates(dates), dtype='q')
+    years = days.astype('datetime64[D]').astype('datetime64[Y]').astype('q') + 1970
+    return np.where(days == NO_DATE, NO_DATE, years)
+
+
+def rows_in_filters(names_1, names_2, dates, players=None, years=None):
+    """
+    :param names_1: 'Name_1' of the rows
+    :param names_2: 'Name_2' of the rows
+    :param dates: dates of the rows, None if the dataset has no date column (then years is not applied)
+    :param players: set of players, a row is kept if one of its players is in players. All players if None.
+    :param years: set of years, a row is kept if its date is in one of the years (not if the date is missing).
+    All years if None.
+    :return: boolean numpy array, True for the rows to keep
+    """
+    keep = np.ones(len(names_1), dtype=bool)
+    if players is not None:
+        keep &= np.fromiter((name_1 in players or name_2 in players for name_1, name_2 in zip(names_1, names_2)),
+                            dtype=bool, count=len(names_1))
+    if years is not None and dates is not None:
+        keep &= np.isin(match_years(dates), list(years))
+    return keep
+
+
+def filter_frame(frame, players=None, years=None, date_column='Date'):
+    """
+    :return: the rows of a DataFrame read from the csv that pass rows_in_filters, with their row indices
+    """
+    if players is None and (years is None or date_column not in frame):
+        return frame
+    keep = rows_in_filters(frame['Name_1'].tolist(), frame['Name_2'].tolist(),
+                           frame[date_column].tolist() if date_column in frame else None, players, years)
+    return frame if keep.all() else frame[keep]
+
+
 def open_cfg_asdict(path_to_config):
+    import yaml
     with open(path_to_config, "r") as stream:
         try:
             cfg_dict = yaml.safe_load(stream)
@@ -261,6 +576,110 @@ def open_cfg_asdict(path_to_config):
             print(exc)
 
 
-def import_csv(file_path):
-    df = read_csv(file_path).to_dict()
+def import_csv(file_path, usecols=None, players=None, years=None, date_column='Date'):
+    """
+    :param file_path: path to the csv data, e.g. atp.csv or wta.csv
+    :param usecols: names of the columns to read, all columns by default
+    :param players: only the matches of these players, years: only the matches of these years, see rows_in_filters
+    :param date_column: column of the dates, for years
+    :return: dictionary of the columns, {col: {rowidx: value}}. Rows that are filtered out keep their row indices free.
+    """
+    from pandas import read_csv
+    usecols_filter = None if usecols is None else (lambda col: col in usecols)
+    df = filter_frame(read_csv(file_path, usecols=usecols_filter), players, years, date_column).to_dict()
     return df
+
+
+def typed_csv_column(values):
+    """
+    :param values: strings of one column, as read by the csv module
+    :return: list of ints if all values are integers, else list of floats if all values are numbers or NaN,
+    else the strings with NaN for the missing values - the types pandas.read_csv gives the column
+    """
+    try:
+        return [int(value) for value in values]
+    except ValueError:
+        pass
+    try:
+        return [float('nan') if value in CSV_NA_VALUES else float(value) for value in values]
+    except ValueError:
+        return [float('nan') if value in CSV_NA_VALUES else value for value in values]
+
+
+def iter_csv_rows_chunks(file_path, chunksize=50000, usecols=None, players=None, years=None, date_column='Date'):
+    """
+    pandas-free version of iter_csv_chunks, reading the csv with the csv module.
+    :param usecols: names of the columns to keep, all columns by default. The other columns are not converted.
+    The rows are filtered by players and years before any value is converted.
+    """
+    with open(file_path, newline='') as csv_file:
+        reader = csv.reader(csv_file)
+        header = next(reader)
+        positions = [pos for pos, col in enumerate(header) if usecols is None or col in usecols]
+        if years is not None and date_column not in header:
+            years = None
+        if players is not None or years is not None:
+            filter_positions = [header.index(col) if col in header else None for col in ['Name_1', 'Name_2', date_column]]
+
+        first_row = 0
+        while True:
+            rows = list(islice(reader, chunksize))
+            if not rows:
+                break
+            row_indices = range(first_row, first_row + len(rows))
+            first_row += len(rows)
+            if players is not None or years is not None:
+                names_1, names_2, dates = [[row[pos] if pos is not None and pos < len(row) else '' for row in rows]
+                                           for pos in filter_positions]
+                keep = rows_in_filters(names_1, names_2, dates, players, years)
+                if not keep.all():
+                    row_indices = [row_indices[pos] for pos in np.flatnonzero(keep).tolist()]
+                    rows = [row for row, keep_row in zip(rows, keep.tolist()) if keep_row]
+                    if not rows:
+                        continue
+            chunk = {}
+            for pos in positions:
+                values = [row[pos] if pos < len(row) else '' for row in rows]
+                chunk[header[pos]] = dict(zip(row_indices, typed_csv_column(values)))
+            yield chunk
+
+
+def iter_csv_chunks(file_path, chunksize=50000, backend='pandas', usecols=None, players=None, years=None,
+                    date_column='Date'):
+    """
+    :param file_path: path to the csv data, e.g. atp.csv or wta.csv
+    :param chunksize: number of rows held in memory at once
+    :param backend: 'pandas' (pandas.read_csv) or 'csv' (csv module, see iter_csv_rows_chunks, pandas is not imported)
+    :param usecols: names of the columns to read, all columns by default
+    :param players: only the matches of these players, years: only the matches of these years, see rows_in_filters
+    :param date_column: column of the dates, for years
+    :return: generator of dictionaries in the format of import_csv, each with at most chunksize rows.
+    The row indices continue over the chunks, so the chunks can be processed in order as if the whole file was imported.
+    Rows that are filtered out keep their row indices free, chunks without rows left are not returned.
+    """
+    if backend == 'csv':
+        yield from iter_csv_rows_chunks(file_path, chunksize, usecols, players, years, date_column)
+        return
+    elif backend != 'pandas':
+        raise ValueError(f"Unknown csv backend {backend}, use 'pandas' or 'csv'.")
+
+    from pandas import read_csv
+    usecols_filter = None if usecols is None else (lambda col: col in usecols)
+    for chunk in read_csv(file_path, chunksize=chunksize, usecols=usecols_filter):
+        chunk = filter_frame(chunk, players, years, date_column)
+        if len(chunk):
+            yield chunk.to_dict()
+
+
+def drop_rows_before(matches_dict, first_row):
+    """
+    :param matches_dict: dictionary of matches, see import_csv
+    :param first_row: index of the first row to keep, e.g. the cursor of a checkpoint
+    :return: matches_dict without the rows before first_row, None if no row is left
+    """
+    rows = [rowidx for rowidx in matches_dict['ID'] if rowidx >= first_row]
+    if not rows:
+        return None
+    if len(rows) == len(matches_dict['ID']):
+        return matches_dict
+    return {col: {rowidx: values[rowidx] for rowidx in rows} for col, values in matches_dict.items()}
@@ -18,7 +18,7 @@ setuptools.setup(
     description="Generation of a tennis database to perform statistical analysis on player performances and match outcome predictions.",
     long_description=long_description,
     url="https://github.com/iljabvh/firstserve",
-    packages=setuptools.find_packages(),
+    packages=setuptools.find_packages(exclude=['tests', 'tests.*']),
     install_requires=required,
     python_requires=">=3.8",
     include_package_data=True,
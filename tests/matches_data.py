@@ -0,0 +1,22 @@
+"""
+Test data shared by the test modules:
+- matches_table: six matches of three players in the format of atp.csv / wta.csv, with mirrored tie-break scorelines,
+  a Bo5 match and missing stat values
+"""
+
+matches_table = {
+    'ID': [0, 1, 2, 3, 4, 5],
+    'Date': ['2015-01-05', '2015-01-06', '2015-02-10', '2015-03-01', '2015-03-02', '2015-04-20'],
+    'Name_1': ['Federer R.', 'Nadal R.', 'Murray A.', 'Federer R.', 'Nadal R.', 'Murray A.'],
+    'Name_2': ['Nadal R.', 'Murray A.', 'Federer R.', 'Murray A.', 'Federer R.', 'Nadal R.'],
+    'Result_CUR_1': ['6-4 6-2', '8-01 2-6', '6-4 2-6 10-8', '6-3 4-6 6-2 6-7 6-4', '7-6 6-7 7-6', '4-6 6-0 6-3'],
+    'Result_CUR_2': ['2-6 4-6', '6-2 10-8', '8-01 6-2 4-6', '4-6 7-6 2-6 6-4 3-6', '6-7 7-6 6-7', '3-6 0-6 6-4'],
+    'Serve1stPCT_1': [0.61, 0.7, 0.55, 0.6, 0.66, float('nan')],
+    'Serve1stPCT_2': [0.58, 0.64, 0.62, 0.59, 0.63, 0.68],
+    'Serve1stWonPCT_1': [0.75, 0.71, 0.7, 0.73, 0.69, 0.72],
+    'Serve1stWonPCT_2': [0.7, 0.77, 0.74, 0.7, 0.76, 0.73],
+    'Serve2ndWonPCT_1': [0.55, 0.52, 0.5, 0.49, 0.53, 0.51],
+    'Serve2ndWonPCT_2': [0.51, 0.56, 0.54, 0.5, 0.52, float('nan')],
+    'ReceivingPointsWonPCT_1': [0.42, 0.38, 0.4, 0.41, 0.39, 0.4],
+    'ReceivingPointsWonPCT_2': [0.35, 0.43, 0.37, 0.36, 0.4, 0.42],
+}
@@ -0,0 +1,871 @@
+import datetime
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import unittest
+import numpy as np
+import yaml
+from pandas import DataFrame
+from firstserve.cache import dataset_cache_key
+from firstserve.firstserve import PlayersDB
+from firstserve.ratings import glicko2_period
+from firstserve.synthetic import generate_matches, generate_matches_frame
+from firstserve.utils_extract_data import import_csv, iter_csv_chunks, open_cfg_asdict
+from tests.matches_data import matches_table
+
+"""
+Testing the PlayersDB ingestion:
+- a small match table in the format of atp.csv / wta.csv (see matches_data.py) is written to a temporary csv file
+
+"""
+
+cfg_path = os.path.join(os.path.dirname(__file__), '..', 'configs', 'config_simpledb.yml')
+
+
+class TestPlayersDB(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.csv_path = os.path.join(self.tmpdir.name, 'test_matches.csv')
+        DataFrame(matches_table).to_csv(self.csv_path, index=False)
+        self.db = PlayersDB(cfg_path)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_chunked_csv_equals_dict_import(self):
+
+        """
+        reading the csv in chunks has to give the same players and matches as importing the whole csv at once
+        :return: comparison of both databases
+        """
+
+        players_dict, matchstat_dict = self.db.add_stats_from_rel_outcomes(self.db.generate_players_template(),
+                                                                          import_csv(self.csv_path))
+        players_chunked, matchstat_chunked = self.db.add_stats_from_csv(self.db.generate_players_template(),
+                                                                        self.csv_path, chunksize=4)
+
+        self.assertEqual(players_chunked, players_dict)
+        self.assertEqual(matchstat_chunked, matchstat_dict)
+        self.assertEqual(sorted(matchstat_dict.keys()), [0, 1, 2, 3, 4, 5])
+        self.assertEqual(matchstat_dict[2]['winner'], 'Murray A.')
+        self.assertEqual(players_dict['Players']['Federer R.']['Number of Matches'], 4)
+        self.assertEqual(matchstat_dict[2]['prematch']['Federer R.']['Number of Matches'], 1)
+        self.assertEqual(matchstat_dict[2]['prematch']['Federer R.']['FirstServePCT'], [0.61, 1])
+        self.assertEqual(matchstat_dict[5]['postmatch']['Murray A.'], {'FirstServeWonPCT': 0.72, 'SecondServeWonPCT': 0.51,
+                                                                       'RecPointsWonPCT': 0.4})
+
+    def test_append_matches_equals_full_build(self):
+
+        """
+        appending the second half of the matches to a database of the first half has to give the full database
+        :return: comparison of both databases
+        """
+
+        matches_dict = import_csv(self.csv_path)
+        first_half = {col: {rowidx: matches_dict[col][rowidx] for rowidx in range(3)} for col in matches_dict}
+        second_half = {col: {rowidx - 3: matches_dict[col][rowidx] for rowidx in range(3, 6)} for col in matches_dict}
+
+        players_dict, matchstat_dict = self.db.add_stats_from_rel_outcomes(self.db.generate_players_template(), matches_dict)
+        players_appended, matchstat_appended = self.db.add_stats_from_rel_outcomes(self.db.generate_players_template(),
+                                                                                  first_half)
+        self.db.append_matches(players_appended, matchstat_appended, second_half)
+
+        self.assertEqual(players_appended, players_dict)
+        self.assertEqual(matchstat_appended, matchstat_dict)
+
+        players_plain = {'Players': dict(players_dict['Players'].items()), 'template': players_dict['template']}
+        self.db.append_matches(players_plain, matchstat_appended, first_half)
+        self.assertEqual(players_plain['Players']['Federer R.']['Number of Matches'], 6)
+
+        """
+        a colliding matchidx_offset is rejected before any player or match is changed, also before a new player is added
+        """
+        players_before = {player: player_stats for player, player_stats in players_appended['Players'].items()}
+        matches_before = len(matchstat_appended)
+        second_half['Name_1'][0] = 'Djokovic N.'
+        with self.assertRaises(ValueError):
+            self.db.append_matches(players_appended, matchstat_appended, second_half, matchidx_offset=0)
+        self.assertEqual(dict(players_appended['Players'].items()), players_before)
+        self.assertEqual(len(matchstat_appended), matches_before)
+
+    def test_cache_warm_start(self):
+
+        """
+        the second build of the same csv is loaded from the cache and has to equal the first build
+        :return: comparison of both databases, also after appending matches to the cached database
+        """
+
+        self.db.config['save'] = self.db.config['load'] = os.path.join(self.tmpdir.name, 'savedata')
+
+        players_dict, matchstat_dict = self.db.add_stats_from_csv(self.db.generate_players_template(), self.csv_path,
+                                                                  use_cache=True)
+        self.assertEqual(len(os.listdir(os.path.join(self.tmpdir.name, 'savedata', 'cache'))), 1)
+
+        players_cached, matchstat_cached = self.db.add_stats_from_csv(self.db.generate_players_template(), self.csv_path,
+                                                                      use_cache=True)
+
+        self.assertEqual(players_cached, players_dict)
+        self.assertEqual(matchstat_cached, matchstat_dict)
+
+        matches_dict = import_csv(self.csv_path)
+        self.db.append_matches(players_dict, matchstat_dict, matches_dict)
+        self.db.append_matches(players_cached, matchstat_cached, matches_dict)
+
+        self.assertEqual(players_cached, players_dict)
+        self.assertEqual(matchstat_cached, matchstat_dict)
+
+    def test_cache_digest_and_pruning(self):
+
+        """
+        the csv is only hashed again after its size or modification time changed, and only the most recently used
+        'keep_caches' caches are kept
+        :return: cache keys and the number of caches
+        """
+
+        self.db.config['save'] = self.db.config['load'] = os.path.join(self.tmpdir.name, 'savedata')
+        self.db.config['keep_caches'] = 1
+        cache_root = os.path.join(self.tmpdir.name, 'savedata', 'cache')
+
+        key = dataset_cache_key(self.csv_path, self.db.config)
+        self.assertTrue(os.path.isfile(os.path.join(self.tmpdir.name, 'savedata', 'csv_digests.json')))
+
+        """
+        Same size and modification time: the stored digest is used, the content is not read
+        """
+        csv_stat = os.stat(self.csv_path)
+        with open(self.csv_path, 'r+') as csv_file:
+            csv_file.write('X')
+        os.utime(self.csv_path, ns=(csv_stat.st_atime_ns, csv_stat.st_mtime_ns))
+        self.assertEqual(dataset_cache_key(self.csv_path, self.db.config), key)
+        os.utime(self.csv_path, ns=(csv_stat.st_atime_ns, csv_stat.st_mtime_ns + 10 ** 9))
+        self.assertNotEqual(dataset_cache_key(self.csv_path, self.db.config), key)
+
+        DataFrame(matches_table).to_csv(self.csv_path, index=False)
+        self.db.add_stats_from_csv(self.db.generate_players_template(), self.csv_path, use_cache=True)
+        other_csv_path = os.path.join(self.tmpdir.name, 'other_matches.csv')
+        DataFrame(matches_table).iloc[:4].to_csv(other_csv_path, index=False)
+        self.db.add_stats_from_csv(self.db.generate_players_template(), other_csv_path, use_cache=True)
+
+        self.assertEqual(os.listdir(cache_root), [dataset_cache_key(other_csv_path, self.db.config)])
+
+        """
+        a build with the matches only in the SQLite file never gives the cache of a build with the matches in memory
+        """
+        sqlite_settings = {'path': os.path.join(self.tmpdir.name, 'firstserve.sqlite'), 'keep_matches': False}
+        self.assertNotEqual(dataset_cache_key(self.csv_path, dict(self.db.config, sqlite=sqlite_settings)),
+                            dataset_cache_key(self.csv_path, self.db.config))
+        db_file_only = self.db_with_config(sqlite=sqlite_settings)
+        db_file_only.add_stats_from_csv(db_file_only.generate_players_template(), self.csv_path, use_cache=True)
+        db_file_only.close()
+        db = self.db_with_config()
+        _, matchstat_dict = db.add_stats_from_csv(db.generate_players_template(), self.csv_path, use_cache=True)
+        self.assertEqual(len(matchstat_dict), 6)
+
+    def test_parallel_build_equals_serial_build(self):
+
+        """
+        the parallel build merges per-chunk sums, the stats have to equal the serial build up to rounding
+        :return: comparison of all player stats and prematch stats
+        """
+
+        players_dict, matchstat_dict = self.db.add_stats_from_csv(self.db.generate_players_template(), self.csv_path)
+        players_parallel, matchstat_parallel = self.db.add_stats_from_csv(self.db.generate_players_template(),
+                                                                          self.csv_path, chunksize=2, workers=2)
+
+        self.assertEqual(list(matchstat_parallel.keys()), list(matchstat_dict.keys()))
+        self.assertEqual(list(players_parallel['Players'].keys()), list(players_dict['Players'].keys()))
+        for player in players_dict['Players']:
+            self.assert_stats_almost_equal(players_parallel['Players'][player], players_dict['Players'][player])
+        for matchidx in matchstat_dict:
+            self.assertEqual(matchstat_parallel[matchidx]['winner'], matchstat_dict[matchidx]['winner'])
+            self.assertEqual(matchstat_parallel[matchidx]['postmatch'], matchstat_dict[matchidx]['postmatch'])
+            for player in matchstat_dict[matchidx]['prematch']:
+                self.assert_stats_almost_equal(matchstat_parallel[matchidx]['prematch'][player],
+                                               matchstat_dict[matchidx]['prematch'][player])
+
+    def test_as_of(self):
+
+        """
+        the stats of a player before a match index or date have to equal the prematch stats of the match,
+        for the serial build, the parallel build (time index built from the match arrays) and after appending matches
+        :return: comparison of the point-in-time queries with the match dictionary
+        """
+
+        players_dict, matchstat_dict = self.db.add_stats_from_csv(self.db.generate_players_template(), self.csv_path)
+        queries = [('Federer R.', 0), ('Federer R.', 2), ('Federer R.', '2015-03-01'), ('Murray A.', '2015-03-02'),
+                   ('Federer R.', '2016-01-01'), ('Nadal R.', 6)]
+        expected = [matchstat_dict[0]['prematch']['Federer R.'], matchstat_dict[2]['prematch']['Federer R.'],
+                    matchstat_dict[3]['prematch']['Federer R.'], matchstat_dict[5]['prematch']['Murray A.'],
+                    players_dict['Players']['Federer R.'], players_dict['Players']['Nadal R.']]
+
+        self.assertEqual([self.db.as_of(player, when) for player, when in queries], expected)
+        self.assertEqual(self.db.as_of_batch(queries), expected)
+        self.assertEqual(self.db.as_of('Federer R.', '2015-03-01')['Number of Matches'], 2)
+        with self.assertRaises(KeyError):
+            self.db.as_of('Djokovic N.', 3)
+
+        self.db.add_stats_from_csv(self.db.generate_players_template(), self.csv_path, chunksize=2, workers=2)
+        for (player, when), player_stats in zip(queries, expected):
+            self.assert_stats_almost_equal(self.db.as_of(player, when), player_stats)
+
+        self.db.append_matches(self.db.players_dict, self.db.matchstat_dict, import_csv(self.csv_path))
+        self.assertEqual(self.db.as_of('Federer R.', 8), self.db.matchstat_dict[8]['prematch']['Federer R.'])
+        self.assertEqual(self.db.as_of('Federer R.', 8)['Number of Matches'], 5)
+
+    def test_as_of_undated_rows(self):
+
+        """
+        a match without a date in the middle of the matches of a player counts at the date of the match before it,
+        date queries for matches that are not in the order of their dates raise a ValueError
+        :return: comparison of the point-in-time queries with the match dictionary
+        """
+
+        DataFrame(dict(matches_table, Date=['2015-01-05', '2015-01-06', None, '2015-03-01', '2015-03-02',
+                                            '2015-04-20'])).to_csv(self.csv_path, index=False)
+        self.db.import_years = None
+        for workers in [1, 2]:
+            players_dict, matchstat_dict = self.db.add_stats_from_csv(self.db.generate_players_template(), self.csv_path,
+                                                                      chunksize=2, workers=workers)
+            queries = [('Federer R.', '2015-01-01'), ('Federer R.', '2015-01-06'), ('Federer R.', '2015-03-01'),
+                       ('Murray A.', '2015-01-07')]
+            expected = [matchstat_dict[0]['prematch']['Federer R.'], matchstat_dict[3]['prematch']['Federer R.'],
+                        matchstat_dict[3]['prematch']['Federer R.'], matchstat_dict[3]['prematch']['Murray A.']]
+            for (player, when), player_stats in zip(queries, expected):
+                self.assert_stats_almost_equal(self.db.as_of(player, when), player_stats)
+            self.assertEqual(self.db.as_of_batch(queries), [self.db.as_of(player, when) for player, when in queries])
+
+        DataFrame(dict(matches_table, Date=['2015-01-05', '2015-01-06', '2015-02-10', '2015-01-01', '2015-03-02',
+                                            '2015-04-20'])).to_csv(self.csv_path, index=False)
+        self.db.add_stats_from_csv(self.db.generate_players_template(), self.csv_path)
+        with self.assertRaises(ValueError):
+            self.db.as_of('Federer R.', '2015-02-01')
+        with self.assertRaises(ValueError):
+            self.db.as_of_batch([('Murray A.', '2015-02-01')])
+        self.assertEqual(self.db.as_of('Federer R.', 3), self.db.matchstat_dict[3]['prematch']['Federer R.'])
+        self.assertEqual(self.db.as_of('Nadal R.', '2015-02-01'), self.db.matchstat_dict[4]['prematch']['Nadal R.'])
+
+    def test_head_to_head(self):
+
+        """
+        the head-to-head index built during the import and the index built from the match arrays (parallel build)
+        have to give the record of a pair from the match dictionary
+        :return: comparison of the head-to-head records and features
+        """
+
+        players_dict, matchstat_dict = self.db.add_stats_from_csv(self.db.generate_players_template(), self.csv_path)
+        record = self.db.head_to_head('Federer R.', 'Murray A.')
+
+        self.assertEqual(record['matches'], [2, 3])
+        self.assertEqual(record['wins'], [1, 1])
+        self.assertAlmostEqual(record['deltas']['FirstServePCT'], ((0.62 - 0.55) + (0.6 - 0.59)) / 2)
+        self.assertEqual(self.db.head_to_head('Murray A.', 'Federer R.')['wins'], [1, 1])
+        self.assertAlmostEqual(self.db.head_to_head('Murray A.', 'Federer R.')['deltas']['FirstServePCT'],
+                               -record['deltas']['FirstServePCT'])
+        self.assertAlmostEqual(self.db.head_to_head('Murray A.', 'Nadal R.')['deltas']['FirstServePCT'], 0.64 - 0.7)
+        self.assertEqual(self.db.head_to_head('Federer R.', 'Djokovic N.')['matches'], [])
+
+        pairs = [('Federer R.', 'Nadal R.'), ('Nadal R.', 'Federer R.'), ('Federer R.', 'Djokovic N.')]
+        feature_names, features = self.db.head_to_head_features(pairs)
+        self.assertEqual(feature_names[:4], ['H2H Matches', 'H2H Wins_1', 'H2H Wins_2', 'H2H FirstServePCT Delta'])
+        self.assertEqual(features[:, :3].tolist(), [[2., 1., 1.], [2., 1., 1.], [0., 0., 0.]])
+        self.assertAlmostEqual(features[0, 3], -features[1, 3])
+
+        self.db.add_stats_from_csv(self.db.generate_players_template(), self.csv_path, chunksize=2, workers=2)
+        self.assertEqual(self.db.head_to_head('Federer R.', 'Murray A.'), record)
+        _, features_parallel = self.db.head_to_head_features(pairs)
+        self.assertEqual(features_parallel.tolist()[:2], features.tolist()[:2])
+
+    def test_feature_matrix(self):
+
+        """
+        the feature matrix has to hold the prematch stat differences of the match dictionary, with NaN for players
+        without values, and the batches have to concatenate to the full matrix
+        :return: comparison of X and y with the match dictionary
+        """
+
+        players_dict, matchstat_dict = self.db.add_stats_from_csv(self.db.generate_players_template(), self.csv_path)
+        X, y = self.db.feature_matrix(order='canonical')
+
+        self.assertEqual(self.db.feature_names(), ['FirstServePCT', 'FirstServeWonPCT', 'SecondServeWonPCT',
+                                                   'RecPointsWonPCT'])
+        self.assertEqual(X.shape, (6, 4))
+        self.assertTrue(X.flags['C_CONTIGUOUS'])
+        self.assertTrue(np.isnan(X[0]).all())
+        self.assertEqual(y.tolist(), [int(sorted(match['prematch'])[0] == match['winner'])
+                                      for match in matchstat_dict.values()])
+
+        prematch = matchstat_dict[3]['prematch']
+        self.assertAlmostEqual(X[3, 0], prematch['Federer R.']['FirstServePCT'][0] - prematch['Murray A.']['FirstServePCT'][0])
+
+        X_random, y_random = self.db.feature_matrix(seed=1, dtype='float32')
+        self.assertEqual(X_random.dtype, 'float32')
+        swapped = (y_random != y)[:, None]
+        np.testing.assert_allclose(X_random, np.where(swapped, -X, X), rtol=1e-6)
+
+        batches = list(self.db.iter_feature_batches(batch_size=4, seed=1, dtype='float32'))
+        self.assertEqual(len(batches), 2)
+        np.testing.assert_array_equal(np.vstack([X_batch for X_batch, _ in batches]), X_random)
+        np.testing.assert_array_equal(np.concatenate([y_batch for _, y_batch in batches]), y_random)
+
+    def test_build_report(self):
+
+        """
+        the report of a build has to count the rows, matches and players, with stage timers and progress if switched on
+        :return: comparison of the report with the imported matches
+        """
+
+        self.db.add_stats_from_csv(self.db.generate_players_template(), self.csv_path, chunksize=4)
+        report = self.db.build_report()
+        self.assertEqual(report['build'], 'add_stats_from_csv')
+        self.assertEqual(report['counters'], {'chunks': 2, 'rows': 6, 'matches': 6, 'skipped': 0, 'new players': 3})
+        self.assertEqual(report['stages'], {})
+
+        progress_calls = []
+        self.db.instrument(progress=lambda matchidx, counters: progress_calls.append((matchidx, counters['rows'])),
+                           progress_every=2, profile=True)
+        players_dict, matchstat_dict = self.db.add_stats_from_rel_outcomes(self.db.generate_players_template(),
+                                                                          import_csv(self.csv_path))
+        self.db.append_matches(players_dict, matchstat_dict, import_csv(self.csv_path))
+        report = self.db.build_report()
+
+        self.assertEqual(progress_calls, [(0, 0), (2, 2), (4, 4), (6, 0), (8, 2), (10, 4)])
+        self.assertEqual(report['build'], 'append_matches')
+        self.assertEqual(report['counters']['new players'], 0)
+        self.assertEqual(report['stages']['snapshot copy']['calls'], 6)
+        self.assertEqual(report['stages']['parse scorelines']['calls'], 1)
+        self.assertGreater(report['profile'].total_calls, 0)
+
+        self.db.add_stats_from_csv(self.db.generate_players_template(), self.csv_path, chunksize=2, workers=2)
+        report = self.db.build_report()
+        self.assertEqual(report['counters']['matches'], 6)
+        self.assertEqual(report['stages']['parallel chunks']['calls'], 4)
+
+    def test_csv_backends(self):
+
+        """
+        the csv module backend has to read the same chunks as pandas, and loading the package must not import pandas
+        :return: comparison of the chunks of both backends
+        """
+
+        chunks_pandas = list(iter_csv_chunks(self.csv_path, chunksize=4, backend='pandas'))
+        chunks_csv = list(iter_csv_chunks(self.csv_path, chunksize=4, backend='csv'))
+
+        self.assertEqual(len(chunks_csv), 2)
+        for chunk_pandas, chunk_csv in zip(chunks_pandas, chunks_csv):
+            self.assertEqual(chunk_csv.keys(), chunk_pandas.keys())
+            for col in chunk_pandas:
+                self.assertEqual([repr(value) for value in chunk_csv[col].values()],
+                                 [repr(value) for value in chunk_pandas[col].values()])
+                self.assertEqual(list(chunk_csv[col].keys()), list(chunk_pandas[col].keys()))
+
+        columns = ['Name_1', 'Serve1stPCT_1']
+        self.assertEqual(list(next(iter_csv_chunks(self.csv_path, backend='csv', usecols=columns))), columns)
+        self.assertEqual(list(next(iter_csv_chunks(self.csv_path, backend='pandas', usecols=columns))), columns)
+
+        modules = subprocess.run([sys.executable, '-c', 'import sys, firstserve.firstserve; print(sorted(sys.modules))'],
+                                 capture_output=True, text=True, check=True,
+                                 cwd=os.path.join(os.path.dirname(__file__), '..')).stdout
+        self.assertNotIn("'pandas'", modules)
+
+    def test_csv_pushdown(self):
+
+        """
+        a build with 'Players' and 'Years' in the config has to equal the build of the matching rows only, with both csv
+        backends, and read only the columns of the import
+        :return: comparison of the filtered builds with the build of the filtered rows
+        """
+
+        csv_path = os.path.join(self.tmpdir.name, 'synthetic.csv')
+        matches_frame = generate_matches_frame(3000, seed=7, n_players=50, start_date='2012-12-10')
+        matches_frame['Comment'] = 'not imported'
+        matches_frame.to_csv(csv_path, index=False)
+
+        players = ['Player 3', 'Player 11']
+        selected = (matches_frame['Name_1'].isin(players) | matches_frame['Name_2'].isin(players)) & \
+            matches_frame['Date'].str.startswith('2013')
+        players_expected, matchstat_expected = self.db.add_stats_from_rel_outcomes(
+            self.db.generate_players_template(), matches_frame[selected].drop(columns=['Comment']).to_dict())
+        self.assertTrue(0 < len(matchstat_expected) < selected.sum() <= 3000)
+
+        self.db.import_players, self.db.import_years = set(players), {2013}
+        for backend in ['pandas', 'csv']:
+            self.db.csv_backend = backend
+            chunks = list(iter_csv_chunks(csv_path, 500, backend, **self.db.csv_options()))
+            self.assertEqual(sum(len(chunk['ID']) for chunk in chunks), selected.sum())
+            self.assertNotIn('Comment', chunks[0])
+            self.assertNotIn('Surface', chunks[0])
+
+            players_dict, matchstat_dict = self.db.add_stats_from_csv(self.db.generate_players_template(), csv_path,
+                                                                      chunksize=500)
+            self.assertEqual(players_dict, players_expected)
+            self.assertEqual(matchstat_dict, matchstat_expected)
+
+        matches_dict = import_csv(csv_path, **self.db.csv_options())
+        self.assertEqual(list(matches_dict['ID']), np.flatnonzero(selected.values).tolist())
+
+    def test_aggregators(self):
+
+        """
+        window, EWMA and variance aggregators have to give the values computed from the match values of a player,
+        also in the prematch snapshots and after appending matches to a cached database
+        :return: comparison of the aggregators with the values computed directly
+        """
+
+        db = self.db_with_config(players_settings={'aggregators': {
+            'FirstServePCT_Last2': {'type': 'window', 'stat': 'FirstServePCT', 'window': 2},
+            'FirstServePCT_EWMA': {'type': 'ewma', 'stat': 'FirstServePCT', 'halflife_matches': 1},
+            'FirstServePCT_Decayed': {'type': 'ewma', 'stat': 'FirstServePCT', 'halflife_days': 30},
+            'FirstServePCT_Var': {'type': 'variance', 'stat': 'FirstServePCT'}}})
+
+        players_dict, matchstat_dict = db.add_stats_from_csv(db.generate_players_template(), self.csv_path, use_cache=True,
+                                                             workers=2)
+        federer = players_dict['Players']['Federer R.']
+        values = [0.61, 0.62, 0.6, 0.63]
+
+        self.assertAlmostEqual(federer['FirstServePCT_Last2'][0], (0.6 + 0.63) / 2)
+        self.assertEqual(federer['FirstServePCT_Last2'][1], 2)
+        self.assertAlmostEqual(federer['FirstServePCT_Var'][0], federer['FirstServePCT'][0])
+        self.assertAlmostEqual(federer['FirstServePCT_Var'][1], statistics.variance(values))
+        self.assertEqual(federer['FirstServePCT_Var'][2], 4)
+        weights = [0.125, 0.25, 0.5, 1.]
+        self.assertAlmostEqual(federer['FirstServePCT_EWMA'][0], sum(w * v for w, v in zip(weights, values)) / sum(weights))
+        self.assertAlmostEqual(federer['FirstServePCT_EWMA'][1], sum(weights))
+
+        day_weights = [0.5 ** ((datetime.date(2015, 3, 2) - datetime.date.fromisoformat(day)).days / 30)
+                       for day in ['2015-01-05', '2015-02-10', '2015-03-01', '2015-03-02']]
+        self.assertAlmostEqual(federer['FirstServePCT_Decayed'][0],
+                               sum(w * v for w, v in zip(day_weights, values)) / sum(day_weights))
+
+        self.assertAlmostEqual(matchstat_dict[4]['prematch']['Federer R.']['FirstServePCT_Last2'][0], (0.62 + 0.6) / 2)
+        self.assertAlmostEqual(matchstat_dict[3]['prematch']['Federer R.']['FirstServePCT_Var'][1],
+                               statistics.variance(values[:2]))
+
+        players_cached, matchstat_cached = db.add_stats_from_csv(db.generate_players_template(), self.csv_path,
+                                                                 use_cache=True)
+        self.assertEqual(players_cached, players_dict)
+        db.append_matches(players_cached, matchstat_cached, import_csv(self.csv_path))
+        db.append_matches(players_dict, matchstat_dict, import_csv(self.csv_path))
+        self.assertEqual(players_cached, players_dict)
+        self.assertAlmostEqual(players_dict['Players']['Federer R.']['FirstServePCT_Last2'][0], (0.6 + 0.63) / 2)
+
+    def test_quarantine(self):
+
+        """
+        with 'OnBadRows': 'quarantine' bad rows have to be skipped with their reason, in the serial and the parallel build,
+        the other rows have to give the same database as without the bad rows. By default a bad row stops the import.
+        :return: comparison with the database of the good rows
+        """
+
+        bad_table = {col: values + values[:1] * 4 for col, values in matches_table.items()}
+        bad_table['ID'] = list(range(10))
+        bad_table['Result_CUR_1'][6], bad_table['Result_CUR_2'][6] = '6-4 6-2', '6-4 6-2'
+        bad_table['Result_CUR_1'][7], bad_table['Result_CUR_2'][7] = '6-', '-6'
+        bad_table['Name_2'][8] = float('nan')
+        bad_csv_path = os.path.join(self.tmpdir.name, 'bad_matches.csv')
+        DataFrame(bad_table).to_csv(bad_csv_path, index=False)
+
+        with self.assertRaises(SystemExit):
+            self.db.add_stats_from_csv(self.db.generate_players_template(), bad_csv_path)
+
+        matches_dict = import_csv(bad_csv_path)
+        good_rows = [0, 1, 2, 3, 4, 5, 9]
+        players_dict, matchstat_dict = self.db.add_stats_from_rel_outcomes(
+            self.db.generate_players_template(), {col: {rowidx: matches_dict[col][rowidx] for rowidx in good_rows}
+                                                  for col in matches_dict})
+
+        self.db.on_bad_rows = 'quarantine'
+        for workers in [1, 2]:
+            players_quarantine, matchstat_quarantine = self.db.add_stats_from_csv(self.db.generate_players_template(),
+                                                                                  bad_csv_path, chunksize=4, workers=workers)
+            self.assertEqual(sorted(matchstat_quarantine.keys()), good_rows)
+            for player in players_dict['Players']:
+                self.assert_stats_almost_equal(players_quarantine['Players'][player], players_dict['Players'][player])
+
+            quarantined = self.db.quarantined_rows()
+            self.assertEqual([record['row'] for record in quarantined], [6, 7, 8])
+            self.assertEqual([record['reason'] for record in quarantined],
+                             ["Contradictions between results relative to player 1 and results relative to player 2",
+                              "Scoreline cannot be read", "Player name is missing"])
+            self.assertEqual(quarantined[1]['Result_CUR_1'], '6-')
+            self.assertEqual(self.db.build_report()['counters']['quarantined'], 3)
+
+    def test_checkpoint_resume(self):
+
+        """
+        a build interrupted after a checkpoint has to resume from the checkpoint and give the same database
+        as an uninterrupted build
+        :return: comparison of both databases
+        """
+
+        self.db.config['save'] = os.path.join(self.tmpdir.name, 'savedata')
+        players_dict, matchstat_dict = self.db.add_stats_from_csv(self.db.generate_players_template(), self.csv_path,
+                                                                  chunksize=2)
+
+        add_matches_chunk = self.db.add_matches_chunk
+        chunks_added = []
+
+        def interrupted_chunk(players_table, matchstat_dict, matches_dict, matchidx_offset=0):
+            if len(chunks_added) == 2:
+                raise KeyboardInterrupt
+            chunks_added.append(list(matches_dict['ID']))
+            return add_matches_chunk(players_table, matchstat_dict, matches_dict, matchidx_offset)
+
+        self.db.add_matches_chunk = interrupted_chunk
+        with self.assertRaises(KeyboardInterrupt):
+            self.db.add_stats_from_csv(self.db.generate_players_template(), self.csv_path, chunksize=2, checkpoint_every=3)
+        self.db.add_matches_chunk = add_matches_chunk
+
+        players_resumed, matchstat_resumed = self.db.add_stats_from_csv(self.db.generate_players_template(), self.csv_path,
+                                                                        chunksize=2, checkpoint_every=3)
+        self.assertEqual(players_resumed, players_dict)
+        self.assertEqual(matchstat_resumed, matchstat_dict)
+        self.assertEqual(self.db.build_report()['counters']['resumed rows'], 4)
+        self.assertEqual(self.db.build_report()['counters']['rows'], 2)
+        self.assertEqual(os.listdir(os.path.join(self.tmpdir.name, 'savedata', 'checkpoints')), [])
+
+    def test_ratings(self):
+
+        """
+        Elo and Glicko-2 ratings have to be updated in the import loop like in a second pass over the matches,
+        the prematch ratings have to be in the match store and in the feature matrix
+        :return: comparison with the ratings computed from the winners of the matches
+        """
+
+        db = self.db_with_config(players_settings={'ratings': {'Elo': {'type': 'elo', 'k': 32},
+                                                               'Glicko2': {'type': 'glicko2', 'tau': 0.5}}})
+
+        players_dict, matchstat_dict = db.add_stats_from_csv(db.generate_players_template(), self.csv_path, use_cache=True,
+                                                             workers=2)
+
+        elo, glicko = {}, {}
+        for matchidx in matchstat_dict:
+            winner = matchstat_dict[matchidx]['winner']
+            loser = [player for player in matchstat_dict[matchidx]['prematch'] if player != winner][0]
+            for player in [winner, loser]:
+                self.assertAlmostEqual(matchstat_dict[matchidx]['prematch'][player]['Elo'], elo.get(player, 1500.))
+                self.assertEqual(matchstat_dict[matchidx]['prematch'][player]['Glicko2'],
+                                 list(glicko.get(player, (1500., 350., 0.06))))
+
+            change = 32 * (1. - 1. / (1. + 10. ** ((elo.get(loser, 1500.) - elo.get(winner, 1500.)) / 400.)))
+            elo[winner], elo[loser] = elo.get(winner, 1500.) + change, elo.get(loser, 1500.) - change
+            winner_before, loser_before = glicko.get(winner, (1500., 350., 0.06)), glicko.get(loser, (1500., 350., 0.06))
+            glicko[winner] = glicko2_period(*winner_before, [(loser_before[0], loser_before[1], 1.)], 0.5)
+            glicko[loser] = glicko2_period(*loser_before, [(winner_before[0], winner_before[1], 0.)], 0.5)
+
+        for player in elo:
+            self.assertAlmostEqual(players_dict['Players'][player]['Elo'], elo[player])
+            np.testing.assert_allclose(players_dict['Players'][player]['Glicko2'], glicko[player])
+        self.assertGreater(players_dict['Players']['Murray A.']['Elo'], players_dict['Players']['Nadal R.']['Elo'])
+
+        self.assertEqual(db.feature_names()[-2:], ['Elo', 'Glicko2'])
+        X, y = db.feature_matrix(order='canonical')
+        prematch = matchstat_dict[1]['prematch']
+        self.assertAlmostEqual(X[1, -2], prematch['Murray A.']['Elo'] - prematch['Nadal R.']['Elo'])
+
+        players_cached, matchstat_cached = db.add_stats_from_csv(db.generate_players_template(), self.csv_path,
+                                                                 use_cache=True)
+        self.assertEqual(players_cached, players_dict)
+        self.assertEqual(matchstat_cached, matchstat_dict)
+
+    def test_leaderboards(self):
+
+        """
+        the top-k queries of the leaderboard indexes have to return the players of a full scan, after the build,
+        after appending a few matches (players moved one by one) and for thresholds between the indexes
+        :return: comparison with the full scan
+        """
+
+        db = self.db_with_config(players_settings={'leaderboards': {'min_matches': [0, 5]}})
+
+        players_dict, matchstat_dict = db.add_stats_from_rel_outcomes(db.generate_players_template(),
+                                                                      generate_matches(3000, seed=5, n_players=300))
+
+        def assert_index_equals_scan():
+            leaderboards = db.leaderboards
+            for stat in players_dict['template']:
+                for min_matches in [0, 3, 5, 8]:
+                    leaders = db.leaderboard(stat, 10, min_matches)
+                    db.leaderboards = None
+                    self.assertEqual(leaders, db.leaderboard(stat, 10, min_matches))
+                    db.leaderboards = leaderboards
+
+        assert_index_equals_scan()
+        db.append_matches(players_dict, matchstat_dict, generate_matches(10, seed=6, n_players=300))
+        self.assertTrue(0 < len(db.leaderboards.changed) <= 20)
+        assert_index_equals_scan()
+        self.assertEqual(db.leaderboards.changed, set())
+
+        """
+        Players without values of a stat with a count in its last entry ([mean, variance, count]) are not ranked
+        """
+        db = self.db_with_config(players_settings={
+            'leaderboards': {'min_matches': [0]},
+            'aggregators': {'FirstServePCT_Var': {'type': 'variance', 'stat': 'FirstServePCT'}}})
+        matches_dict = import_csv(self.csv_path)
+        matches_dict['Serve1stPCT_1'][2] = matches_dict['Serve1stPCT_2'][1] = matches_dict['Serve1stPCT_2'][3] = float('nan')
+        players_dict, _ = db.add_stats_from_rel_outcomes(db.generate_players_template(), matches_dict)
+        self.assertEqual(players_dict['Players']['Murray A.']['FirstServePCT_Var'][2], 0)
+        for leaderboards in [db.leaderboards, None]:
+            db.leaderboards = leaderboards
+            self.assertEqual([player for player, _ in db.leaderboard('FirstServePCT_Var', 3)], ['Nadal R.', 'Federer R.'])
+
+    def test_sqlite_store(self):
+
+        """
+        the players and matches written to the SQLite file have to equal the database in memory, also when the matches
+        are only kept in the file and new matches are appended
+        :return: comparison of the SQLite file with the database
+        """
+
+        sqlite_settings = {'path': os.path.join(self.tmpdir.name, 'firstserve.sqlite'), 'batch_size': 4}
+        db = self.db_with_config(sqlite=sqlite_settings)
+
+        players_dict, matchstat_dict = db.add_stats_from_csv(db.generate_players_template(), self.csv_path, chunksize=4)
+        self.assertEqual(dict(db.sqlite.iter_matches()), matchstat_dict)
+        self.assertEqual(dict(db.sqlite.iter_players()), players_dict['Players'])
+        self.assertEqual(db.sqlite.player('Federer R.'), players_dict['Players']['Federer R.'])
+        self.assertEqual([matchidx for matchidx, _ in db.sqlite.iter_matches(2, 5)], [2, 3, 4])
+
+        federer_matches = list(db.sqlite.iter_player_matches('Federer R.', '2015-02-01', '2015-03-02'))
+        self.assertEqual([match['matchidx'] for match in federer_matches], [2, 3])
+        self.assertEqual(federer_matches[0]['prematch'], matchstat_dict[2]['prematch']['Federer R.'])
+        self.assertEqual(federer_matches[0]['postmatch'], matchstat_dict[2]['postmatch']['Federer R.'])
+        self.assertFalse(federer_matches[0]['won'])
+
+        db_file_only = self.db_with_config(sqlite=dict(sqlite_settings, keep_matches=False))
+
+        matches_dict = import_csv(self.csv_path)
+        first_half = {col: {rowidx: matches_dict[col][rowidx] for rowidx in range(3)} for col in matches_dict}
+        second_half = {col: {rowidx - 3: matches_dict[col][rowidx] for rowidx in range(3, 6)} for col in matches_dict}
+        players_file_only, matchstat_file_only = db_file_only.add_stats_from_rel_outcomes(
+            db_file_only.generate_players_template(), first_half)
+        db_file_only.append_matches(players_file_only, matchstat_file_only, second_half)
+
+        self.assertEqual(len(matchstat_file_only), 0)
+        self.assertEqual(players_file_only, players_dict)
+        self.assertEqual(dict(db_file_only.sqlite.iter_matches()), matchstat_dict)
+
+        """
+        queries of the match history are read from the file if the matches are not kept in memory
+        """
+        queries = [('Federer R.', 0), ('Federer R.', 3), ('Federer R.', '2015-03-01'), ('Nadal R.', '2015-01-01'),
+                   ('Nadal R.', 100), ('Murray A.', '2016-01-01')]
+        for player, when in queries:
+            self.assertEqual(db_file_only.as_of(player, when), db.as_of(player, when))
+        self.assertEqual(db_file_only.as_of_batch(queries), db.as_of_batch(queries))
+        with self.assertRaises(KeyError):
+            db_file_only.as_of('Unknown P.', 0)
+
+        record = db.head_to_head('Nadal R.', 'Federer R.')
+        record_file_only = db_file_only.head_to_head('Nadal R.', 'Federer R.')
+        self.assertTrue(record['matches'])
+        self.assertEqual(record_file_only['matches'], record['matches'])
+        self.assertEqual(record_file_only['wins'], record['wins'])
+        self.assertEqual(record_file_only['deltas'].keys(), record['deltas'].keys())
+        for stat, delta in record['deltas'].items():
+            self.assertAlmostEqual(record_file_only['deltas'][stat], delta)
+
+        pairs = [('Federer R.', 'Nadal R.'), ('Nadal R.', 'Federer R.'), ('Federer R.', 'Unknown P.')]
+        feature_names, features = db.head_to_head_features(pairs)
+        feature_names_file_only, features_file_only = db_file_only.head_to_head_features(pairs)
+        self.assertEqual(feature_names_file_only, feature_names)
+        np.testing.assert_allclose(features_file_only, features)
+
+        with self.assertRaises(ValueError) as raised:
+            db_file_only.feature_matrix()
+        self.assertIn('keep_matches', str(raised.exception))
+        with self.assertRaises(ValueError):
+            next(db_file_only.iter_feature_batches())
+
+        """
+        builds with use_cache are not cached when the matches are only kept in the file, so a second build does not
+        replace the matches in the file with the empty MatchStore of a cache
+        """
+        for _ in range(2):
+            db_file_only.add_stats_from_csv(db_file_only.generate_players_template(), self.csv_path, use_cache=True)
+            self.assertEqual(dict(db_file_only.sqlite.iter_matches()), matchstat_dict)
+            self.assertEqual(db_file_only.as_of('Federer R.', 3), db.as_of('Federer R.', 3))
+        self.assertNotIn('cache hits', db_file_only.build_report()['counters'])
+
+        db.sqlite.close()
+        db_file_only.sqlite.close()
+
+    def test_grouped_stats(self):
+
+        """
+        the stats of a player per surface, year and tournament level have to equal a build of only the matches of the
+        group, also when they are merged over some dimensions and after loading the database from the cache
+        :return: comparison of the grouped stats with the builds of the groups
+        """
+
+        group_settings = {'groups': {
+            'Surface': {'column': 'Surface'},
+            'Year': {'column': 'Date', 'by': 'year'},
+            'Level': {'column': 'Tournament', 'levels': ['Grand Slam', 'Masters 1000', 'ATP500', 'ATP250']}}}
+        db = self.db_with_config(players_settings=group_settings, generate={'Years': 'all'})
+
+        csv_path = os.path.join(self.tmpdir.name, 'synthetic.csv')
+        matches_frame = generate_matches_frame(4000, seed=8, n_players=40, start_date='2012-12-01')
+        matches_frame.to_csv(csv_path, index=False)
+        players_dict, _ = db.add_stats_from_csv(db.generate_players_template(), csv_path, chunksize=1000, use_cache=True)
+
+        player = 'Player 2'
+        involved = (matches_frame['Name_1'] == player) | (matches_frame['Name_2'] == player)
+        for values, selected in [({}, involved),
+                                 ({'Surface': 'Clay'}, matches_frame['Surface'] == 'Clay'),
+                                 ({'Surface': 'Hard', 'Year': 2013}, (matches_frame['Surface'] == 'Hard') &
+                                  matches_frame['Date'].str.startswith('2013')),
+                                 ({'Surface': 'Grass', 'Year': 2012, 'Level': 'ATP250'},
+                                  (matches_frame['Surface'] == 'Grass') & matches_frame['Date'].str.startswith('2012') &
+                                  matches_frame['Tournament'].str.startswith('ATP250'))]:
+            players_group, _ = self.db.add_stats_from_rel_outcomes(self.db.generate_players_template(),
+                                                                   matches_frame[involved & selected].to_dict())
+            self.assert_stats_almost_equal(db.grouped_stats(player, **values), players_group['Players'][player])
+
+        self.assertEqual(db.grouped_stats(player)['Number of Matches'], players_dict['Players'][player]['Number of Matches'])
+        self.assertEqual({group_values['Level'] for group_values, _ in db.group_stats.groups(player, Year=2013)},
+                         {'Grand Slam', 'Masters 1000', 'ATP500', 'ATP250'})
+        with self.assertRaises(KeyError):
+            db.grouped_stats(player, Year=2010)
+        with self.assertRaises(ValueError):
+            db.grouped_stats(player, Round='Final')
+
+        db_cached = self.db_with_config(players_settings=group_settings, generate={'Years': 'all'})
+        db_cached.add_stats_from_csv(db_cached.generate_players_template(), csv_path, chunksize=1000, use_cache=True)
+        self.assertEqual(db_cached.build_report()['counters']['cache hits'], 1)
+        self.assertEqual(db_cached.group_stats.groups(player), db.group_stats.groups(player))
+
+    def test_jsonl_export(self):
+
+        """
+        the matches and players exported to JSON Lines during the import have to equal the database, when read through
+        the offset index, without it, after an append and after a build resumed from a checkpoint
+        :return: comparison of the exported records with the database
+        """
+
+        self.db.config['save'] = os.path.join(self.tmpdir.name, 'savedata')
+        self.db.export_jsonl = True
+
+        def assert_export_equals(players_dict, matchstat_dict):
+            matches = self.db.jsonl_reader('matches')
+            self.assertEqual([record['matchidx'] for record in matches], list(matchstat_dict))
+            for matchidx in matchstat_dict:
+                record = matches.get(matchidx)
+                self.assertEqual({key: value for key, value in record.items() if key not in ['matchidx', 'date']},
+                                 matchstat_dict[matchidx])
+            players = self.db.jsonl_reader('players')
+            self.assertEqual({record['player']: record['stats'] for record in players}, dict(players_dict['Players']))
+            self.assertEqual(players.get('Nadal R.')['stats'], players_dict['Players']['Nadal R.'])
+            matches.close()
+            players.close()
+
+        matches_dict = import_csv(self.csv_path)
+        first_half = {col: {rowidx: matches_dict[col][rowidx] for rowidx in range(4)} for col in matches_dict}
+        second_half = {col: {rowidx - 4: matches_dict[col][rowidx] for rowidx in range(4, 6)} for col in matches_dict}
+        players_dict, matchstat_dict = self.db.add_stats_from_rel_outcomes(self.db.generate_players_template(), first_half)
+        assert_export_equals(players_dict, matchstat_dict)
+        players_before = len(players_dict['Players'])
+        self.db.append_matches(players_dict, matchstat_dict, second_half)
+        assert_export_equals(players_dict, matchstat_dict)
+
+        """
+        the append only adds the records of the players of its matches to players.jsonl
+        """
+        appended_players = set(second_half['Name_1'].values()) | set(second_half['Name_2'].values())
+        with self.db.jsonl_reader('players') as players:
+            self.assertEqual(len(players), players_before + len(appended_players))
+
+        matches = self.db.jsonl_reader('matches')
+        self.assertEqual(matches[2]['date'], '2015-02-10')
+        self.assertEqual(matches[-1]['matchidx'], 5)
+        with self.assertRaises(KeyError):
+            matches.get(6)
+        matches.close()
+
+        matches_path = self.db.jsonl_path('matches')
+        os.remove(str(matches_path) + '.offsets.npy')
+        matches_unindexed = self.db.jsonl_reader('matches')
+        self.assertEqual(len(matches_unindexed), 6)
+        self.assertEqual(matches_unindexed.get(3), matches_unindexed[3])
+        matches_unindexed.close()
+
+        add_matches_chunk = self.db.add_matches_chunk
+        chunks_added = []
+
+        def interrupted_chunk(players_table, matchstat_dict, matches_dict, matchidx_offset=0):
+            """
+            The last chunk is exported, but interrupted before its checkpoint
+            """
+            add_matches_chunk(players_table, matchstat_dict, matches_dict, matchidx_offset)
+            chunks_added.append(list(matches_dict['ID']))
+            if len(chunks_added) == 3:
+                raise KeyboardInterrupt
+
+        self.db.add_matches_chunk = interrupted_chunk
+        with self.assertRaises(KeyboardInterrupt):
+            self.db.add_stats_from_csv(self.db.generate_players_template(), self.csv_path, chunksize=2, checkpoint_every=2)
+        self.assertEqual(len(self.db.jsonl), 6)
+        self.db.add_matches_chunk = add_matches_chunk
+
+        db_resumed = PlayersDB(cfg_path)
+        db_resumed.config['save'] = self.db.config['save']
+        db_resumed.export_jsonl = True
+        self.db = db_resumed
+        players_resumed, matchstat_resumed = db_resumed.add_stats_from_csv(db_resumed.generate_players_template(),
+                                                                           self.csv_path, chunksize=2, checkpoint_every=2)
+        self.assertEqual(db_resumed.build_report()['counters']['resumed rows'], 4)
+        assert_export_equals(players_resumed, matchstat_resumed)
+        db_resumed.close()
+
+        """
+        a database loaded from the cache keeps the export of the build it was cached from
+        """
+        with PlayersDB(cfg_path) as db_cached:
+            db_cached.config['save'] = db_cached.config['load'] = self.db.config['save']
+            db_cached.export_jsonl = True
+            self.db = db_cached
+            players_cached, matchstat_cached = db_cached.add_stats_from_csv(db_cached.generate_players_template(),
+                                                                            self.csv_path, use_cache=True)
+            matches_written = os.stat(db_cached.jsonl_path('matches')).st_mtime_ns
+            players_cached, matchstat_cached = db_cached.add_stats_from_csv(db_cached.generate_players_template(),
+                                                                            self.csv_path, use_cache=True)
+            self.assertEqual(db_cached.build_report()['counters']['jsonl kept'], 1)
+            self.assertEqual(os.stat(db_cached.jsonl_path('matches')).st_mtime_ns, matches_written)
+            assert_export_equals(players_cached, matchstat_cached)
+
+            db_cached.append_matches(players_cached, matchstat_cached, second_half)
+            assert_export_equals(players_cached, matchstat_cached)
+        self.assertIsNone(db_cached.jsonl)
+
+    def db_with_config(self, players_settings=None, generate=None, **overrides):
+        """
+        PlayersDB of the test config with some settings changed, written to a config file in the temporary directory.
+        'save' and 'load' are in the temporary directory as well.
+        :param players_settings: entries of 'players_settings', e.g. {'ratings': {...}}
+        :param generate: entries of the 'generate' settings of the 'dataset_config', e.g. {'Years': 'all'}
+        :param overrides: top-level entries of the config, e.g. sqlite={...}
+        """
+        config = open_cfg_asdict(cfg_path)
+        config['players_settings'].update(players_settings or {})
+        config['dataset_config']['generate'].update(generate or {})
+        config['save'] = config['load'] = os.path.join(self.tmpdir.name, 'savedata')
+        config.update(overrides)
+        test_cfg_path = os.path.join(self.tmpdir.name, 'config_test.yml')
+        with open(test_cfg_path, 'w') as cfg_file:
+            yaml.safe_dump(config, cfg_file)
+        return PlayersDB(test_cfg_path)
+
+    def assert_stats_almost_equal(self, player_stats, player_stats_expected):
+        self.assertEqual(player_stats.keys(), player_stats_expected.keys())
+        for stat, value in player_stats_expected.items():
+            if isinstance(value, list):
+                self.assertAlmostEqual(player_stats[stat][0], value[0])
+                self.assertEqual(player_stats[stat][1], value[1])
+            else:
+                self.assertAlmostEqual(player_stats[stat], value)
+
+
+if __name__ == '__main__':
+    unittest.main()
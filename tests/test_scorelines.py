@@ -0,0 +1,75 @@
+import unittest
+from firstserve.utils_extract_data import (decide_setsplayed, set_matchwinner, parse_scoreline, parse_scorelines,
+                                           SCORE_SKIPPED, SCORE_EQUAL_GAMES, SCORE_INVALID)
+
+"""
+Testing scoreline parsing:
+- parse_scorelines has to reproduce decide_setsplayed / set_matchwinner for every match, including the mirrored tie-break results
+- Bo5, retired and walkover matches
+
+"""
+
+"""
+The data mirrors the scoreline of the loser character by character, e.g. '6-4 2-6 10-8' -> '8-01 6-2 4-6'
+"""
+winning_scorelines = ['6-4 6-2', '6-2 10-8', '6-4 2-6 10-8', '6-3 5-7 21-19', '7-6 6-7 7-6', '6-0 6-0']
+scorelines = ([(result, result[::-1]) for result in winning_scorelines] +
+              [(result[::-1], result) for result in winning_scorelines])
+
+
+class TestScorelines(unittest.TestCase):
+    def test_batch_matches_single_match_functions(self):
+
+        """
+        compare the winners of the batch parser with the single-match functions
+        :return: comparison of winner index and counted sets
+        """
+
+        winner_idx, loser_idx, sets_rel = parse_scorelines([s[0] for s in scorelines], [s[1] for s in scorelines])
+
+        for matchpos, (result_1, result_2) in enumerate(scorelines):
+            allsetsplayed_rel = decide_setsplayed([result_1.split(), result_2.split()], 'P1', 'P2')
+            winner, loser = set_matchwinner(allsetsplayed_rel, 'P1', 'P2')
+
+            self.assertEqual(['P1', 'P2'][winner_idx[matchpos]], winner)
+            self.assertEqual(['P1', 'P2'][loser_idx[matchpos]], loser)
+            for rel in [0, 1]:
+                self.assertEqual(list(sets_rel[matchpos, rel]), [allsetsplayed_rel[rel]['P1'], allsetsplayed_rel[rel]['P2']])
+
+    def test_unsupported_and_invalid(self):
+        winner_idx, _, _ = parse_scorelines(['6-4 6-4 3-6 6-4', '6-6 6-4', '6-x 6-4'], ['4-6 4-6 6-3 4-6', '6-6 4-6', 'x-6 4-6'],
+                                            match_formats=['Bo3'])
+
+        self.assertEqual(winner_idx[0], SCORE_SKIPPED)
+        self.assertEqual(winner_idx[1], SCORE_EQUAL_GAMES)
+        self.assertEqual(winner_idx[2], SCORE_INVALID)
+
+    def test_bo5_retired_walkover(self):
+
+        """
+        Bo5 matches are counted like Bo3 matches, the winner of a retired match shows the retirement marker written forward
+        :return: winner index, format and outcome of the parsed scorelines
+        """
+
+        winning_result = '6-3 4-6 6-7(5) 6-4 12-10'
+        self.assertEqual(parse_scoreline(winning_result[::-1], winning_result)[0], 1)
+        self.assertEqual(parse_scoreline(winning_result[::-1], winning_result)[2:], ('Bo5', 'completed'))
+
+        retired_result = '6-4 2-1 ret.'
+        self.assertEqual(parse_scoreline(retired_result, retired_result[::-1])[0], 0)
+        self.assertEqual(parse_scoreline(retired_result[::-1], retired_result)[2:], ('Bo3', 'retired'))
+        self.assertEqual(parse_scoreline('w/o', 'o/w')[3], 'walkover')
+
+        winner_idx, _, _ = parse_scorelines([retired_result, 'w/o'], [retired_result[::-1], 'o/w'], outcomes=['completed'])
+        self.assertEqual(list(winner_idx), [SCORE_SKIPPED, SCORE_SKIPPED])
+
+    def test_repeated_scorelines_are_cached(self):
+        parse_scoreline.cache_clear()
+        parse_scorelines(['6-4 6-2'] * 100, ['2-6 4-6'] * 100)
+
+        self.assertEqual(parse_scoreline.cache_info().misses, 1)
+        self.assertEqual(parse_scoreline.cache_info().hits, 99)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+import os
+import tempfile
+import threading
+import unittest
+from pandas import DataFrame
+from firstserve.firstserve import PlayersDB
+from firstserve.service import QueryClient, serve
+from firstserve.utils_extract_data import import_csv
+from tests.matches_data import matches_table
+
+"""
+Testing the local query service:
+- the client has to return the same results as the PlayersDB it is served from
+- repeated queries are answered from the LRU cache, appended matches clear it
+"""
+
+cfg_path = os.path.join(os.path.dirname(__file__), '..', 'configs', 'config_simpledb.yml')
+
+
+class TestQueryService(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.csv_path = os.path.join(self.tmpdir.name, 'test_matches.csv')
+        DataFrame(matches_table).to_csv(self.csv_path, index=False)
+
+        self.db = PlayersDB(cfg_path)
+        self.db.add_stats_from_csv(self.db.generate_players_template(), self.csv_path)
+        self.server = serve(self.db, port=0, cache_size=2)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.client = QueryClient(port=self.server.server_address[1])
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.tmpdir.cleanup()
+
+    def test_queries(self):
+        self.assertEqual(self.client.player('Federer R.'), self.db.players_dict['Players']['Federer R.'])
+        self.assertEqual(self.client.player('Federer R.', when='2015-03-01'), self.db.as_of('Federer R.', '2015-03-01'))
+        self.assertEqual(self.client.player('Federer R.', when=2), self.db.as_of('Federer R.', 2))
+        self.assertEqual(self.client.match(2), self.db.matchstat_dict[2])
+        self.assertEqual(self.client.head_to_head('Federer R.', 'Nadal R.'),
+                         self.db.head_to_head('Federer R.', 'Nadal R.'))
+        self.assertEqual(self.client.leaderboard('WinrateTotal', k=2),
+                         [list(entry) for entry in self.db.leaderboard('WinrateTotal', k=2)])
+        with self.assertRaises(KeyError):
+            self.client.player('Unknown P.')
+
+        hits = self.client.info()['cache']['hits']
+        self.client.match(3)
+        self.client.match(3)
+        self.assertEqual(self.client.info()['cache']['hits'], hits + 1)
+        self.assertLessEqual(self.client.info()['cache']['size'], 2)
+
+    def test_append(self):
+        federer_matches = self.client.player('Federer R.')['Number of Matches']
+        result = self.client.append(import_csv(self.csv_path))
+
+        self.assertEqual(result['matches'], 12)
+        self.assertEqual(self.client.info()['cache']['size'], 0)
+        self.assertEqual(self.client.player('Federer R.')['Number of Matches'], 2 * federer_matches)
+        self.assertEqual(self.client.match(8)['winner'], 'Murray A.')
+
+    def test_append_bad_rows(self):
+        matches_dict = import_csv(self.csv_path)
+        del matches_dict['Name_2']
+        with self.assertRaises(ValueError) as raised:
+            self.client.append(matches_dict)
+        self.assertIn('Name_2', str(raised.exception))
+        self.assertEqual(self.client.info()['matches'], 6)
+
+    def test_missing_parameters(self):
+        for path, params in [('/leaderboard', {'k': 2}), ('/head_to_head', {'a': 'Federer R.'})]:
+            with self.assertRaises(ValueError) as raised:
+                self.client.request(path, params)
+            self.assertIn('Missing query parameter', str(raised.exception))
+
+    def test_matches_file_only(self):
+        """
+        with 'keep_matches': False the matches are served from the SQLite file
+        """
+        db_file_only = PlayersDB(cfg_path)
+        db_file_only.sqlite_settings = {'path': os.path.join(self.tmpdir.name, 'firstserve.sqlite'), 'keep_matches': False}
+        db_file_only.keep_matches = False
+        db_file_only.add_stats_from_csv(db_file_only.generate_players_template(), self.csv_path)
+        server = serve(db_file_only, port=0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        client = QueryClient(port=server.server_address[1])
+        try:
+            self.assertEqual(client.match(2), self.client.match(2))
+            self.assertEqual(client.info()['matches'], 6)
+            with self.assertRaises(KeyError):
+                client.match(6)
+        finally:
+            server.shutdown()
+            server.server_close()
+            db_file_only.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
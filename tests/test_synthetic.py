@@ -0,0 +1,50 @@
+import os
+import tempfile
+import unittest
+from firstserve.firstserve import PlayersDB
+from firstserve.synthetic import generate_matches, generate_matches_frame, write_synthetic_csv, SYNTHETIC_STATKEYS
+from firstserve.utils_extract_data import import_csv
+
+"""
+Testing the synthetic data generator:
+- the same seed has to give the same rows, in one piece or written in chunks
+- the rows have to be importable by PlayersDB, with mirrored scorelines and missing stat values like in atp.csv
+"""
+
+cfg_path = os.path.join(os.path.dirname(__file__), '..', 'configs', 'config_simpledb.yml')
+
+
+class TestSynthetic(unittest.TestCase):
+    def test_seeded_rows(self):
+        frame = generate_matches_frame(500, seed=7)
+
+        self.assertTrue(frame.equals(generate_matches_frame(500, seed=7)))
+        self.assertFalse(frame.equals(generate_matches_frame(500, seed=8)))
+        for col in ['ID', 'Date', 'Name_1', 'Name_2', 'Result_CUR_1', 'Result_CUR_2'] + \
+                   [statkey + playeridx for statkey in SYNTHETIC_STATKEYS for playeridx in ['1', '2']]:
+            self.assertIn(col, frame.columns)
+
+        self.assertTrue((frame['Result_CUR_1'].str[::-1] == frame['Result_CUR_2']).all())
+        mirrored_tiebreaks = frame['Result_CUR_1'].str.contains('8-01') | frame['Result_CUR_2'].str.contains('8-01')
+        self.assertTrue(mirrored_tiebreaks.any())
+        self.assertTrue(frame['Serve1stPCT_1'].isna().any())
+
+    def test_import_synthetic_csv(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            csv_path = os.path.join(tmpdir, 'synthetic.csv')
+            write_synthetic_csv(csv_path, 1000, seed=3, chunksize=300)
+            matches_dict = import_csv(csv_path)
+
+            self.assertEqual(list(matches_dict['ID'].values()), list(range(1000)))
+
+            db = PlayersDB(cfg_path)
+            players_dict, matchstat_dict = db.add_stats_from_rel_outcomes(db.generate_players_template(), matches_dict)
+            self.assertGreater(len(matchstat_dict), 900)
+            self.assertEqual(sum(player_stats['Number of Matches'] for player_stats in players_dict['Players'].values()),
+                             2 * len(matchstat_dict))
+
+        self.assertEqual(generate_matches(10, seed=3)['Name_1'], generate_matches_frame(10, seed=3)['Name_1'].to_dict())
+
+
+if __name__ == '__main__':
+    unittest.main()